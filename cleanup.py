@@ -5,6 +5,7 @@ Directories to be cleaned up recursively:
 - .gradio/
 - .vscode/
 - data/
+- conversation/data/ (semantic memory indexes)
 - logs/
 - __pycache__/
 
@@ -55,6 +56,7 @@ if __name__ == "__main__":
         "logs",
         "__pycache__",
         "conversation/__pycache__",
+        "conversation/data",
     ]
 
     for directory in recursive_directories:
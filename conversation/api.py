@@ -0,0 +1,295 @@
+"""
+Minimal HTTP API around ConversationManager, for load testing and headless clients.
+
+Runs the same turn pipeline as the Streamlit app (new_app.py), one
+ConversationManager per session, on a threaded standard-library server:
+
+    POST   /sessions              {"user_name", "user_age", "user_problem"} -> {"session_id", "response"}
+                                  Logs in an existing user or registers a new one;
+                                  "face_session_id" names the deepface session uploading
+                                  the user's camera frames, "profile": true profiles the
+                                  session's turns.
+    POST   /sessions/<id>/turns   {"text"} -> {"response"}, or a raw audio body
+                                  (Content-Type audio/*) -> {"response", "transcription"}
+                                  Add ?tts=1 to also synthesize the response, as the app does.
+    DELETE /sessions/<id>         Saves the session and ends it. Sessions without a request for
+                                  API_SESSION_TTL_SECONDS (default 1800, 0 keeps them) are
+                                  saved and ended the same way.
+
+    python api.py                 # serves on API_PORT (default 8000)
+
+    GET    /metrics, /metrics.json   Stage latencies, as on the metrics server (METRICS_PORT).
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from dotenv import load_dotenv
+
+import profiling
+import tracing
+from conversation_workflow import get_mental_health_workflow, load_semantic_memory
+from db import DB, User
+from logger import Logger
+from speech_to_text import transcribe_audio
+from text_to_speech import text_to_speech
+
+load_dotenv()
+
+API_PORT = int(os.getenv("API_PORT", "8000"))
+# Largest accepted request body (audio uploads)
+API_MAX_BODY_BYTES = 20 * 1024 * 1024
+# Idle sessions are saved and ended after this many seconds; 0 disables eviction
+API_SESSION_TTL_SECONDS = float(os.getenv("API_SESSION_TTL_SECONDS", "1800"))
+
+TURNS_PATH = re.compile(r"^/sessions/([0-9a-f]+)/turns$")
+SESSION_PATH = re.compile(r"^/sessions/([0-9a-f]+)$")
+
+logger = Logger()
+_sessions = {}  # session_id -> (ConversationManager, lock serializing its turns)
+_last_used = {}  # session_id -> time.monotonic() of its last request
+_sessions_lock = threading.Lock()
+
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def start_session(user_name, user_age=None, user_problem=None, face_session_id=None, profile=False):
+    """Log in or register the user and start a conversation; returns (session_id, greeting)."""
+    if not user_name:
+        raise APIError(400, "user_name is required")
+    db = DB()
+    with tracing.turn("login"):
+        with tracing.span("db.get_user_by_name"):
+            user = db.get_user_by_name(user_name)
+        is_new_user = user is None
+        if is_new_user:
+            user = User(user_name, user_age, user_problem)
+            with tracing.span("db.init_user"):
+                if not db.init_user(user):
+                    raise APIError(500, f"Cannot register {user_name}")
+        manager = get_mental_health_workflow(
+            user_name=user.user_name,
+            user_age=user.user_age,
+            user_problem=user.user_problem,
+            is_new_user=is_new_user,
+            user_id=str(user.user_id),
+            face_session_id=face_session_id
+        )
+    if profile:
+        manager.profiling = True
+    with _sessions_lock:
+        _sessions[manager.session_id] = (manager, threading.Lock())
+        _last_used[manager.session_id] = time.monotonic()
+    return manager.session_id, manager.last_response
+
+
+@contextmanager
+def _locked_session(session_id):
+    """Yield the session's manager with its lock held; 404 if it is unknown or ended meanwhile."""
+    with _sessions_lock:
+        entry = _sessions.get(session_id)
+        if entry is not None:
+            _last_used[session_id] = time.monotonic()
+    if entry is None:
+        raise APIError(404, f"Unknown session {session_id}")
+    manager, lock = entry
+    with lock:
+        with _sessions_lock:
+            ended = _sessions.get(session_id) is not entry
+        if ended:
+            raise APIError(404, f"Unknown session {session_id}")
+        try:
+            yield manager
+        finally:
+            # Idle time counts from the end of the last request, not its start
+            with _sessions_lock:
+                if session_id in _last_used:
+                    _last_used[session_id] = time.monotonic()
+
+
+def _close_session(session_id, manager):
+    """Save and end a session; the caller holds its lock. Returns False if saving failed."""
+    if not manager.sync_session():
+        return False
+    manager.close()
+    with _sessions_lock:
+        _sessions.pop(session_id, None)
+        _last_used.pop(session_id, None)
+    return True
+
+
+def text_turn(session_id, text, tts=False):
+    if not text:
+        raise APIError(400, "text is required")
+    with _locked_session(session_id) as manager, tracing.turn("text_turn", session_id=session_id), \
+            profiling.profile("text_turn", manager.profiling):
+        response = manager.process_input(user_input=text, input_type="text")
+        if tts:
+            with tracing.span("tts.synthesize"):
+                text_to_speech(response)
+    return {"response": response}
+
+
+def audio_turn(session_id, audio, tts=False):
+    if not audio:
+        raise APIError(400, "audio body is empty")
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+        f.write(audio)
+        path = f.name
+    try:
+        with _locked_session(session_id) as manager, tracing.turn("audio_turn", session_id=session_id), \
+                profiling.profile("audio_turn", manager.profiling):
+            with tracing.span("asr.transcribe"):
+                transcription = transcribe_audio(path, model_name="base")
+            response = manager.process_input(user_input=transcription, input_type="audio", audio_path=path)
+            if tts:
+                with tracing.span("tts.synthesize"):
+                    text_to_speech(response)
+    finally:
+        os.remove(path)
+    return {"response": response, "transcription": transcription}
+
+
+def end_session(session_id):
+    with _locked_session(session_id) as manager:
+        if not _close_session(session_id, manager):
+            raise APIError(500, "Failed to save the session")
+
+
+def evict_idle_sessions(ttl=API_SESSION_TTL_SECONDS):
+    """Save and end every session without a request for ttl seconds; returns how many were ended."""
+    now = time.monotonic()
+    with _sessions_lock:
+        idle = [(session_id, _sessions[session_id]) for session_id, used in _last_used.items()
+                if now - used > ttl]
+    evicted = 0
+    for session_id, entry in idle:
+        manager, lock = entry
+        with lock:
+            with _sessions_lock:
+                # A request may have used or ended the session since it was listed
+                if _sessions.get(session_id) is not entry or time.monotonic() - _last_used[session_id] <= ttl:
+                    continue
+            if _close_session(session_id, manager):
+                evicted += 1
+            else:
+                logger.log_error(f"Failed to save idle session {session_id}, keeping it")
+    if evicted:
+        logger.log(f"Ended {evicted} idle API sessions")
+    return evicted
+
+
+def _evict_idle_sessions_forever(ttl):
+    while True:
+        time.sleep(max(1.0, min(60.0, ttl / 4)))
+        try:
+            evict_idle_sessions(ttl)
+        except Exception as e:
+            logger.log_error(f"Idle session eviction failed: {e}")
+
+
+class _APIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def do_DELETE(self):
+        self._handle(self._delete)
+
+    def _handle(self, route):
+        self._body_read = False
+        try:
+            status, payload = route(urlparse(self.path))
+        except APIError as e:
+            status, payload = e.status, {"error": str(e)}
+        except Exception as e:
+            logger.log_error(f"API request {self.command} {self.path} failed: {e}")
+            status, payload = 500, {"error": str(e)}
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = b"" if payload is None else json.dumps(payload).encode(), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if not self._body_read and self.headers.get("Content-Length", "0") != "0":
+            # An error left the request body unread, so the next request cannot be found on this connection
+            self.close_connection = True
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > API_MAX_BODY_BYTES:
+            raise APIError(413, "Request body too large")
+        self._body_read = True
+        return self.rfile.read(length)
+
+    def _json(self):
+        try:
+            return json.loads(self._body() or b"{}")
+        except ValueError:
+            raise APIError(400, "Invalid JSON body")
+
+    def _get(self, url):
+        if url.path == "/metrics":
+            return 200, tracing.render_prometheus()
+        if url.path == "/metrics.json":
+            return 200, tracing.snapshot()
+        raise APIError(404, "Not found")
+
+    def _post(self, url):
+        if url.path == "/sessions":
+            data = self._json()
+            session_id, greeting = start_session(data.get("user_name"), data.get("user_age"),
+                                                 data.get("user_problem"), data.get("face_session_id"),
+                                                 bool(data.get("profile")))
+            return 201, {"session_id": session_id, "response": greeting}
+        match = TURNS_PATH.match(url.path)
+        if match is None:
+            raise APIError(404, "Not found")
+        tts = parse_qs(url.query).get("tts") == ["1"]
+        if self.headers.get("Content-Type", "").startswith("audio/"):
+            return 200, audio_turn(match.group(1), self._body(), tts)
+        return 200, text_turn(match.group(1), self._json().get("text"), tts)
+
+    def _delete(self, url):
+        match = SESSION_PATH.match(url.path)
+        if match is None:
+            raise APIError(404, "Not found")
+        end_session(match.group(1))
+        return 204, None
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=API_PORT):
+    tracing.start_metrics_server()
+    load_semantic_memory()
+    if API_SESSION_TTL_SECONDS > 0:
+        threading.Thread(target=_evict_idle_sessions_forever, args=(API_SESSION_TTL_SECONDS,),
+                         name="api-session-evictor", daemon=True).start()
+    server = ThreadingHTTPServer(("0.0.0.0", port), _APIHandler)
+    server.daemon_threads = True
+    logger.log(f"Conversation API served on port {port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve()
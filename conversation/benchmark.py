@@ -0,0 +1,313 @@
+"""
+Offline end-to-end benchmark of the conversation turn pipeline.
+
+Drives ConversationManager headlessly, with everything external replaced:
+
+- the LLM by FakeChatModel, which answers after a configurable latency,
+- MongoDB by the in-process backend (MONGO_BACKEND=memory, requires mongomock),
+- the deepface service by StubFaceService, a local server-sent events stream,
+- the microphone by a synthetic speech-like WAV file generated on the fly.
+
+The emotion, embedding and (for audio turns) Whisper models are the real ones,
+so their load time and per-turn cost are part of the measurement. Text-to-speech
+needs the network and is only included with --tts.
+
+The report is JSON: turns/sec, per-stage latency percentiles (from tracing),
+model load times, peak RSS and database command metrics, plus the commit and
+settings, so reports of two commits can be diffed directly:
+
+    python benchmark.py --turns 50 --llm-latency-ms 300 --output bench.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# What a user might say; cycled through by the benchmark turns
+UTTERANCES = [
+    "I've been feeling really anxious about work lately.",
+    "I can't sleep well, my mind keeps racing at night.",
+    "Today was actually a good day, I went for a walk.",
+    "My friends don't seem to understand what I'm going through.",
+    "I'm worried I'll disappoint my family.",
+    "Sometimes I just feel numb and tired of everything.",
+    "I tried the breathing exercise you suggested and it helped a bit.",
+    "I had an argument with my partner and I feel guilty.",
+]
+FACE_EMOTIONS = ["neutral", "happy", "sad", "fear", "angry", "surprise", "disgust"]
+
+
+class FakeChatModel:
+    """Stands in for the chat model: sleeps for the configured latency, then answers with canned text."""
+
+    def __init__(self, latency_ms=300.0, jitter_ms=50.0, conflict_rate=0.2, seed=0):
+        """
+        Parameters:
+            latency_ms (float): Mean time one call takes.
+            jitter_ms (float): Uniform +/- variation of the latency.
+            conflict_rate (float): Share of emotion consistency checks answered "inconsistent".
+        """
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.conflict_rate = conflict_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt):
+        from langchain_core.messages import AIMessage
+
+        text = prompt if isinstance(prompt, str) else str(prompt[-1].content)
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            conflict = self._random.random() < self.conflict_rate
+        time.sleep(delay)
+        if "consistent or inconsistent" in text:
+            return AIMessage(content="inconsistent" if conflict else "consistent")
+        if "most dominant" in text:
+            return AIMessage(content="sad")
+        return AIMessage(content="Thank you for sharing that with me. It sounds like this has been weighing on you. "
+                                 "What do you think would help you feel a little more at ease right now?")
+
+
+class StubFaceService:
+    """A local stand-in for the deepface `/emotion/stream` endpoint, emitting readings at `fps`."""
+
+    def __init__(self, fps=5.0, seed=0):
+        self.fps = fps
+        self._random = random.Random(seed)
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if not self.path.endswith("/emotion/stream"):
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                try:
+                    while True:
+                        self.wfile.write(stub._event().encode())
+                        self.wfile.flush()
+                        time.sleep(1.0 / stub.fps)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, name="stub-face-service", daemon=True).start()
+
+    def _event(self):
+        weights = [self._random.random() for _ in FACE_EMOTIONS]
+        total = sum(weights)
+        probabilities = {label: round(w / total, 4) for label, w in zip(FACE_EMOTIONS, weights)}
+        reading = {"timestamp": time.time(), "emotion": max(probabilities, key=probabilities.get),
+                   "probabilities": probabilities}
+        return f"event: emotion\ndata: {json.dumps(reading)}\n\n"
+
+    def close(self):
+        self.server.shutdown()
+
+
+def synthetic_speech_wav(path, seconds=3.0, sample_rate=16000, seed=0):
+    """
+    Write a mono 16-bit WAV of speech-like sound: voiced syllables with a gliding pitch and
+    a few harmonics, separated by short pauses, with a little background noise.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * math.pi * 0.7 * t)
+    phase = 2 * math.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    # About four syllables per second
+    envelope = np.clip(np.sin(2 * math.pi * 2.0 * t), 0, None) ** 0.5
+    signal = 0.3 * voiced * envelope + 0.01 * rng.standard_normal(len(t))
+    samples = (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+    return path
+
+
+def prepare_offline_environment(face_fps=5.0, workdir=None):
+    """
+    Point the conversation service at in-process stand-ins. Must run before the service modules are imported.
+
+    Returns:
+        tuple: (StubFaceService, working directory)
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="conversation_benchmark_")
+    face_service = StubFaceService(fps=face_fps)
+    os.environ["MONGO_BACKEND"] = "memory"
+    os.environ["FACE_SERVICE_URL"] = face_service.url
+    os.environ["FACE_SESSION_ID"] = ""
+    os.environ["SEMANTIC_MEMORY_DIR"] = os.path.join(workdir, "semantic_memory")
+    os.environ["METRICS_PORT"] = "0"
+    # Constructing the real model clients must not fail for lack of credentials
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    return face_service, workdir
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def timed(load_times, name, load):
+    started = time.perf_counter()
+    result = load()
+    load_times[name] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_benchmark(turns=20, warmup_turns=2, audio_every=4, llm_latency_ms=300.0, llm_jitter_ms=50.0,
+                  conflict_rate=0.2, tts=False, seed=0):
+    """
+    Run `turns` measured turns of one session and report on them.
+
+    Parameters:
+        turns (int): Measured turns.
+        warmup_turns (int): Turns run first and excluded from the stage statistics.
+        audio_every (int): Every n-th turn is a spoken turn (Whisper transcription and speech emotion); 0 = text only.
+        llm_latency_ms, llm_jitter_ms, conflict_rate: FakeChatModel settings.
+        tts (bool): Also synthesize the responses (needs network access).
+
+    Returns:
+        dict: The report.
+    """
+    face_service, workdir = prepare_offline_environment()
+    load_times = {}
+    rss_before_models = peak_rss_mb()
+
+    import tracing
+    conversation_workflow = timed(load_times, "import_pipeline", lambda: __import__("conversation_workflow"))
+    from db import DB, User
+    from emotion_analyzer import EmotionAnalyzer
+    from embedding_pipeline import EmbeddingWorker
+    from semantic_memory import SemanticMemory
+
+    fake_llm = FakeChatModel(llm_latency_ms, llm_jitter_ms, conflict_rate, seed)
+    conversation_workflow.llm = fake_llm
+
+    timed(load_times, "emotion_text_model", EmotionAnalyzer)
+    timed(load_times, "semantic_memory", SemanticMemory)
+    audio_path = None
+    if audio_every:
+        import whisper
+        from speech_to_text import transcribe_audio
+        timed(load_times, "whisper_base", lambda: whisper.load_model("base"))
+        audio_path = synthetic_speech_wav(os.path.join(workdir, "speech.wav"), seed=seed)
+    if tts:
+        from text_to_speech import text_to_speech
+
+    user = User(f"benchmark-{seed}", 30, "Anxiety and trouble sleeping")
+    DB().init_user(user)
+    manager = timed(load_times, "session_start", lambda: conversation_workflow.ConversationManager(
+        user_name=user.user_name, user_age=user.user_age, user_problem=user.user_problem,
+        is_new_user=True, user_id=str(user.user_id)))
+
+    def run_turn(index):
+        text = UTTERANCES[index % len(UTTERANCES)]
+        spoken = audio_every and (index + 1) % audio_every == 0
+        with tracing.turn("spoken_turn" if spoken else "text_turn", session_id=manager.session_id):
+            if spoken:
+                with tracing.span("asr.transcribe"):
+                    text = transcribe_audio(audio_path, model_name="base") or text
+                response = manager.process_input(text, input_type="audio", audio_path=audio_path)
+            else:
+                response = manager.process_input(text, input_type="text")
+            if tts:
+                with tracing.span("tts.synthesize"):
+                    text_to_speech(response)
+
+    for index in range(warmup_turns):
+        run_turn(index)
+    tracing.reset()
+    DB().metrics.reset()
+    llm_calls_before = fake_llm.calls
+
+    started = time.perf_counter()
+    for index in range(warmup_turns, warmup_turns + turns):
+        run_turn(index)
+    elapsed = time.perf_counter() - started
+
+    # Background work the turns queued is part of the cost, but not of the turn latency
+    drain_started = time.perf_counter()
+    manager.sync_session()
+    manager.close()
+    # Embedding first, in-flight batch included: it queues the vector writes flushed next
+    EmbeddingWorker().flush(timeout=60)
+    DB().flush_writes(timeout=60)
+    drain = time.perf_counter() - drain_started
+    face_service.close()
+
+    return {
+        "commit": git_commit(),
+        "settings": {"turns": turns, "warmup_turns": warmup_turns, "audio_every": audio_every,
+                     "llm_latency_ms": llm_latency_ms, "llm_jitter_ms": llm_jitter_ms,
+                     "conflict_rate": conflict_rate, "tts": tts, "seed": seed},
+        "elapsed_seconds": round(elapsed, 3),
+        "turns_per_second": round(turns / elapsed, 3) if elapsed else None,
+        "llm_calls": fake_llm.calls - llm_calls_before,
+        "background_drain_seconds": round(drain, 3),
+        "model_load_seconds": load_times,
+        "peak_rss_mb": {"before_models": rss_before_models, "total": peak_rss_mb()},
+        "stages": tracing.snapshot()["stages"],
+        "db_operations": DB().operation_metrics(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the conversation turn pipeline")
+    parser.add_argument("--turns", type=int, default=20, help="Measured turns")
+    parser.add_argument("--warmup-turns", type=int, default=2, help="Unmeasured turns run first")
+    parser.add_argument("--audio-every", type=int, default=4,
+                        help="Every n-th turn is spoken (synthetic audio through Whisper), 0 = text only")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Mean latency of the fake LLM")
+    parser.add_argument("--llm-jitter-ms", type=float, default=50.0, help="Uniform +/- jitter of the fake LLM")
+    parser.add_argument("--conflict-rate", type=float, default=0.2,
+                        help="Share of turns whose emotions the fake LLM reports as inconsistent")
+    parser.add_argument("--tts", action="store_true", help="Include text-to-speech (needs network access)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = run_benchmark(turns=args.turns, warmup_turns=args.warmup_turns, audio_every=args.audio_every,
+                           llm_latency_ms=args.llm_latency_ms, llm_jitter_ms=args.llm_jitter_ms,
+                           conflict_rate=args.conflict_rate, tts=args.tts, seed=args.seed)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -1,4 +1,6 @@
 import os
+import time
+import uuid
 from dotenv import load_dotenv
 from typing import Dict, List, Any, Optional
 from datetime import datetime
@@ -9,6 +11,14 @@ from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
 
 from db import DB, User, Conversation
 from emotion_analyzer import EmotionAnalyzer
+from emotion_store import EmotionStore
+from face_emotion import FaceEmotionSubscriber
+from embedding_pipeline import EmbeddingWorker
+from memory_summarizer import PROFILE_SUMMARY_EVERY, ProfileSummarizer
+from history_cache import SessionHistory
+from semantic_memory import SemanticMemory, estimate_tokens
+import profiling
+import tracing
 
 # Import prompts
 from prompts import (
@@ -16,11 +26,18 @@ from prompts import (
     GREETING_PROMPT,
     EMOTION_CONSISTENCY_PROMPT,
     DOMINANT_EMOTION_PROMPT,
-    CONTINUE_DIALOGUE_PROMPT
+    CONTINUE_DIALOGUE_PROMPT,
+    MEMORY_CONTEXT_PROMPT
 )
 
 load_dotenv()
 
+# Approximate token budget for the memory context injected into each response prompt
+MEMORY_CONTEXT_TOKENS = int(os.getenv("MEMORY_CONTEXT_TOKENS", "400"))
+
+# Longest span of facial emotion readings aggregated into one turn
+FACE_WINDOW_MAX_SECONDS = 30
+
 # Initialize LLM just once at module level
 try:
     llm = HuggingFaceEndpoint(
@@ -43,11 +60,31 @@ except Exception as e:
 class ConversationManager:
     """Manages conversations with users, storing history and generating responses"""
     
-    def __init__(self, user_name=None, user_age=None, user_problem=None, is_new_user=False, user_id=None):
-        """Initialize the conversation manager with user information"""
+    def __init__(self, user_name=None, user_age=None, user_problem=None, is_new_user=False, user_id=None,
+                 face_session_id=None):
+        """
+        Initialize the conversation manager with user information.
+        `face_session_id` is the deepface session that uploads this user's camera frames
+        (defaults to FACE_SESSION_ID).
+        """
         self.messages = []
         self.current_emotion = {}
+        self.emotion_conflict = False
         self.initialized = False
+        self.last_response_at = time.time()  # Unix time the latest AI message was produced
+
+        # Every turn of this session gets a sequence number; (session_id, seq) identifies it in the DB
+        self.session_id = uuid.uuid4().hex
+        self.turns = []
+        self._acked_seqs = set()  # Turns the database has confirmed
+
+        # Turns of this session write a profile when set (PROFILE_TURNS, PROFILE_USERS or per session)
+        self.profiling = profiling.enabled_for(user_name)
+
+        # Start receiving facial emotion readings now, so the first turn already has some
+        self.face_subscriber = FaceEmotionSubscriber.acquire(face_session_id)
+        self.face_session_id = self.face_subscriber.session_id
+        self._face_released = False
         
         # Initialize user information if provided
         if user_name:
@@ -58,31 +95,41 @@ class ConversationManager:
                 "user_id": user_id
             }
             self.is_new_user = is_new_user
+            self.history = SessionHistory(user_id)
             
             # Initialize the conversation with a greeting
             self._initialize_conversation()
         else:
             self.user = {}
             self.is_new_user = False
+            self.history = SessionHistory(None)
     
     def _initialize_conversation(self):
         """Initialize the conversation with a greeting"""
-        db = DB()
-        
-        # Get conversation history from database
-        conversation_history = []
+        # Long-term context comes from the background-maintained summary: one read, fixed size
+        context = "None"
         if self.user.get("user_id"):
-            db_history = db.get_conversation_history(self.user["user_id"], limit=3)
-            if db_history:
-                for conv in db_history:
-                    conversation_history.append(f"User: {conv.get('user_input', '')}")
-                    conversation_history.append(f"AI: {conv.get('AI_output', '')}")
+            with tracing.span("db.get_user_profile"):
+                profile = DB().get_user_profile(self.user["user_id"])
+            if profile and profile.get("summary"):
+                context = f"Summary of previous conversations: {profile['summary']}"
+            else:
+                # No summary yet: fall back to the last few turns; later turns are served from the cache
+                with tracing.span("db.history_seed"):
+                    self.history.seed()
+                db_history = self.history.recent(limit=3)
+                if db_history:
+                    context = "Previous conversation history:\n" + "\n".join(
+                        f"User: {conv.get('user_input', '')}\nAI: {conv.get('AI_output', '')}" for conv in db_history
+                    )
+                # Summarize what is already there so the next session starts from a summary
+                ProfileSummarizer(llm).schedule(self.user["user_id"])
         
         # Create initial system message with user info
         system_message = SystemMessage(content=MENTAL_HEALTH_SYSTEM_TEMPLATE.format(
             user_info=self.user,
             emotion_state="neutral",
-            context=f"Previous conversation history: {conversation_history if conversation_history else 'None'}"
+            context=context
         ))
         
         # Generate greeting based on user info
@@ -92,61 +139,79 @@ class ConversationManager:
             user_problem=self.user.get("problem", "")
         )
         
-        greeting_response = llm.invoke(greeting_prompt)
+        with tracing.span("llm.greeting"):
+            greeting_response = llm.invoke(greeting_prompt)
         greeting_text = greeting_response.content
         
         # Initialize messages with system message and AI greeting
         self.messages = [system_message, AIMessage(content=greeting_text)]
         self.initialized = True
         self.last_response = greeting_text
+        self.last_response_at = time.time()
     
     def process_input(self, user_input, input_type="text", audio_path=None):
         """Process user input and generate a response"""
-        analyzer = EmotionAnalyzer()
-        emotion_results = {}
-        
-        # Process based on input type
-        if input_type == "text":
-            text_emotion = analyzer.analyze_text_emotion(user_input)
-            facial_emotion = analyzer.analyze_face_emotion()
-            emotion_results = {
-                "text_emotion": text_emotion,
-                "facial_emotion": facial_emotion
-            }
-        elif input_type == "audio" and audio_path:
-            text_emotion = analyzer.analyze_text_emotion(user_input)
-            speech_emotion = analyzer.analyze_speech_emotion(audio_path)
-            facial_emotion = analyzer.analyze_face_emotion()
-            emotion_results = {
-                "text_emotion": text_emotion,
-                "speech_emotion": speech_emotion,
-                "facial_emotion": facial_emotion
-            }
-        
-        # Update current emotion
-        self.current_emotion = emotion_results
-        
-        # Check emotion consistency
-        emotion_consistent = self._check_emotion_consistency()
-        
-        # Handle emotion inconsistency if needed
-        if not emotion_consistent:
-            self._handle_emotion_conflict()
-        
-        # Add user message to history
-        self.messages.append(HumanMessage(content=user_input))
-        
-        # Retrieve context from memory
-        context = self._retrieve_from_memory(user_input)
-        
-        # Generate response
-        response_text = self._generate_response(user_input, context)
-        
-        # Store the conversation
-        self._store_conversation(user_input, response_text)
-        
-        # Return the response
-        return response_text
+        with tracing.turn("process_input", session_id=self.session_id, input_type=input_type), \
+                profiling.profile("process_input", self.profiling):
+            with tracing.span("emotion.analyzer_init"):
+                analyzer = EmotionAnalyzer()
+            emotion_results = {}
+            
+            # The user's face is aggregated over the time they spent composing this input
+            face_window_start = max(self.last_response_at, time.time() - FACE_WINDOW_MAX_SECONDS)
+            
+            # Process based on input type
+            if input_type == "text":
+                with tracing.span("emotion.text"):
+                    text_emotion = analyzer.analyze_text_emotion(user_input)
+                with tracing.span("emotion.face"):
+                    facial_emotion = analyzer.analyze_face_emotion(start=face_window_start,
+                                                                   subscriber=self.face_subscriber)
+                emotion_results = {
+                    "text_emotion": text_emotion,
+                    "facial_emotion": facial_emotion
+                }
+            elif input_type == "audio" and audio_path:
+                with tracing.span("emotion.text"):
+                    text_emotion = analyzer.analyze_text_emotion(user_input)
+                with tracing.span("emotion.speech"):
+                    speech_emotion = analyzer.analyze_speech_emotion(audio_path)
+                with tracing.span("emotion.face"):
+                    facial_emotion = analyzer.analyze_face_emotion(start=face_window_start,
+                                                                   subscriber=self.face_subscriber)
+                emotion_results = {
+                    "text_emotion": text_emotion,
+                    "speech_emotion": speech_emotion,
+                    "facial_emotion": facial_emotion
+                }
+            
+            # Update current emotion
+            self.current_emotion = emotion_results
+            
+            # Check emotion consistency
+            emotion_consistent = self._check_emotion_consistency()
+            self.emotion_conflict = not emotion_consistent
+            
+            # Handle emotion inconsistency if needed
+            if not emotion_consistent:
+                self._handle_emotion_conflict()
+            
+            # Add user message to history
+            self.messages.append(HumanMessage(content=user_input))
+            
+            # Retrieve context from memory
+            with tracing.span("memory.retrieve"):
+                context = self._retrieve_from_memory(user_input)
+            
+            # Generate response
+            response_text = self._generate_response(user_input, context)
+            
+            # Store the conversation
+            with tracing.span("db.store_turn"):
+                self._store_conversation(user_input, response_text)
+            
+            # Return the response
+            return response_text
     
     def _check_emotion_consistency(self):
         """Check if the emotions from different sources are consistent"""
@@ -158,7 +223,8 @@ class ConversationManager:
         
         # Use LLM to check consistency
         prompt = EMOTION_CONSISTENCY_PROMPT.format(emotions=emotions)
-        response = llm.invoke(prompt)
+        with tracing.span("llm.emotion_consistency"):
+            response = llm.invoke(prompt)
         result = response.content.strip().lower()
         
         return "inconsistent" not in result
@@ -170,14 +236,15 @@ class ConversationManager:
         
         # Determine the dominant emotion with LLM
         prompt = DOMINANT_EMOTION_PROMPT.format(emotions=emotions)
-        response = llm.invoke(prompt)
+        with tracing.span("llm.dominant_emotion"):
+            response = llm.invoke(prompt)
         dominant_emotion = response.content.strip().lower()
         
         # Store the emotion conflict in episodic memory
         if user_id:
             db = DB()
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            db.store_emotion_conflict(user_id, emotions, timestamp)
+            db.queue_emotion_conflict(user_id, emotions, timestamp)
             print(f"Emotion conflict detected for user {user_id}: {emotions}")
         
         self.resolved_emotion = dominant_emotion
@@ -187,76 +254,142 @@ class ConversationManager:
         emotions = self.current_emotion
         user_id = self.user.get("user_id")
         
-        context = f"User profile: {self.user}\n"
-        context += f"Current emotional state: {emotions}\n"
+        context = f"Current emotional state: {emotions}\n"
         
-        # Retrieve conversation history from episodic memory (MongoDB)
+        # Retrieve conversation history from episodic memory (session cache backed by MongoDB).
+        # Turns of the current session are already part of self.messages.
+        # The whole context shares MEMORY_CONTEXT_TOKENS: the newest turns are kept, the oldest dropped.
         if user_id:
-            db = DB()
-            conversation_history = db.get_conversation_history(user_id, limit=5)
-            if conversation_history:
-                context += "Recent conversation history:\n"
-                for conv in conversation_history:
-                    context += f"User: {conv.get('user_input', '')}\n"
-                    context += f"AI: {conv.get('AI_output', '')}\n"
-        
-        # Extract dominant emotion for simplicity
-        dominant_emotion = list(emotions.values())[0] if emotions else "neutral"
-        
-        # Simple keyword-based mock responses
-        responses = {
-            "angry": "Research shows that anger is often a secondary emotion, masking more vulnerable feelings like hurt, fear, or disappointment. Therapeutic approaches include cognitive reframing, mindfulness, and exploring underlying triggers.",
-            "sad": "Sadness is a natural response to loss or disappointment. Studies indicate that expressing sadness through talking or writing can be therapeutic. Cognitive-behavioral techniques and behavioral activation are evidence-based approaches.",
-            "happy": "Positive emotions like happiness broaden our thought-action repertoires and build resources. Savoring positive experiences and practicing gratitude can help maintain positive emotional states.",
-            "fearful": "Fear activates the body's fight-or-flight response. Exposure therapy, which gradually confronts feared situations, has strong empirical support for treating anxiety disorders.",
-            "surprised": "Surprise indicates a mismatch between expectations and reality. This presents an opportunity for learning and adaptation. Helping clients integrate surprising information can lead to cognitive restructuring.",
-            "neutral": "When clients present with flat affect, it's important to explore whether this represents emotional regulation, alexithymia, or potential emotional suppression."
-        }
-        
-        # Extract the emotion from string like "5-star sentiment" or "angry"
-        emotion_key = "neutral"
-        for key in responses.keys():
-            if key in dominant_emotion.lower():
-                emotion_key = key
-                break
-        
-        semantic_results = responses.get(emotion_key, "No relevant information found")
+            with tracing.span("memory.history"):
+                recent = self.history.recent(limit=5)
+            conversation_history = [conv for conv in recent if conv.get("session_id") != self.session_id]
+            header = "Recent conversation history:\n"
+            history_budget = MEMORY_CONTEXT_TOKENS - estimate_tokens(context + header)
+            kept = []
+            for conv in reversed(conversation_history):
+                entry = f"User: {conv.get('user_input', '')}\nAI: {conv.get('AI_output', '')}\n"
+                history_budget -= estimate_tokens(entry)
+                if history_budget < 0:
+                    break
+                kept.append(entry)
+            if kept:
+                context += header + "".join(reversed(kept))
+        
+        # Retrieve knowledge-base passages and related past turns from semantic memory
+        remaining_budget = max(0, MEMORY_CONTEXT_TOKENS - estimate_tokens(context))
+        try:
+            with tracing.span("memory.semantic"):
+                semantic_results = SemanticMemory().build_context(
+                    user_id,
+                    user_input,
+                    token_budget=remaining_budget,
+                    exclude_session=self.session_id
+                )
+        except Exception as e:
+            print(f"Semantic memory retrieval failed: {e}")
+            semantic_results = ""
         
         if semantic_results:
-            context += "\nRelevant psychological information:\n"
-            context += semantic_results
+            context += "\n" + semantic_results
         
         return context
     
     def _generate_response(self, user_input, context):
         """Generate response using LLM with context from memories"""
-        # Generate response using the LLM
-        response = llm.invoke(self.messages)
+        # The retrieved context only accompanies this request; it is not kept in the history
+        messages = self.messages[:-1] + [
+            SystemMessage(content=MEMORY_CONTEXT_PROMPT.format(context=context)),
+            self.messages[-1]
+        ]
+        with tracing.span("llm.response"):
+            response = llm.invoke(messages)
         response_text = response.content
         
         # Add response to messages
         self.messages.append(AIMessage(content=response_text))
         self.last_response = response_text
+        self.last_response_at = time.time()
         
         return response_text
     
+    def _db_user(self):
+        """Create User object for DB operations"""
+        user = User(self.user.get("name", ""), self.user.get("age", 0), self.user.get("problem", ""))
+        user.user_id = self.user.get("user_id")
+        return user
+
     def _store_conversation(self, user_input, response_text):
         """Store conversation in episodic memory"""
         user_id = self.user.get("user_id")
-        
+
+        # Store conversation with emotion data
+        conversation = Conversation(
+            user_input,
+            response_text,
+            datetime.now(),
+            emotion_data=self.current_emotion,
+            session_id=self.session_id,
+            seq=len(self.turns) + 1
+        )
+        self.turns.append(conversation)
+        self.history.append(conversation)
+
         if user_id:
             db = DB()
-            # Create User object for DB operations
-            user = User(self.user.get("name", ""), self.user.get("age", 0), self.user.get("problem", ""))
-            user.user_id = user_id
-            
-            # Store conversation with emotion data
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            conversation = Conversation(user_input, response_text, timestamp, emotion_data=self.current_emotion)
-            db.update_conversation(user, conversation)
-            print(f"Stored conversation for user {user_id}")
+            seq = conversation.seq
+            db.queue_conversation(self._db_user(), conversation, on_written=lambda: self._acked_seqs.add(seq))
+            EmotionStore().record_turn(
+                user_id,
+                self.current_emotion,
+                timestamp=conversation.timestamp,
+                session_id=self.session_id,
+                seq=seq,
+                is_conflict=self.emotion_conflict
+            )
+            # Embedded once, in the background, and added to the user's semantic memory index
+            EmbeddingWorker().submit(user_id, conversation)
+            if seq % PROFILE_SUMMARY_EVERY == 0:
+                ProfileSummarizer(llm).schedule(user_id)
+            print(f"Queued conversation for user {user_id}")
+
+    def sync_session(self):
+        """
+        Make sure every turn of this session is stored.
+
+        Only turns the write-behind queue has not confirmed yet are sent, as one
+        idempotent bulk upsert, so calling this repeatedly never duplicates history.
+        """
+        if not self.user.get("user_id"):
+            return True
+
+        pending = [turn for turn in self.turns if turn.seq not in self._acked_seqs]
+        if pending:
+            if not DB().upsert_conversations(self._db_user(), pending):
+                return False
+            self._acked_seqs.update(turn.seq for turn in pending)
+
+        # Fold this session into the user's long-term summary
+        if self.turns:
+            ProfileSummarizer(llm).schedule(self.user["user_id"])
+        return True
+
+    def close(self):
+        """End the session: stop following its face session unless another conversation still does."""
+        # The released subscriber stays readable, so a late turn reads this session's last readings
+        if not self._face_released:
+            self._face_released = True
+            self.face_subscriber.release()
+
+def load_semantic_memory():
+    """Load the embedding model and knowledge-base index at startup rather than on the first user turn."""
+    try:
+        with tracing.span("memory.load"):
+            SemanticMemory()
+    except Exception as e:
+        print(f"Semantic memory loading failed: {e}")
 
-def get_mental_health_workflow(user_name=None, user_age=None, user_problem=None, is_new_user=False, user_id=None):
+def get_mental_health_workflow(user_name=None, user_age=None, user_problem=None, is_new_user=False, user_id=None,
+                               face_session_id=None):
     """Create and initialize a conversation manager"""
     # Create a new conversation manager with the user information
     conversation_manager = ConversationManager(
@@ -264,7 +397,8 @@ def get_mental_health_workflow(user_name=None, user_age=None, user_problem=None,
         user_age=user_age,
         user_problem=user_problem,
         is_new_user=is_new_user,
-        user_id=user_id
+        user_id=user_id,
+        face_session_id=face_session_id
     )
     
     # Return the conversation manager
@@ -0,0 +1,234 @@
+"""
+Write-time embedding of conversation turns.
+
+Each stored turn is embedded exactly once, in the background: ConversationManager
+submits the turn to EmbeddingWorker and returns, and the worker embeds whatever
+has accumulated in one batch. The vector is then
+
+- stored next to the turn in user_conversations as compact float16 bytes
+  (fields `embedding`, `embedding_model`), via the DB write-behind queue, and
+- appended to the user's semantic memory index.
+
+A query therefore costs one embedding plus one index search, never a re-embedding
+of history. Indexes can be rebuilt from the stored vectors without the model.
+
+Backfill existing data (first copies turns still embedded in users.conversations
+into user_conversations, then embeds turns that have no vector yet and re-indexes
+turns whose vector is stored but missing from the local index):
+
+    python embedding_pipeline.py --backfill [--user-id <id>] [--batch-size 64]
+"""
+import argparse
+import atexit
+import threading
+import time
+from collections import defaultdict, deque
+
+from pymongo import UpdateOne
+
+from db import DB, to_object_id
+from embeddings import Embedder, decode_vector, encode_vector
+from logger import Logger
+from semantic_memory import SemanticMemory, turn_key, turn_text
+
+
+class EmbeddingWorker:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(EmbeddingWorker, cls).__new__(cls)
+                cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, batch_size=32, max_wait=0.5):
+        """
+        Parameters:
+            batch_size (int): Maximum number of turns embedded together.
+            max_wait (float): Seconds a turn may wait for a batch to fill up.
+        """
+        if self._initialized:
+            return
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.logger = Logger()
+        self._pending = deque()
+        self._in_flight = 0
+        self._submitted = 0  # Total turns ever accepted
+        self._completed = 0  # Total turns embedded or given up on
+        self._flush_target = 0  # Highest _submitted value a flush() caller is waiting for
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="turn-embedder", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+        self._initialized = True
+
+    @property
+    def depth(self) -> int:
+        """Number of turns accepted but not yet embedded and stored."""
+        with self._condition:
+            return len(self._pending) + self._in_flight
+
+    def submit(self, user_id, conversation) -> None:
+        """Queue a stored turn (db.Conversation) for embedding without blocking."""
+        if not user_id:
+            return
+        with self._condition:
+            if self._closed:
+                return
+            self._pending.append((user_id, conversation))
+            self._submitted += 1
+            self._condition.notify_all()
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Block until every turn submitted before this call has been embedded and its vector
+        handed to the DB write-behind queue (flush that afterwards to wait for the writes).
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            target = self._submitted
+            self._flush_target = max(self._flush_target, target)
+            self._condition.notify_all()
+            while self._completed < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=30.0) -> None:
+        """Embed whatever is still queued and stop the worker."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._worker.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._pending:
+                    self._condition.wait()
+                # Give the batch up to max_wait from now to fill up
+                deadline = time.monotonic() + self.max_wait
+                while not self._closed and len(self._pending) < self.batch_size \
+                        and self._flush_target <= self._completed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if not self._pending:
+                    return
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                self._in_flight = len(batch)
+
+            try:
+                embed_and_store(batch)
+            except Exception as e:
+                self.logger.log_error(f"Failed to embed {len(batch)} turns: {e}")
+
+            with self._condition:
+                self._in_flight = 0
+                self._completed += len(batch)
+                self._condition.notify_all()
+
+
+def embed_and_store(items):
+    """
+    Embed (user_id, conversation) pairs in one batch, store the vectors next to
+    their turns and add them to the users' semantic memory indexes.
+
+    Parameters:
+        items (list): (user_id, conversation) pairs; conversations are db.Conversation
+            objects or turn documents.
+    """
+    if not items:
+        return
+    embedder = Embedder()
+    vectors = embedder.embed([turn_text(conversation) for _, conversation in items])
+
+    db = DB()
+    by_user = defaultdict(list)
+    for (user_id, conversation), vector in zip(items, vectors):
+        by_user[str(user_id)].append((conversation, vector))
+        if isinstance(conversation, dict):
+            session_id, seq = conversation["session_id"], conversation["seq"]
+        else:
+            session_id, seq = conversation.session_id, conversation.seq
+        # The turn's own upsert was queued earlier on the same queue, so it lands first
+        db.write_queue.put("user_conversations", UpdateOne(
+            {"session_id": session_id, "seq": seq},
+            {"$set": {"embedding": encode_vector(vector), "embedding_model": embedder.model_name}},
+        ))
+
+    memory = SemanticMemory()
+    for user_id, entries in by_user.items():
+        memory.add_embedded_turns(user_id, [c for c, _ in entries], [v for _, v in entries])
+
+
+def backfill(user_id=None, batch_size=64):
+    """
+    Embed stored turns that have no vector yet and index every stored vector locally.
+    Turns from before user_conversations existed are migrated into it first, so they are
+    embedded like any other turn, under a stable (session_id, seq) key.
+    """
+    logger = Logger()
+    db = DB()
+    embedder = Embedder()
+    memory = SemanticMemory()
+
+    migrated = db.migrate_legacy_conversations(user_id)
+
+    query = {"session_id": {"$exists": True}, "seq": {"$exists": True}}
+    if user_id:
+        query["user_id"] = to_object_id(user_id)
+    projection = {"_id": 0, "user_id": 1, "session_id": 1, "seq": 1, "timestamp": 1,
+                  "user_input": 1, "AI_output": 1, "embedding": 1, "embedding_model": 1}
+
+    embedded, reindexed = 0, 0
+    to_embed = []
+
+    def flush_to_embed():
+        nonlocal embedded
+        if to_embed:
+            embed_and_store([(turn["user_id"], turn) for turn in to_embed])
+            embedded += len(to_embed)
+            to_embed.clear()
+
+    for turn in db.conversations.find(query, projection).batch_size(batch_size):
+        index = memory.user_index(turn["user_id"])
+        stored = turn.get("embedding")
+        if stored is not None and turn.get("embedding_model") == embedder.model_name:
+            if not index.contains(turn_key(turn)):
+                reindexed += memory.add_embedded_turns(turn["user_id"], [turn], [decode_vector(stored)])
+            continue
+        to_embed.append(turn)
+        if len(to_embed) >= batch_size:
+            flush_to_embed()
+    flush_to_embed()
+
+    db.flush_writes()
+    logger.log(f"Backfill finished: {migrated} embedded legacy turns migrated, {embedded} turns embedded, "
+               f"{reindexed} re-indexed from stored vectors")
+    return embedded, reindexed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Conversation turn embedding pipeline")
+    parser.add_argument("--backfill", action="store_true", help="Embed and index existing turns")
+    parser.add_argument("--user-id", default=None, help="Only backfill this user")
+    parser.add_argument("--batch-size", type=int, default=64, help="Turns embedded per batch")
+    args = parser.parse_args()
+
+    if args.backfill:
+        backfill(user_id=args.user_id, batch_size=args.batch_size)
+    else:
+        parser.print_help()
@@ -0,0 +1,75 @@
+"""
+CPU sentence embedding model shared by the semantic memory.
+
+Implemented as a Singleton so the model is loaded once per process. The model
+name comes from EMBEDDING_MODEL (default: all-MiniLM-L6-v2, 384 dimensions,
+fast enough on CPU to embed a turn in a few milliseconds).
+"""
+import os
+import threading
+
+import numpy as np
+from bson.binary import Binary
+from dotenv import load_dotenv
+from sentence_transformers import SentenceTransformer
+
+from logger import Logger
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def encode_vector(vector: np.ndarray) -> Binary:
+    """Pack an embedding as compact float16 bytes for storage next to its turn."""
+    return Binary(np.asarray(vector, dtype=np.float16).tobytes())
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """Inverse of encode_vector, returning float32."""
+    return np.frombuffer(data, dtype=np.float16).astype(np.float32)
+
+
+class Embedder:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(Embedder, cls).__new__(cls)
+                cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        load_dotenv()
+        self.model_name = os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+        self.logger = Logger()
+        self.logger.log(f"Loading embedding model {self.model_name}")
+        self.model = SentenceTransformer(self.model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        # The underlying torch model is not safe to call from several threads at once
+        self._encode_lock = threading.Lock()
+        self._initialized = True
+
+    def embed(self, texts, batch_size=32) -> np.ndarray:
+        """
+        Embed a list of texts.
+
+        Returns:
+            np.ndarray: float32 array of shape (len(texts), dim), L2-normalised.
+        """
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        with self._encode_lock:
+            vectors = self.model.encode(
+                list(texts),
+                batch_size=batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        return vectors.astype(np.float32)
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
@@ -6,9 +6,9 @@ import numpy as np
 from pyAudioAnalysis import ShortTermFeatures
 from scipy.io import wavfile
 
-import requests
 import torch
 
+from face_emotion import FaceEmotionSubscriber
 from logger import Logger
 
 class EmotionAnalyzer:
@@ -46,7 +46,7 @@ class EmotionAnalyzer:
                 self.logger.log_error(f"Audio file not found: {audio_path}")
                 return "neutral"
 
-            self.logger.log(f"Analyzing speech emotion from: {audio_path}")
+            self.logger.log_debug(f"Analyzing speech emotion from: {audio_path}")
             
             # Read audio file using scipy (used by pyAudioAnalysis)
             sampling_rate, signal = wavfile.read(audio_path)
@@ -115,33 +115,29 @@ class EmotionAnalyzer:
             else:
                 return "neutral"
 
-    def analyze_face_emotion(self, docker_service_url: str = "http://localhost:5005") -> str:
+    def analyze_face_emotion(self, start: float = None, end: float = None, subscriber=None) -> str:
         """
-        调用另外一个 Docker 服务中的 deepface 模块，
-        从 /emotion 接口获取当前用户的表情信息
+        从后台订阅的 deepface 表情流（FaceEmotionSubscriber）中读取用户在一段时间内的主要表情，
+        只读本地内存，不发起网络请求
 
         参数:
-            docker_service_url: Docker 服务的基础 URL，例如 "http://127.0.0.1:5005"
+            start: 时间窗口起点（Unix 时间戳），例如用户开始输入或说话的时间；默认为最近 5 秒
+            end: 时间窗口终点（Unix 时间戳），默认为当前时间
+            subscriber: 对话持有的 FaceEmotionSubscriber（ConversationManager.face_subscriber）；
+                默认为 FACE_SESSION_ID 的进程级订阅（FaceEmotionSubscriber.default()）
 
         返回:
-            用户当前表情（例如 "happy", "sad" 等），如果调用失败则返回 "unknown"
+            用户当前表情（例如 "happy", "sad" 等），如果没有收到表情数据则返回 "unknown"
         """
-        try:
-            # 构造接口完整 URL
-            docker_service_url = "http://host.docker.internal:5005" # Map
-            url = f"{docker_service_url}/emotion"
-            response = requests.get(url, timeout=5)
-            # 如果返回状态码正常，则解析 JSON 数据
-            if response.status_code == 200:
-                data = response.json()
-                self.logger.log("Facial Emotion Result: " + data["emotion"])
-                return data.get("emotion", "unknown")
-            else:
-                self.logger.log(f"请求失败，状态码: {response.status_code}")
-                return "unknown"
-        except Exception as e:
-            self.logger.log(f"请求异常: {e}")
-            return "unknown"
+        if subscriber is None:
+            subscriber = FaceEmotionSubscriber.default()
+        data = subscriber.window(start=start, end=end)
+        if not subscriber.connected and data["face_samples"] == 0:
+            self.logger.log_warning(f"Facial emotion stream not connected ({subscriber.stream_url})",
+                                    sample_key=f"face_stream_down:{subscriber.session_id}")
+        self.logger.log(f"Facial Emotion Result: {data['emotion']} "
+                        f"(samples: {data['face_samples']}, staleness: {data['staleness']})")
+        return data["emotion"]
 
 # def extract_audio_features(audio_path: str):
 #     """
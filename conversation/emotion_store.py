@@ -0,0 +1,184 @@
+"""
+Time-series store for per-turn emotion readings.
+
+Every channel reading of every turn (text, speech, face) is written to the
+`emotion_readings` collection. Hourly and daily per-user rollups in
+`emotion_rollups` are maintained as readings arrive, so trend queries read a
+handful of small pre-aggregated documents instead of scanning months of history.
+
+Writes go through the DB write-behind queue and stay off the request path. The
+queue delivers at least once, so both writes are idempotent: a reading's _id is
+derived from (session_id, seq, channel), and a rollup's counters are only
+incremented by an update whose filter excludes buckets that already list the
+turn's key in `applied`. A resent increment matches no bucket, and its upsert
+is rejected by the unique rollup index, so it changes nothing.
+"""
+from datetime import datetime, timedelta
+
+import pymongo
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import PyMongoError
+
+from db import DB, to_object_id
+from logger import Logger
+
+READINGS_COLLECTION = "emotion_readings"
+ROLLUPS_COLLECTION = "emotion_rollups"
+GRANULARITIES = ("hour", "day")
+
+# Channel values that mean "no reading" rather than an emotion
+MISSING_LABELS = {"", "unknown", "error"}
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Truncate a timestamp to the start of its hourly or daily bucket."""
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup granularity: {granularity}")
+
+
+def _label_key(label: str) -> str:
+    # Labels become field names in the rollup documents
+    return str(label).strip().lower().replace(".", "_").replace("$", "_")
+
+
+def reading_key(user_id, session_id, seq, timestamp) -> str:
+    """Identifies one turn of a user; the same turn always gets the same key."""
+    if session_id and seq is not None:
+        return _label_key(f"{session_id}:{seq}")
+    return _label_key(f"{user_id}:{timestamp.isoformat()}")
+
+
+class EmotionStore:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(EmotionStore, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        self.db = DB()
+        self.logger = Logger()
+        self.readings = self.db.db[READINGS_COLLECTION]
+        self.rollups = self.db.db[ROLLUPS_COLLECTION]
+        self._ensure_collections()
+        self._initialized = True
+
+    def _ensure_collections(self):
+        """Create the indexes. Safe to call on every startup."""
+        # A regular collection rather than a time-series one: only regular collections enforce
+        # the unique _id that makes a resent reading a no-op
+        try:
+            self.readings.create_index(
+                [("meta.user_id", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING)], name="user_time"
+            )
+            self.readings.create_index(
+                [("meta.user_id", pymongo.ASCENDING), ("meta.channel", pymongo.ASCENDING),
+                 ("timestamp", pymongo.DESCENDING)],
+                name="user_channel_time",
+            )
+            self.rollups.create_index(
+                [("user_id", pymongo.ASCENDING), ("granularity", pymongo.ASCENDING),
+                 ("bucket", pymongo.ASCENDING), ("channel", pymongo.ASCENDING)],
+                unique=True,
+                name="rollup_unique",
+            )
+        except PyMongoError as e:
+            self.logger.log_error(f"Error creating emotion store indexes: {e}")
+
+    def record_turn(self, user_id, emotions, timestamp=None, session_id=None, seq=None, is_conflict=False):
+        """
+        Queue one reading per channel for a turn and update the rollups it falls into.
+
+        Parameters:
+            user_id: The user the readings belong to.
+            emotions (dict): Channel name to detected emotion, e.g. {"facial_emotion": "sad"}.
+            timestamp (datetime, optional): Time of the turn, defaults to now.
+            session_id (str, optional): Conversation session of the turn.
+            seq (int, optional): Sequence number of the turn within the session.
+            is_conflict (bool): Whether the channels disagreed on this turn.
+        """
+        if not user_id or not emotions:
+            return
+
+        user_id = to_object_id(user_id)
+        timestamp = timestamp or datetime.now()
+
+        for channel, label in emotions.items():
+            if not isinstance(label, str) or label.strip().lower() in MISSING_LABELS:
+                continue
+
+            key = reading_key(user_id, session_id, seq, timestamp)
+            self.db.write_queue.put(READINGS_COLLECTION, InsertOne({
+                "_id": f"{user_id}:{key}:{channel}",
+                "timestamp": timestamp,
+                "meta": {"user_id": user_id, "channel": channel},
+                "label": label,
+                "session_id": session_id,
+                "seq": seq,
+                "is_conflict": is_conflict,
+            }))
+
+            increments = {"count": 1, f"labels.{_label_key(label)}": 1}
+            if is_conflict:
+                increments["conflicts"] = 1
+            for granularity in GRANULARITIES:
+                self.db.write_queue.put(ROLLUPS_COLLECTION, UpdateOne(
+                    {
+                        "user_id": user_id,
+                        "granularity": granularity,
+                        "bucket": bucket_start(timestamp, granularity),
+                        "channel": channel,
+                        "applied": {"$ne": key},
+                    },
+                    {"$inc": increments, "$addToSet": {"applied": key}, "$max": {"last_seen": timestamp}},
+                    upsert=True,
+                ))
+
+    def get_readings(self, user_id, start, end, channel=None):
+        """Raw readings for one user in [start, end), oldest first."""
+        query = {"meta.user_id": to_object_id(user_id), "timestamp": {"$gte": start, "$lt": end}}
+        if channel:
+            query["meta.channel"] = channel
+        try:
+            return list(self.readings.find(query, {"_id": 0}).sort("timestamp", pymongo.ASCENDING))
+        except PyMongoError as e:
+            self.logger.log_error(f"Error retrieving emotion readings: {e}")
+            return []
+
+    def get_trend(self, user_id, start, end, granularity="day", channel=None):
+        """
+        Pre-aggregated emotion counts per bucket for one user in [start, end).
+
+        Returns:
+            list: One dict per (bucket, channel) with `count`, `conflicts` and a
+            `labels` mapping of emotion label to number of readings.
+        """
+        query = {
+            "user_id": to_object_id(user_id),
+            "granularity": granularity,
+            "bucket": {"$gte": bucket_start(start, granularity), "$lt": end},
+        }
+        if channel:
+            query["channel"] = channel
+        try:
+            trend = list(
+                self.rollups.find(query, {"_id": 0, "user_id": 0, "granularity": 0, "applied": 0})
+                .sort("bucket", pymongo.ASCENDING)
+            )
+        except PyMongoError as e:
+            self.logger.log_error(f"Error retrieving emotion trend: {e}")
+            return []
+        return trend
+
+    def get_recent_trend(self, user_id, days=30, granularity="day", channel=None):
+        """Convenience wrapper for the last `days` days up to now."""
+        end = datetime.now()
+        return self.get_trend(user_id, end - timedelta(days=days), end, granularity, channel)
@@ -0,0 +1,203 @@
+"""
+Background subscription to the facial emotion service.
+
+FaceEmotionSubscriber keeps one long-lived connection to the deepface service's
+server-sent events endpoint of one face session (`/sessions/<id>/emotion/stream`,
+or `/emotion/stream` for the service host's camera) and stores the pushed
+readings in a small in-memory buffer. There is one subscriber per face session,
+shared by the conversations that follow it; it is closed when the last of them
+releases it. Turns read their facial emotion from that buffer, so
+`EmotionAnalyzer.analyze_face_emotion` never waits on the network. The connection
+is re-established with exponential backoff whenever it drops; while it is down
+the readings simply age out and the facial emotion is reported as "unknown".
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from dotenv import load_dotenv
+
+from logger import Logger
+
+load_dotenv()
+
+# Base URL of the deepface service
+FACE_SERVICE_URL = os.getenv("FACE_SERVICE_URL", "http://localhost:5005")
+# Session whose uploaded frames are followed; empty means the camera attached to the deepface host
+FACE_SESSION_ID = os.getenv("FACE_SESSION_ID", "")
+# Readings kept for time-window queries (about 100 s at the service's default 5 fps)
+FACE_READINGS_KEPT = 512
+# The service sends a keep-alive every 15 s; a silent connection is considered dead after this
+FACE_STREAM_READ_TIMEOUT = 45.0
+FACE_STREAM_MAX_BACKOFF = 30.0
+
+
+class FaceEmotionSubscriber:
+    _instances = {}  # Face session ID -> subscriber
+    _default = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, service_url=None, session_id=None):
+        session_id = FACE_SESSION_ID if session_id is None else session_id
+        with cls._instance_lock:
+            instance = cls._instances.get(session_id)
+            if instance is None:
+                instance = cls._instances[session_id] = super(FaceEmotionSubscriber, cls).__new__(cls)
+                instance._initialized = False
+                instance._holders = 0
+        return instance
+
+    def __init__(self, service_url=None, session_id=None):
+        """
+        Parameters:
+            service_url (str, optional): Base URL of the deepface service, defaults to FACE_SERVICE_URL.
+            session_id (str, optional): Face session to follow, defaults to FACE_SESSION_ID;
+                empty follows the camera attached to the deepface host.
+        """
+        if self._initialized:
+            return
+        self.service_url = (service_url or FACE_SERVICE_URL).rstrip("/")
+        self.session_id = FACE_SESSION_ID if session_id is None else session_id
+        self.stream_url = (f"{self.service_url}/sessions/{self.session_id}/emotion/stream" if self.session_id
+                           else f"{self.service_url}/emotion/stream")
+        self.logger = Logger()
+        # (timestamp, emotion, probabilities or None), oldest first
+        self._readings = deque(maxlen=FACE_READINGS_KEPT)
+        self._lock = threading.Lock()
+        self.connected = False
+        self._closed = threading.Event()
+        self._response = None
+        self._worker = threading.Thread(target=self._run, name=f"face-emotion-subscriber-{self.session_id or 'local'}",
+                                        daemon=True)
+        self._worker.start()
+        self._initialized = True
+
+    @classmethod
+    def acquire(cls, session_id=None):
+        """The subscriber of a face session, held open until a matching release()."""
+        subscriber = cls(session_id=session_id)
+        with cls._instance_lock:
+            subscriber._holders += 1
+        return subscriber
+
+    @classmethod
+    def default(cls):
+        """
+        The subscriber of FACE_SESSION_ID, held for the life of the process, for callers
+        that have no conversation (and so no face session) of their own.
+        """
+        with cls._instance_lock:
+            subscriber = cls._default
+        if subscriber is None:
+            subscriber = cls.acquire()
+            with cls._instance_lock:
+                if cls._default is None:
+                    cls._default = subscriber
+                    return subscriber
+            subscriber.release()  # Another thread got there first
+            subscriber = cls._default
+        return subscriber
+
+    def release(self):
+        """Drop one hold from acquire(); the last one closes the stream."""
+        with self._instance_lock:
+            self._holders -= 1
+            if self._holders > 0 or self._instances.get(self.session_id) is not self:
+                return
+            del self._instances[self.session_id]
+        self._closed.set()
+        response = self._response
+        if response is not None:
+            # Unblocks the worker waiting for the next event
+            response.close()
+
+    def _run(self):
+        backoff = 1.0
+        while not self._closed.is_set():
+            try:
+                with requests.get(self.stream_url, stream=True,
+                                  timeout=(5, FACE_STREAM_READ_TIMEOUT),
+                                  headers={"Accept": "text/event-stream"}) as response:
+                    response.raise_for_status()
+                    self._response = response
+                    self.connected = True
+                    backoff = 1.0
+                    self.logger.log(f"Subscribed to facial emotion stream at {self.stream_url}")
+                    self._consume(response)
+                if not self._closed.is_set():
+                    self.logger.log_warning("Facial emotion stream closed by the service")
+            except Exception as e:
+                if self.connected and not self._closed.is_set():
+                    self.logger.log_warning(f"Facial emotion stream lost: {e}")
+            self._response = None
+            self.connected = False
+            self._closed.wait(backoff)
+            backoff = min(backoff * 2, FACE_STREAM_MAX_BACKOFF)
+
+    def _consume(self, response):
+        """Parse server-sent events and record every `emotion` event."""
+        event, data = None, []
+        for line in response.iter_lines(decode_unicode=True):
+            if self._closed.is_set():
+                return
+            if line is None:
+                continue
+            if line == "":
+                if event == "emotion" and data:
+                    self._record(json.loads("\n".join(data)))
+                event, data = None, []
+            elif line.startswith(":"):
+                continue  # keep-alive comment
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
+
+    def _record(self, reading):
+        with self._lock:
+            self._readings.append((reading["timestamp"], reading.get("emotion", "unknown"), reading.get("probabilities")))
+
+    def latest(self):
+        """(timestamp, emotion) of the newest reading, or None if nothing has been received."""
+        with self._lock:
+            if not self._readings:
+                return None
+            timestamp, emotion, _ = self._readings[-1]
+            return timestamp, emotion
+
+    def window(self, start=None, end=None):
+        """
+        Aggregate the readings received for frames in [start, end].
+
+        Parameters:
+            start (float, optional): Unix time of the window start; defaults to 5 seconds before `end`.
+            end (float, optional): Unix time of the window end; defaults to now.
+
+        Returns:
+            dict: Dominant `emotion` ("unknown" without face readings), averaged `distribution`,
+                `samples` and `face_samples` counts and `staleness` of the newest reading.
+        """
+        end = time.time() if end is None else end
+        start = end - 5.0 if start is None else start
+        with self._lock:
+            readings = list(self._readings)
+
+        result = {"emotion": "unknown", "distribution": None, "samples": 0, "face_samples": 0,
+                  "staleness": max(0.0, time.time() - readings[-1][0]) if readings else None}
+        totals = {}
+        for timestamp, _, probabilities in readings:
+            if not start <= timestamp <= end:
+                continue
+            result["samples"] += 1
+            if probabilities:
+                result["face_samples"] += 1
+                for label, p in probabilities.items():
+                    totals[label] = totals.get(label, 0.0) + p
+
+        if totals:
+            result["distribution"] = {label: round(total / result["face_samples"], 4) for label, total in totals.items()}
+            result["emotion"] = max(totals, key=totals.get)
+        return result
@@ -0,0 +1,66 @@
+"""
+Session-local cache of a user's most recent conversation turns.
+
+The cache is seeded from MongoDB once, when the conversation starts, and every
+new turn is appended as it is stored. Recent-history lookups during the session
+are then answered from memory; the database is only read again on a cold start
+or when more turns are requested than the cache holds.
+"""
+import threading
+from collections import deque
+
+from db import DB
+
+
+class SessionHistory:
+    def __init__(self, user_id, capacity=20):
+        """
+        Parameters:
+            user_id: The user whose history is cached.
+            capacity (int): Maximum number of turns kept in memory.
+        """
+        self.user_id = user_id
+        self.capacity = capacity
+        self._turns = deque(maxlen=capacity)
+        self._seeded = False
+        # True when the database holds no turns older than the ones cached
+        self._exhaustive = False
+        self._lock = threading.Lock()
+
+    def seed(self):
+        """Load the most recent turns from the database. Called once at login."""
+        self._load(self.capacity)
+
+    def append(self, conversation):
+        """Record a newly stored turn (a db.Conversation or a turn dict)."""
+        if not isinstance(conversation, dict):
+            conversation = {
+                "timestamp": conversation.timestamp,
+                "user_input": conversation.user_input,
+                "AI_output": conversation.AI_output,
+                "emotion_data": conversation.emotion_data,
+                "session_id": conversation.session_id,
+                "seq": conversation.seq,
+            }
+        with self._lock:
+            if len(self._turns) == self._turns.maxlen:
+                # The oldest turn falls out of memory but stays in the database
+                self._exhaustive = False
+            self._turns.append(conversation)
+
+    def recent(self, limit=5):
+        """Return up to `limit` most recent turns, oldest first."""
+        with self._lock:
+            if self._seeded and (limit <= len(self._turns) or self._exhaustive):
+                return list(self._turns)[-limit:]
+
+        # Cold start, or more history requested than is held in memory
+        return self._load(max(limit, self.capacity))[-limit:]
+
+    def _load(self, limit):
+        turns = DB().get_conversation_history(self.user_id, limit=limit) if self.user_id else []
+        with self._lock:
+            self._turns = deque(turns, maxlen=max(self.capacity, limit))
+            self._seeded = True
+            self._exhaustive = len(turns) < limit
+            return list(self._turns)
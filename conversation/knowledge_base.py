@@ -0,0 +1,69 @@
+# Psychological knowledge base used for semantic retrieval in the mental health conversation workflow
+
+KNOWLEDGE_BASE = [
+    {
+        "id": "anger",
+        "topic": "angry",
+        "text": "Research shows that anger is often a secondary emotion, masking more vulnerable feelings like hurt, fear, or disappointment. Therapeutic approaches include cognitive reframing, mindfulness, and exploring underlying triggers."
+    },
+    {
+        "id": "sadness",
+        "topic": "sad",
+        "text": "Sadness is a natural response to loss or disappointment. Studies indicate that expressing sadness through talking or writing can be therapeutic. Cognitive-behavioral techniques and behavioral activation are evidence-based approaches."
+    },
+    {
+        "id": "happiness",
+        "topic": "happy",
+        "text": "Positive emotions like happiness broaden our thought-action repertoires and build resources. Savoring positive experiences and practicing gratitude can help maintain positive emotional states."
+    },
+    {
+        "id": "fear",
+        "topic": "fearful",
+        "text": "Fear activates the body's fight-or-flight response. Exposure therapy, which gradually confronts feared situations, has strong empirical support for treating anxiety disorders."
+    },
+    {
+        "id": "surprise",
+        "topic": "surprised",
+        "text": "Surprise indicates a mismatch between expectations and reality. This presents an opportunity for learning and adaptation. Helping clients integrate surprising information can lead to cognitive restructuring."
+    },
+    {
+        "id": "flat_affect",
+        "topic": "neutral",
+        "text": "When clients present with flat affect, it's important to explore whether this represents emotional regulation, alexithymia, or potential emotional suppression."
+    },
+    {
+        "id": "disgust",
+        "topic": "disgust",
+        "text": "Disgust protects against contamination but can also be directed at oneself, where it is linked to shame and low self-worth. Self-compassion exercises help clients relate to themselves with less harshness."
+    },
+    {
+        "id": "sleep",
+        "topic": "sleep problems",
+        "text": "Poor sleep both follows from and worsens low mood and anxiety. Cognitive behavioral therapy for insomnia (CBT-I), with consistent wake times, stimulus control and limiting time awake in bed, outperforms sleep medication in the long term."
+    },
+    {
+        "id": "stress",
+        "topic": "stress and overwhelm",
+        "text": "Chronic stress narrows attention and makes problems feel unsolvable. Breaking tasks into small concrete steps, scheduling recovery time and slow diaphragmatic breathing lower physiological arousal and restore a sense of control."
+    },
+    {
+        "id": "loneliness",
+        "topic": "loneliness and isolation",
+        "text": "Loneliness is associated with depression and poorer physical health. Interventions that address maladaptive social cognition, such as expecting rejection, are more effective than simply increasing opportunities for contact."
+    },
+    {
+        "id": "grief",
+        "topic": "grief and loss",
+        "text": "Grief does not follow fixed stages; people oscillate between focusing on the loss and on restoring daily life. Validating this back-and-forth and allowing continuing bonds with the deceased supports healthy adaptation."
+    },
+    {
+        "id": "rumination",
+        "topic": "rumination and worry",
+        "text": "Rumination, repetitively dwelling on problems and their causes, maintains depression and anxiety. Scheduling a limited worry time, shifting from why-questions to how-questions and mindfulness reduce its grip."
+    },
+    {
+        "id": "crisis",
+        "topic": "self-harm and suicidal thoughts",
+        "text": "If someone mentions self-harm or suicidal thoughts, ask directly and calmly about their safety, express care, and encourage them to contact local emergency services or a crisis line immediately. Asking about suicide does not increase risk."
+    },
+]
@@ -0,0 +1,319 @@
+"""
+Concurrent multi-user load generator for the conversation service.
+
+Simulates virtual users that log in, exchange a few text and voice turns with
+think time between them and end their session, while the number of concurrent
+users ramps up in levels (e.g. 1, 2, 4, 8, 16). Every level runs for a fixed
+time and reports throughput, latency percentiles per operation and error rates;
+the report names the saturation point (the level after which throughput stops
+growing or errors appear) and the pipeline stage whose latency grew the most.
+
+Two targets are supported:
+
+    inproc      ConversationManager in this process, with the stand-ins of
+                benchmark.py (fake LLM, in-memory MongoDB, stub face service).
+                Stage latencies come from tracing, reset at every level.
+    http://...  The conversation API served by api.py (`python api.py`):
+                  POST   /sessions                  {"user_name", "user_age", "user_problem"} -> {"session_id", "response"}
+                  POST   /sessions/<id>/turns       {"text"}, or a raw audio/wav body -> {"response"}
+                  DELETE /sessions/<id>
+                Stage latencies are read from --metrics-url (the API's /metrics.json).
+
+    python loadgen.py --target inproc --levels 1,2,4,8 --level-seconds 60 --output load.json
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+from benchmark import UTTERANCES, FakeChatModel, git_commit, peak_rss_mb, prepare_offline_environment, \
+    synthetic_speech_wav
+
+# A level saturates the service when throughput grows by less than this over the previous level...
+SATURATION_GAIN = 1.1
+# ...or when more than this share of operations fails
+SATURATION_ERROR_RATE = 0.05
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return {f"p{q}_ms": round(1000 * samples[min(len(samples) - 1, int(round(q / 100.0 * (len(samples) - 1))))], 1)
+            for q in (50, 95, 99)}
+
+
+class InProcessTarget:
+    """Runs sessions on ConversationManager in this process."""
+
+    def __init__(self, llm_latency_ms=300.0, llm_jitter_ms=50.0, conflict_rate=0.2):
+        self.face_service, self.workdir = prepare_offline_environment()
+        import tracing
+        import conversation_workflow
+        from db import DB, User
+        from speech_to_text import transcribe_audio
+
+        conversation_workflow.llm = FakeChatModel(llm_latency_ms, llm_jitter_ms, conflict_rate)
+        conversation_workflow.load_semantic_memory()
+        self.tracing = tracing
+        self.workflow = conversation_workflow
+        self.db = DB()
+        self.user_class = User
+        self.transcribe_audio = transcribe_audio
+        self.audio_path = synthetic_speech_wav(os.path.join(self.workdir, "speech.wav"))
+
+    def start_session(self, user_name, user_age, user_problem):
+        user = self.user_class(user_name, user_age, user_problem)
+        if not self.db.init_user(user):
+            raise RuntimeError(f"Cannot register {user_name}")
+        with self.tracing.turn("login"):
+            return self.workflow.get_mental_health_workflow(
+                user_name=user_name, user_age=user_age, user_problem=user_problem,
+                is_new_user=True, user_id=str(user.user_id))
+
+    def text_turn(self, session, text):
+        with self.tracing.turn("text_turn", session_id=session.session_id):
+            return session.process_input(text, input_type="text")
+
+    def voice_turn(self, session, fallback_text):
+        with self.tracing.turn("voice_turn", session_id=session.session_id):
+            with self.tracing.span("asr.transcribe"):
+                text = self.transcribe_audio(self.audio_path, model_name="base") or fallback_text
+            return session.process_input(text, input_type="audio", audio_path=self.audio_path)
+
+    def end_session(self, session):
+        try:
+            if not session.sync_session():
+                raise RuntimeError("Session was not saved")
+        finally:
+            session.close()
+
+    def begin_level(self):
+        self.tracing.reset()
+
+    def stage_latencies(self):
+        return self.tracing.snapshot()["stages"]
+
+    def close(self):
+        self.face_service.close()
+
+
+class HttpTarget:
+    """Runs sessions against the conversation API of api.py (see module docstring)."""
+
+    def __init__(self, base_url, metrics_url=None, timeout=120.0):
+        self.base_url = base_url.rstrip("/")
+        self.metrics_url = metrics_url
+        self.timeout = timeout
+        path = synthetic_speech_wav(os.path.join(tempfile.gettempdir(), f"loadgen_speech_{os.getpid()}.wav"))
+        with open(path, "rb") as f:
+            self.audio = f.read()
+        os.remove(path)
+
+    def start_session(self, user_name, user_age, user_problem):
+        response = requests.post(f"{self.base_url}/sessions", timeout=self.timeout,
+                                 json={"user_name": user_name, "user_age": user_age, "user_problem": user_problem})
+        response.raise_for_status()
+        return response.json()["session_id"]
+
+    def text_turn(self, session, text):
+        response = requests.post(f"{self.base_url}/sessions/{session}/turns", json={"text": text},
+                                 timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["response"]
+
+    def voice_turn(self, session, fallback_text):
+        response = requests.post(f"{self.base_url}/sessions/{session}/turns", timeout=self.timeout,
+                                 data=self.audio, headers={"Content-Type": "audio/wav"})
+        response.raise_for_status()
+        return response.json()["response"]
+
+    def end_session(self, session):
+        requests.delete(f"{self.base_url}/sessions/{session}", timeout=self.timeout).raise_for_status()
+
+    def begin_level(self):
+        pass
+
+    def stage_latencies(self):
+        if not self.metrics_url:
+            return {}
+        try:
+            return requests.get(self.metrics_url, timeout=10).json()["stages"]
+        except Exception as e:
+            print("Cannot read stage metrics:", e)
+            return {}
+
+    def close(self):
+        pass
+
+
+class LevelRecorder:
+    """Latencies and errors of every operation within one concurrency level."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.error_samples = []
+        self._lock = threading.Lock()
+
+    def record(self, operation, seconds, error=None):
+        with self._lock:
+            if error is None:
+                self.latencies.setdefault(operation, []).append(seconds)
+            else:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+                if len(self.error_samples) < 10:
+                    self.error_samples.append(f"{operation}: {error}")
+
+    def timed(self, operation, call, *args):
+        started = time.perf_counter()
+        try:
+            result = call(*args)
+        except Exception as e:
+            self.record(operation, time.perf_counter() - started, e)
+            return None, False
+        self.record(operation, time.perf_counter() - started)
+        return result, True
+
+
+def virtual_user(target, recorder, stop, rng, turns_per_session, voice_share, think_median, think_sigma):
+    """Run sessions back to back until `stop` is set, then end the session in progress."""
+    while not stop.is_set():
+        name = f"load-{uuid.uuid4().hex[:10]}"
+        session, ok = recorder.timed("login", target.start_session, name, rng.randint(18, 70), "Stress at work")
+        if not ok:
+            stop.wait(1.0)
+            continue
+        for _ in range(turns_per_session):
+            # Reading the reply and typing or speaking the next message; log-normal like real think times
+            stop.wait(rng.lognormvariate(0, think_sigma) * think_median)
+            text = rng.choice(UTTERANCES)
+            if rng.random() < voice_share:
+                recorder.timed("voice_turn", target.voice_turn, session, text)
+            else:
+                recorder.timed("text_turn", target.text_turn, session, text)
+            if stop.is_set():
+                break
+        recorder.timed("end_session", target.end_session, session)
+
+
+def run_level(target, users, seconds, turns_per_session, voice_share, think_median, think_sigma, seed):
+    target.begin_level()
+    recorder = LevelRecorder()
+    stop = threading.Event()
+    threads = [threading.Thread(target=virtual_user, name=f"virtual-user-{i}", daemon=True,
+                                args=(target, recorder, stop, random.Random(seed * 1000 + i), turns_per_session,
+                                      voice_share, think_median, think_sigma))
+               for i in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    operations = {}
+    completed = failed = 0
+    for operation in sorted(set(recorder.latencies) | set(recorder.errors)):
+        samples = recorder.latencies.get(operation, [])
+        errors = recorder.errors.get(operation, 0)
+        completed += len(samples)
+        failed += errors
+        operations[operation] = {"count": len(samples), "errors": errors,
+                                 "error_rate": round(errors / (len(samples) + errors), 4), **percentiles(samples)}
+    turns = sum(len(recorder.latencies.get(operation, [])) for operation in ("text_turn", "voice_turn"))
+    return {
+        "users": users,
+        "elapsed_seconds": round(elapsed, 1),
+        "turns_per_second": round(turns / elapsed, 3),
+        "error_rate": round(failed / (completed + failed), 4) if completed + failed else 0.0,
+        "operations": operations,
+        "stages": target.stage_latencies(),
+        "error_samples": recorder.error_samples,
+    }
+
+
+def find_saturation(levels):
+    """
+    The last level before throughput stopped growing or errors appeared, and the stage whose
+    p95 latency grew the most from the first level to the saturated one.
+    """
+    saturated = None
+    for previous, level in zip(levels, levels[1:]):
+        if (level["turns_per_second"] < previous["turns_per_second"] * SATURATION_GAIN
+                or level["error_rate"] > SATURATION_ERROR_RATE):
+            saturated = previous, level
+            break
+    if saturated is None:
+        return {"saturated": False, "max_users_tested": levels[-1]["users"] if levels else 0}
+
+    previous, level = saturated
+    growth = {}
+    for stage, stats in level["stages"].items():
+        baseline = levels[0]["stages"].get(stage)
+        if baseline and "p95_ms" in stats and "p95_ms" in baseline:
+            growth[stage] = round(stats["p95_ms"] - baseline["p95_ms"], 1)
+    # Whole-turn spans contain the stages; the bottleneck is the stage itself
+    for wrapper in ("login", "text_turn", "voice_turn", "process_input"):
+        growth.pop(wrapper, None)
+    return {
+        "saturated": True,
+        "saturation_users": previous["users"],
+        "saturation_turns_per_second": previous["turns_per_second"],
+        "first_saturating_stage": max(growth, key=growth.get) if growth else None,
+        "stage_p95_growth_ms": dict(sorted(growth.items(), key=lambda item: item[1], reverse=True)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load generator for the conversation service")
+    parser.add_argument("--target", default="inproc", help="'inproc' or the base URL of a conversation API")
+    parser.add_argument("--metrics-url", default=None,
+                        help="Stage metrics of an HTTP target, e.g. http://host:8000/metrics.json")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Comma separated numbers of concurrent users")
+    parser.add_argument("--level-seconds", type=float, default=60.0, help="Duration of each level")
+    parser.add_argument("--turns-per-session", type=int, default=6, help="Turns before a user ends the session")
+    parser.add_argument("--voice-share", type=float, default=0.3, help="Share of turns sent as voice")
+    parser.add_argument("--think-seconds", type=float, default=8.0, help="Median think time between turns")
+    parser.add_argument("--think-sigma", type=float, default=0.6, help="Spread of the log-normal think time")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Fake LLM latency (inproc only)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if args.target == "inproc":
+        target = InProcessTarget(llm_latency_ms=args.llm_latency_ms)
+    else:
+        target = HttpTarget(args.target, metrics_url=args.metrics_url)
+
+    levels = []
+    try:
+        for users in [int(n) for n in args.levels.split(",")]:
+            level = run_level(target, users, args.level_seconds, args.turns_per_session, args.voice_share,
+                              args.think_seconds, args.think_sigma, args.seed)
+            levels.append(level)
+            print(f"{users:>4} users: {level['turns_per_second']:.2f} turns/s, error rate {level['error_rate']:.2%}")
+    finally:
+        target.close()
+
+    report = {
+        "commit": git_commit(),
+        "target": args.target,
+        "settings": {key: value for key, value in vars(args).items() if key not in ("target", "output")},
+        "levels": levels,
+        "saturation": find_saturation(levels),
+        # Only meaningful when the service runs in this process
+        "peak_rss_mb": peak_rss_mb() if args.target == "inproc" else None,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
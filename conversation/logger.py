@@ -1,21 +1,52 @@
 """
 Logger class using loguru to log messages to a file.
 Implemented as a Singleton to ensure only one instance exists.
+
+Sinks are enqueued: a log call only puts the record on a queue and a background
+thread does the formatting and file I/O, so logging never blocks a turn.
+Configured with:
+    LOG_LEVEL           Default level (INFO).
+    LOG_MODULE_LEVELS   Per-module levels, e.g. "speech_to_text=WARNING,face_emotion=DEBUG".
+    LOG_FORMAT          "text" (default) or "json", one JSON object per line.
+    LOG_SAMPLE_SECONDS  Messages logged with a `sample_key` are written at most once per
+                        this many seconds per key; the rest are counted and reported (5).
+Records logged inside a tracing turn carry its turn_id and session_id.
 """
+import atexit
 import os
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
 from loguru import logger
 
+load_dotenv()
+
+TEXT_FORMAT = ("{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | turn={extra[turn_id]} | "
+               "{name}:{function}:{line} - {message}")
+
+
+def _level_filter():
+    """loguru filter dict: the default level plus LOG_MODULE_LEVELS overrides."""
+    levels = {"": os.getenv("LOG_LEVEL", "INFO").upper()}
+    for item in os.getenv("LOG_MODULE_LEVELS", "").split(","):
+        module, _, level = item.partition("=")
+        if module.strip() and level.strip():
+            levels[module.strip()] = level.strip().upper()
+    return levels
+
 
 class Logger:
     _instance = None
-    
+
     def __new__(cls, log_file_path="logs/conversation.log"):
         if cls._instance is None:
             cls._instance = super(Logger, cls).__new__(cls)
             cls._instance.log_file_path = log_file_path
             cls._instance.setup_logger()
         return cls._instance
-    
+
     def __init__(self, log_file_path="logs/conversation.log"):
         # The initialization is done in __new__, this prevents re-initialization
         # when the instance already exists
@@ -31,17 +62,57 @@ class Logger:
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
 
-        logger.add(self.log_file_path, rotation="500 MB", compression="zip")
+        self.sample_seconds = float(os.getenv("LOG_SAMPLE_SECONDS", "5"))
+        self._samples = {}  # sample_key -> [next time it may be written, suppressed count]
+        self._samples_lock = threading.Lock()
 
-    def log(self, message):
-        # Use opt(depth=1) to show the correct caller location
-        logger.opt(depth=1).info(message)
+        serialize = os.getenv("LOG_FORMAT", "text").lower() == "json"
+        levels = _level_filter()
+        logger.configure(extra={"turn_id": "-", "session_id": "-"})
+        # Replace loguru's default synchronous stderr handler
+        logger.remove()
+        logger.add(sys.stderr, level=0, filter=levels, format=TEXT_FORMAT, serialize=serialize, enqueue=True)
+        logger.add(self.log_file_path, rotation="500 MB", compression="zip", level=0, filter=levels,
+                   format=TEXT_FORMAT, serialize=serialize, enqueue=True)
+        # Write out what is still queued when the process exits
+        atexit.register(logger.remove)
+
+    def context(self, **ids):
+        """Attach IDs (e.g. turn_id, session_id) to every record logged within this context manager."""
+        return logger.contextualize(**ids)
 
-    def log_error(self, message):
+    def _sampled(self, sample_key, message):
+        """The message to write for this sample key, or None while the key is rate limited."""
+        if sample_key is None:
+            return message
+        now = time.monotonic()
+        with self._samples_lock:
+            state = self._samples.setdefault(sample_key, [0.0, 0])
+            if now < state[0]:
+                state[1] += 1
+                return None
+            suppressed, state[0], state[1] = state[1], now + self.sample_seconds, 0
+        return f"{message} ({suppressed} similar messages suppressed)" if suppressed else message
+
+    def log_debug(self, message, sample_key=None):
+        message = self._sampled(sample_key, message)
+        if message is not None:
+            logger.opt(depth=1).debug(message)
+
+    def log(self, message, sample_key=None):
         # Use opt(depth=1) to show the correct caller location
-        logger.opt(depth=1).error(message)
+        message = self._sampled(sample_key, message)
+        if message is not None:
+            logger.opt(depth=1).info(message)
 
-    def log_warning(self, message):
+    def log_error(self, message, sample_key=None):
         # Use opt(depth=1) to show the correct caller location
-        logger.opt(depth=1).warning(message)
+        message = self._sampled(sample_key, message)
+        if message is not None:
+            logger.opt(depth=1).error(message)
 
+    def log_warning(self, message, sample_key=None):
+        # Use opt(depth=1) to show the correct caller location
+        message = self._sampled(sample_key, message)
+        if message is not None:
+            logger.opt(depth=1).warning(message)
@@ -0,0 +1,113 @@
+"""
+Background long-term memory summarizer.
+
+Keeps one compact, versioned summary per user in the `user_profiles` collection.
+Each update folds only the turns stored since the previous version into the old
+summary, so the cost of an update does not grow with the length of the history,
+and the summary itself stays within a fixed word budget. New sessions load it
+with a single read instead of inlining raw past turns into the prompt.
+
+Updates run on a background thread; ConversationManager only schedules users.
+"""
+import os
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+
+from db import DB
+from logger import Logger
+from prompts import PROFILE_SUMMARY_PROMPT
+
+load_dotenv()
+
+# Summarize after this many new turns within a session (and always when a session ends)
+PROFILE_SUMMARY_EVERY = int(os.getenv("PROFILE_SUMMARY_EVERY", "5"))
+PROFILE_SUMMARY_MAX_WORDS = int(os.getenv("PROFILE_SUMMARY_MAX_WORDS", "200"))
+# Upper bound on turns folded into the summary per LLM call
+PROFILE_SUMMARY_BATCH = 50
+
+
+class ProfileSummarizer:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(ProfileSummarizer, cls).__new__(cls)
+                cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, llm=None):
+        """
+        Parameters:
+            llm: LangChain chat model used to write the summaries. Required on first use.
+        """
+        if self._initialized:
+            return
+        if llm is None:
+            raise ValueError("ProfileSummarizer needs an llm the first time it is created")
+        self.llm = llm
+        self.logger = Logger()
+        self._pending = deque()
+        self._scheduled = set()
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name="profile-summarizer", daemon=True)
+        self._worker.start()
+        self._initialized = True
+
+    def schedule(self, user_id) -> None:
+        """Ask for the user's summary to be brought up to date. Never blocks."""
+        if not user_id:
+            return
+        user_id = str(user_id)
+        with self._condition:
+            if user_id in self._scheduled:
+                return
+            self._scheduled.add(user_id)
+            self._pending.append(user_id)
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                user_id = self._pending.popleft()
+                self._scheduled.discard(user_id)
+            try:
+                self.update(user_id)
+            except Exception as e:
+                self.logger.log_error(f"Failed to update memory summary for user {user_id}: {e}")
+
+    def update(self, user_id) -> bool:
+        """
+        Fold the user's turns stored since the last summary into a new summary version.
+
+        Returns:
+            bool: True if a new version was stored.
+        """
+        db = DB()
+        profile = db.get_user_profile(user_id) or {}
+        version = profile.get("version", 0)
+        turns = db.get_conversations_since(user_id, profile.get("summarized_until"), limit=PROFILE_SUMMARY_BATCH)
+        if not turns:
+            return False
+
+        prompt = PROFILE_SUMMARY_PROMPT.format(
+            summary=profile.get("summary", ""),
+            turns="\n".join(f"User: {t.get('user_input', '')}\nAI: {t.get('AI_output', '')}" for t in turns),
+            max_words=PROFILE_SUMMARY_MAX_WORDS
+        )
+        summary = self.llm.invoke(prompt).content.strip()
+
+        if not db.save_user_profile(user_id, summary, version, turns[-1]["timestamp"]):
+            self.logger.log_warning(f"Memory summary of user {user_id} changed concurrently; update discarded")
+            return False
+
+        self.logger.log(f"Memory summary of user {user_id} updated to version {version + 1} ({len(turns)} new turns)")
+        if len(turns) == PROFILE_SUMMARY_BATCH:
+            # More backlog than fits in one call; continue with the next batch
+            self.schedule(user_id)
+        return True
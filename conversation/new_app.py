@@ -1,17 +1,20 @@
 import os
+import uuid
 import streamlit as st
+import streamlit.components.v1 as components
 from dotenv import load_dotenv
 import tempfile
 import base64
-from datetime import datetime
 from audiorecorder import audiorecorder  # Add this import
 
 from speech_to_text import transcribe_audio
 from emotion_analyzer import EmotionAnalyzer
 from text_to_speech import text_to_speech
-from db import DB, User, Conversation
+from db import DB, User
 from logger import Logger
-from conversation_workflow import get_mental_health_workflow
+from conversation_workflow import get_mental_health_workflow, load_semantic_memory
+import profiling
+import tracing
 
 from rich.traceback import install
 
@@ -21,10 +24,19 @@ install(show_locals=True, width=200)  # width 可调，比如 150 或 200
 # Load environment variables
 load_dotenv()
 
+# The deepface service as the browser reaches it (FACE_SERVICE_URL is how this server reaches it)
+FACE_PUBLIC_URL = os.getenv("FACE_PUBLIC_URL", "http://localhost:5005").rstrip("/")
+# Upload each browser's camera as its own face session; false shows the deepface host's camera
+FACE_BROWSER_CAMERA = os.getenv("FACE_BROWSER_CAMERA", "true").lower() == "true"
+FACE_UPLOAD_FPS = float(os.getenv("FACE_UPLOAD_FPS", "5"))
+FACE_UPLOAD_WIDTH = 320
+
 # Initialize components
 db = DB()
 analyzer = EmotionAnalyzer()
 logger = Logger()
+tracing.start_metrics_server()
+load_semantic_memory()
 
 # Initialize session state
 if 'user' not in st.session_state:
@@ -36,89 +48,160 @@ if 'messages' not in st.session_state:
 
 def initialize_user(user_name):
     """Initialize user session by checking if user exists"""
-    existing_user = db.get_user_by_name(user_name)
-    if existing_user:
-        st.session_state.user = existing_user
-        # Initialize conversation manager with existing user
-        st.session_state.conversation_manager = get_mental_health_workflow(
-            user_name=existing_user.user_name,
-            user_age=existing_user.user_age, 
-            user_problem=existing_user.user_problem,
-            is_new_user=False,
-            user_id=str(existing_user.user_id)
-        )
-        
-        # Get the greeting from the conversation manager
-        greeting = st.session_state.conversation_manager.last_response
-        st.session_state.messages.append({"role": "assistant", "content": greeting})
-        return True
-    else:
-        return False
+    with tracing.turn("login"):
+        with tracing.span("db.get_user_by_name"):
+            existing_user = db.get_user_by_name(user_name)
+        if existing_user:
+            st.session_state.user = existing_user
+            # Initialize conversation manager with existing user
+            st.session_state.conversation_manager = get_mental_health_workflow(
+                user_name=existing_user.user_name,
+                user_age=existing_user.user_age, 
+                user_problem=existing_user.user_problem,
+                is_new_user=False,
+                user_id=str(existing_user.user_id),
+                face_session_id=face_session_requested()
+            )
+
+            # Get the greeting from the conversation manager
+            greeting = st.session_state.conversation_manager.last_response
+            st.session_state.messages.append({"role": "assistant", "content": greeting})
+            return True
+        else:
+            return False
 
 def register_new_user(user_name, user_age, user_problem):
     """Register a new user"""
     new_user = User(user_name, user_age, user_problem)
-    success = db.init_user(new_user)
-    
-    if success:
-        st.session_state.user = new_user
-        # Initialize conversation manager with new user
-        st.session_state.conversation_manager = get_mental_health_workflow(
-            user_name=user_name,
-            user_age=user_age,
-            user_problem=user_problem,
-            is_new_user=True,
-            user_id=str(new_user.user_id)
-        )
+    with tracing.turn("register"):
+        with tracing.span("db.init_user"):
+            success = db.init_user(new_user)
         
-        # Get the greeting from the conversation manager
-        greeting = st.session_state.conversation_manager.last_response
-        st.session_state.messages.append({"role": "assistant", "content": greeting})
-        return True
+        if success:
+            st.session_state.user = new_user
+            # Initialize conversation manager with new user
+            st.session_state.conversation_manager = get_mental_health_workflow(
+                user_name=user_name,
+                user_age=user_age,
+                user_problem=user_problem,
+                is_new_user=True,
+                user_id=str(new_user.user_id),
+                face_session_id=face_session_requested()
+            )
+
+            # Get the greeting from the conversation manager
+            greeting = st.session_state.conversation_manager.last_response
+            st.session_state.messages.append({"role": "assistant", "content": greeting})
+            return True
     return False
 
+def face_session_requested():
+    """
+    The deepface session carrying this browser's camera frames: ?face_session=<id>, else one
+    this browser session uploads to itself, or None (FACE_SESSION_ID) without the browser camera.
+    """
+    if st.query_params.get("face_session"):
+        return st.query_params.get("face_session")
+    if not FACE_BROWSER_CAMERA:
+        return None
+    if 'face_session_id' not in st.session_state:
+        st.session_state.face_session_id = uuid.uuid4().hex
+    return st.session_state.face_session_id
+
+def camera_uploader(face_session_id):
+    """
+    Preview the browser's camera and upload downscaled JPEG frames to the deepface session.
+    The frames are posted as multipart forms, which need no CORS preflight, so the deepface
+    service does not have to allow this origin; the responses are not read.
+    """
+    components.html(f"""
+        <video id="preview" autoplay playsinline muted
+            style="width: 100%; border-radius: 10px; border: 2px solid #ccc;"></video>
+        <div id="camera-status" style="font: 12px sans-serif; color: #888;"></div>
+        <script>
+            const uploadUrl = "{FACE_PUBLIC_URL}/sessions/{face_session_id}/frames";
+            const video = document.getElementById("preview");
+            const canvas = document.createElement("canvas");
+            navigator.mediaDevices.getUserMedia({{video: true, audio: false}}).then((stream) => {{
+                video.srcObject = stream;
+                let uploading = false;
+                setInterval(() => {{
+                    if (uploading || !video.videoWidth) return;
+                    canvas.width = {FACE_UPLOAD_WIDTH};
+                    canvas.height = Math.round(video.videoHeight * canvas.width / video.videoWidth);
+                    canvas.getContext("2d").drawImage(video, 0, 0, canvas.width, canvas.height);
+                    uploading = true;
+                    canvas.toBlob((blob) => {{
+                        const form = new FormData();
+                        form.append("frame", blob, "frame.jpg");
+                        fetch(uploadUrl, {{method: "POST", body: form, mode: "no-cors"}})
+                            .catch(() => {{}})
+                            .finally(() => {{ uploading = false; }});
+                    }}, "image/jpeg", 0.8);
+                }}, {1000.0 / FACE_UPLOAD_FPS});
+            }}).catch((e) => {{
+                document.getElementById("camera-status").textContent = "Camera unavailable: " + e.message;
+            }});
+        </script>
+    """, height=300)
+
+def profiling_requested(manager):
+    """Profile this session's turns if configured for its user or requested with ?profile=1."""
+    if st.query_params.get("profile") == "1":
+        manager.profiling = True
+    return manager.profiling
+
 def process_text_input(text_input):
     """Process text input and generate response"""
     if not st.session_state.conversation_manager:
         return "Please login first."
     
-    # Get response from conversation manager
-    response_text = st.session_state.conversation_manager.process_input(
-        user_input=text_input,
-        input_type="text"
-    )
-    
-    # Generate audio response
-    try:
-        audio_data = text_to_speech(response_text)
-        return response_text, audio_data
-    except Exception as e:
-        logger.log_error(f"Error during text-to-speech conversion: {e}")
-        return response_text, None
-
-def process_audio_input(audio_file):
-    """Process audio input and generate response"""
-    if not st.session_state.conversation_manager:
-        return "Please login first.", None
-    
-    try:
-        # Transcribe audio to text
-        transcribed_text = transcribe_audio(audio_file, model_name="base")
-        
+    manager = st.session_state.conversation_manager
+    with tracing.turn("text_turn", session_id=manager.session_id), \
+            profiling.profile("text_turn", profiling_requested(manager)):
         # Get response from conversation manager
-        response_text = st.session_state.conversation_manager.process_input(
-            user_input=transcribed_text,
-            input_type="audio",
-            audio_path=audio_file
+        response_text = manager.process_input(
+            user_input=text_input,
+            input_type="text"
         )
         
         # Generate audio response
         try:
-            audio_data = text_to_speech(response_text)
-            return response_text, audio_data, transcribed_text
+            with tracing.span("tts.synthesize"):
+                audio_data = text_to_speech(response_text)
+            return response_text, audio_data
         except Exception as e:
             logger.log_error(f"Error during text-to-speech conversion: {e}")
-            return response_text, None, transcribed_text
+            return response_text, None
+
+def process_audio_input(audio_file):
+    """Process audio input and generate response"""
+    if not st.session_state.conversation_manager:
+        return "Please login first.", None
+    
+    manager = st.session_state.conversation_manager
+    try:
+        with tracing.turn("audio_turn", session_id=manager.session_id), \
+                profiling.profile("audio_turn", profiling_requested(manager)):
+            # Transcribe audio to text
+            with tracing.span("asr.transcribe"):
+                transcribed_text = transcribe_audio(audio_file, model_name="base")
+            
+            # Get response from conversation manager
+            response_text = manager.process_input(
+                user_input=transcribed_text,
+                input_type="audio",
+                audio_path=audio_file
+            )
+            
+            # Generate audio response
+            try:
+                with tracing.span("tts.synthesize"):
+                    audio_data = text_to_speech(response_text)
+                return response_text, audio_data, transcribed_text
+            except Exception as e:
+                logger.log_error(f"Error during text-to-speech conversion: {e}")
+                return response_text, None, transcribed_text
     except Exception as e:
         logger.log_error(f"Failed to process audio: {e}")
         return f"Error processing audio: {e}", None, None
@@ -127,12 +210,12 @@ def autoplay_audio(audio_data):
     """Play audio using Streamlit's native audio player"""
     try:
         # Log audio data details for debugging
-        logger.log(f"Audio data type: {type(audio_data)}, size: {len(audio_data) if audio_data else 'None'}")
+        logger.log_debug(f"Audio data type: {type(audio_data)}, size: {len(audio_data) if audio_data else 'None'}")
         
         # Check if it's a file path (string ending with .mp3 or .wav)
         if isinstance(audio_data, str) and (audio_data.endswith(".mp3") or ".wav" in audio_data):
             # It's a file path, read the content
-            logger.log(f"Audio data is a file path: {audio_data}")
+            logger.log_debug(f"Audio data is a file path: {audio_data}")
             file_format = "audio/mp3" if audio_data.endswith(".mp3") else "audio/wav"
             with open(audio_data, "rb") as audio_file:
                 audio_data = audio_file.read()
@@ -182,7 +265,7 @@ def autoplay_audio(audio_data):
         """, unsafe_allow_html=True)
         
         # Use Streamlit's native audio player with the correct format
-        logger.log(f"Playing audio with format: {file_format}")
+        logger.log_debug(f"Playing audio with format: {file_format}")
         st.audio(
             data=audio_data,
             format=file_format,
@@ -190,34 +273,18 @@ def autoplay_audio(audio_data):
             autoplay=True
         )
         
-        logger.log("Audio playback started using Streamlit's audio player")
+        logger.log_debug("Audio playback started using Streamlit's audio player")
     except Exception as e:
         logger.log_error(f"Error in autoplay_audio: {e}")
 
 def save_conversation_history():
     """Save the current conversation history to the database"""
-    if not st.session_state.user or not st.session_state.messages:
+    if not st.session_state.user or not st.session_state.conversation_manager:
         return False
     
     try:
-        # Convert the messages to the format expected by the database
-        for i in range(0, len(st.session_state.messages), 2):
-            # Ensure we have both user and assistant messages
-            if i+1 < len(st.session_state.messages):
-                user_msg = st.session_state.messages[i]
-                assistant_msg = st.session_state.messages[i+1]
-                
-                # Create a conversation object
-                conversation = Conversation(
-                    user_input=user_msg["content"],
-                    AI_output=assistant_msg["content"],
-                    timestamp=datetime.now()
-                )
-                
-                # Save to database
-                db.update_conversation(st.session_state.user, conversation)
-        
-        return True
+        # Turns are persisted as they happen; this only ships the ones not yet acknowledged
+        return st.session_state.conversation_manager.sync_session()
     except Exception as e:
         logger.log_error(f"Error saving conversation history: {e}")
         return False
@@ -303,7 +370,7 @@ def main():
                 with st.chat_message(message["role"]):
                     st.write(message["content"])
                     if message.get("audio"):
-                        logger.log(f"Playing audio for message")
+                        logger.log_debug(f"Playing audio for message")
                         autoplay_audio(message["audio"])
             
             # Input methods
@@ -374,14 +441,18 @@ def main():
                     st.success("Conversation ended. Your chat history has been saved!")
                     # Reset conversation but keep user logged in
                     st.session_state.messages = []
+                    ended_manager = st.session_state.conversation_manager
                     # Re-initialize conversation manager to get a fresh greeting
                     st.session_state.conversation_manager = get_mental_health_workflow(
                         user_name=st.session_state.user.user_name,
                         user_age=st.session_state.user.user_age, 
                         user_problem=st.session_state.user.user_problem,
                         is_new_user=False,
-                        user_id=str(st.session_state.user.user_id)
+                        user_id=str(st.session_state.user.user_id),
+                        face_session_id=face_session_requested()
                     )
+                    # Released after the new conversation holds the face session, so its stream stays open
+                    ended_manager.close()
                     # Get the greeting from the conversation manager
                     greeting = st.session_state.conversation_manager.last_response
                     st.session_state.messages.append({"role": "assistant", "content": greeting})
@@ -393,12 +464,19 @@ def main():
             
             # Video feed
             st.subheader("Emotion Analysis")
-            st.markdown("""
-                <div style="display: flex; justify-content: center;">
-                    <img src="http://localhost:5005/video_feed" width="100%" 
-                        style="border-radius: 10px; border: 2px solid #ccc;">
-                </div>
-            """, unsafe_allow_html=True)
+            face_session_id = st.session_state.conversation_manager.face_session_id
+            if face_session_id and face_session_id == st.session_state.get("face_session_id"):
+                # This browser's camera is the user's face session
+                camera_uploader(face_session_id)
+            elif face_session_id:
+                st.caption(f"Facial emotion from face session {face_session_id}")
+            else:
+                st.markdown(f"""
+                    <div style="display: flex; justify-content: center;">
+                        <img src="{FACE_PUBLIC_URL}/video_feed" width="100%" 
+                            style="border-radius: 10px; border: 2px solid #ccc;">
+                    </div>
+                """, unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
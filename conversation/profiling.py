@@ -0,0 +1,155 @@
+"""
+Opt-in per-turn profiling with speedscope output.
+
+A profiled turn is sampled by a background thread that records the call stack
+of the turn's thread every PROFILE_INTERVAL_MS. When the turn ends, the samples
+are written as a speedscope file (https://www.speedscope.app, drop the file on
+the page for a flame graph) to PROFILE_DIR, which keeps the newest
+PROFILE_MAX_FILES profiles.
+
+Profiling is enabled for every turn with PROFILE_TURNS=true, for the sessions of
+the users listed in PROFILE_USERS, or per session by setting
+ConversationManager.profiling (the Streamlit app does so for `?profile=1`).
+Turns that are not profiled only pay for one boolean check.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+import tracing
+from logger import Logger
+
+load_dotenv()
+
+PROFILE_TURNS = os.getenv("PROFILE_TURNS", "false").lower() == "true"
+PROFILE_USERS = {name.strip() for name in os.getenv("PROFILE_USERS", "").split(",") if name.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("logs", "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+_active = contextvars.ContextVar("profiling_active", default=False)
+_rotate_lock = threading.Lock()
+
+
+def enabled_for(user_name=None) -> bool:
+    """Whether sessions of this user are profiled by default."""
+    return PROFILE_TURNS or (user_name is not None and user_name in PROFILE_USERS)
+
+
+class StackSampler:
+    """Samples the call stack of one thread at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames = []  # speedscope frames: {"name", "file", "line"}
+        self._frame_index = {}
+        self.samples = []  # Stacks as frame indexes, root first
+        self.weights = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="turn-profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.ended = time.perf_counter()
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                self._record(frame, now - last)
+            last = now
+
+    def _record(self, frame, weight):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            index = self._frame_index.get(key)
+            if index is None:
+                index = self._frame_index[key] = len(self.frames)
+                self.frames.append({"name": getattr(code, "co_qualname", code.co_name),
+                                    "file": code.co_filename, "line": code.co_firstlineno})
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        self.samples.append(stack)
+        self.weights.append(weight)
+
+    def speedscope(self, name) -> dict:
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "conversation profiling",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self.frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.ended - self.started,
+                "samples": self.samples,
+                "weights": self.weights,
+            }],
+        }
+
+
+def _write(name, sampler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    turn_id = tracing.current_turn_id() or "noturn"
+    path = os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S}_{turn_id}_{name}.speedscope.json")
+    with open(path, "w") as f:
+        json.dump(sampler.speedscope(f"{name} {turn_id}"), f)
+
+    # Keep only the newest PROFILE_MAX_FILES profiles
+    with _rotate_lock:
+        profiles = sorted((entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".speedscope.json")),
+                          key=lambda entry: entry.stat().st_mtime)
+        for entry in profiles[:max(0, len(profiles) - PROFILE_MAX_FILES)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+    return path
+
+
+@contextmanager
+def _profile(name):
+    sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000.0)
+    token = _active.set(True)
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        _active.reset(token)
+        try:
+            path = _write(name, sampler)
+            Logger().log(f"Profile of {name} ({len(sampler.samples)} samples) written to {path}")
+        except Exception as e:
+            Logger().log_error(f"Failed to write profile of {name}: {e}")
+
+
+def profile(name, enabled):
+    """
+    Profile the enclosed code into one speedscope file if `enabled`. Inside an already
+    profiled block this does nothing, so the outermost block (e.g. the handler) owns the profile.
+    """
+    if not enabled or _active.get():
+        return nullcontext()
+    return _profile(name)
@@ -53,4 +53,27 @@ Should this conversation end or continue? Consider:
 2. If the conversation has reached a natural conclusion
 
 Answer with only one word: continue or end.
-""" 
\ No newline at end of file
+""" 
+
+# Memory context injected before the latest user message
+MEMORY_CONTEXT_PROMPT = """Use the following background when it helps you respond. Do not quote it verbatim.
+
+{context}
+"""
+
+# Incremental long-term memory summary update prompt
+PROFILE_SUMMARY_PROMPT = """
+You maintain a concise long-term memory of a client for a mental health consultant.
+
+Current summary (may be empty):
+{summary}
+
+New conversation turns since the summary was written:
+{turns}
+
+Rewrite the summary so that it also reflects the new turns. Keep what is still relevant:
+the client's main concerns, recurring emotions and triggers, coping strategies tried and
+how they worked, important life events, and agreed next steps. Drop small talk.
+
+Write at most {max_words} words in plain prose, without headings.
+"""
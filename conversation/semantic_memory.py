@@ -0,0 +1,188 @@
+"""
+Local semantic memory: a psychological knowledge base plus each user's past turns,
+embedded on CPU and searched with on-disk vector indexes.
+
+Layout under SEMANTIC_MEMORY_DIR (default: data/semantic_memory):
+
+- knowledge_base/      index of knowledge_base.KNOWLEDGE_BASE, rebuilt when the
+                       corpus or the embedding model changes
+- users/<user_id>/     one append-only index of past turns per user
+
+Per-user indexes are opened lazily and kept in a small LRU, so memory use is
+bounded by the number of recently active users rather than the user base.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from embeddings import Embedder
+from knowledge_base import KNOWLEDGE_BASE
+from logger import Logger
+from vector_index import VectorIndex
+
+FINGERPRINT_FILE = "fingerprint.json"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def turn_key(conversation) -> str:
+    """Stable identifier of a stored turn, matching the (session_id, seq) key in the DB."""
+    if isinstance(conversation, dict):
+        return f"{conversation.get('session_id')}:{conversation.get('seq')}"
+    return f"{conversation.session_id}:{conversation.seq}"
+
+
+def turn_text(conversation) -> str:
+    if isinstance(conversation, dict):
+        return f"User: {conversation.get('user_input', '')}\nAI: {conversation.get('AI_output', '')}"
+    return f"User: {conversation.user_input}\nAI: {conversation.AI_output}"
+
+
+class SemanticMemory:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(SemanticMemory, cls).__new__(cls)
+                cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        # Loading takes a while; concurrent first callers wait for one load
+        with self._instance_lock:
+            if self._initialized:
+                return
+            load_dotenv()
+            self.logger = Logger()
+            self.root = os.getenv("SEMANTIC_MEMORY_DIR", os.path.join("data", "semantic_memory"))
+            self.max_open_user_indexes = int(os.getenv("SEMANTIC_MEMORY_OPEN_USERS", "32"))
+            self.embedder = Embedder()
+            self.knowledge_index = self._open_knowledge_base()
+            self._user_indexes = OrderedDict()
+            self._user_indexes_lock = threading.Lock()
+            self._initialized = True
+
+    def _open_knowledge_base(self) -> VectorIndex:
+        directory = os.path.join(self.root, "knowledge_base")
+        fingerprint = hashlib.sha256(
+            json.dumps([self.embedder.model_name, KNOWLEDGE_BASE], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+        fingerprint_path = os.path.join(directory, FINGERPRINT_FILE)
+        if os.path.exists(fingerprint_path):
+            with open(fingerprint_path, "r", encoding="utf-8") as f:
+                if json.load(f).get("fingerprint") == fingerprint:
+                    return VectorIndex(directory, self.embedder.dim)
+            # Corpus or model changed: the stored vectors are stale
+            shutil.rmtree(directory)
+
+        self.logger.log(f"Building knowledge base index with {len(KNOWLEDGE_BASE)} passages")
+        index = VectorIndex(directory, self.embedder.dim)
+        vectors = self.embedder.embed([entry["text"] for entry in KNOWLEDGE_BASE])
+        index.add(vectors, [dict(entry, key=entry["id"]) for entry in KNOWLEDGE_BASE])
+        with open(fingerprint_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint}, f)
+        return index
+
+    def user_index(self, user_id) -> VectorIndex:
+        """The index of one user's past turns, opened on first use."""
+        user_id = str(user_id)
+        with self._user_indexes_lock:
+            index = self._user_indexes.get(user_id)
+            if index is not None:
+                self._user_indexes.move_to_end(user_id)
+                return index
+            index = VectorIndex(os.path.join(self.root, "users", user_id), self.embedder.dim)
+            self._user_indexes[user_id] = index
+            if len(self._user_indexes) > self.max_open_user_indexes:
+                self._user_indexes.popitem(last=False)
+            return index
+
+    def add_turns(self, user_id, conversations) -> int:
+        """Embed turns (db.Conversation objects or turn dicts) and add them to the user's index."""
+        if not user_id or not conversations:
+            return 0
+        index = self.user_index(user_id)
+        conversations = [c for c in conversations if not index.contains(turn_key(c))]
+        if not conversations:
+            return 0
+        vectors = self.embedder.embed([turn_text(c) for c in conversations])
+        return self.add_embedded_turns(user_id, conversations, vectors)
+
+    def add_embedded_turns(self, user_id, conversations, vectors) -> int:
+        """Add turns whose embeddings were already computed, e.g. by the embedding pipeline."""
+        if not user_id or not conversations:
+            return 0
+        return self.user_index(user_id).add(vectors, [self._turn_payload(c) for c in conversations])
+
+    @staticmethod
+    def _turn_payload(conversation) -> dict:
+        if isinstance(conversation, dict):
+            session_id, seq, timestamp = conversation.get("session_id"), conversation.get("seq"), conversation.get("timestamp")
+        else:
+            session_id, seq, timestamp = conversation.session_id, conversation.seq, conversation.timestamp
+        return {
+            "key": turn_key(conversation),
+            "session_id": session_id,
+            "seq": seq,
+            "timestamp": str(timestamp),
+            "text": turn_text(conversation),
+        }
+
+    def build_context(self, user_id, query, token_budget=400, exclude_session=None, k=3) -> str:
+        """
+        Retrieve relevant knowledge-base passages and past turns for a query and
+        format them as prompt context that fits within `token_budget` tokens.
+
+        Parameters:
+            user_id: Whose past turns to search; None searches the knowledge base only.
+            query (str): The text to retrieve context for, usually the user's message.
+            token_budget (int): Approximate maximum size of the returned context.
+            exclude_session (str, optional): Session whose turns are already in the prompt.
+            k (int): Maximum number of results per source.
+        """
+        if token_budget <= 0 or not query:
+            return ""
+
+        query_vector = self.embedder.embed_one(query)
+        knowledge = self.knowledge_index.search(query_vector, k=k, min_score=0.2)
+        past_turns = []
+        if user_id:
+            # Over-fetch so turns from the excluded session do not crowd out older ones
+            for score, payload in self.user_index(user_id).search(query_vector, k=3 * k, min_score=0.3):
+                if payload.get("session_id") != exclude_session:
+                    past_turns.append((score, payload))
+            past_turns = past_turns[:k]
+
+        sections = [
+            ("Relevant psychological information:", [payload["text"] for _, payload in knowledge]),
+            ("Related moments from earlier conversations:", [payload["text"] for _, payload in past_turns]),
+        ]
+
+        lines = []
+        used = 0
+        for heading, passages in sections:
+            if not passages:
+                continue
+            heading_cost = estimate_tokens(heading)
+            for i, passage in enumerate(passages):
+                cost = estimate_tokens(passage) + (heading_cost if i == 0 else 0)
+                if used + cost > token_budget:
+                    break
+                if i == 0:
+                    lines.append(heading)
+                lines.append(passage)
+                used += cost
+        return "\n".join(lines)
@@ -4,6 +4,7 @@ import os
 import shutil
 import tempfile
 import subprocess
+import uuid
 from logger import Logger
 from pathlib import Path
 from test_whisper import test_whisper_transcription  # Import the encapsulated function
@@ -20,7 +21,7 @@ def check_ffmpeg_installation():
                                text=True,
                                check=False)
         if result.returncode == 0:
-            logger.log(f"FFmpeg is installed: {result.stdout.splitlines()[0]}")
+            logger.log_debug(f"FFmpeg is installed: {result.stdout.splitlines()[0]}", sample_key="ffmpeg_check")
             return True
         else:
             logger.log_error(f"FFmpeg check failed: {result.stderr}")
@@ -55,7 +56,7 @@ def transcribe_audio(audio_input, model_name="base") -> str:
         
         # Convert to Path object for more reliable path handling
         audio_path = Path(audio_input)
-        logger.log(f"Original audio path: {audio_path}")
+        logger.log_debug(f"Original audio path: {audio_path}")
         
         # Ensure audio_input is a valid file path
         if not audio_path.exists():
@@ -69,12 +70,13 @@ def transcribe_audio(audio_input, model_name="base") -> str:
         
         # Create a temporary copy of the file with a .wav extension to ensure compatibility
         temp_dir = tempfile.gettempdir()
-        temp_file = os.path.join(temp_dir, f"whisper_audio_{os.getpid()}.wav")
-        logger.log(f"Creating temporary audio file at: {temp_file}")
+        # Unique per call: several sessions may transcribe at the same time
+        temp_file = os.path.join(temp_dir, f"whisper_audio_{os.getpid()}_{uuid.uuid4().hex}.wav")
+        logger.log_debug(f"Creating temporary audio file at: {temp_file}")
         
         # Convert the audio file to WAV format using FFmpeg directly for better control
         try:
-            logger.log(f"Converting audio to WAV format using FFmpeg...")
+            logger.log_debug(f"Converting audio to WAV format using FFmpeg...")
             result = subprocess.run(
                 ["ffmpeg", "-y", "-i", str(audio_path), "-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le", temp_file],
                 stdout=subprocess.PIPE,
@@ -82,7 +84,7 @@ def transcribe_audio(audio_input, model_name="base") -> str:
                 text=True,
                 check=True
             )
-            logger.log(f"FFmpeg conversion successful")
+            logger.log_debug(f"FFmpeg conversion successful")
         except subprocess.CalledProcessError as e:
             logger.log_error(f"FFmpeg conversion failed: {e.stderr}")
             # Fallback to direct copy if conversion fails
@@ -93,10 +95,10 @@ def transcribe_audio(audio_input, model_name="base") -> str:
             logger.log_error(f"Failed to create temporary file at: {temp_file}")
             raise IOError(f"Failed to create temporary file at: {temp_file}")
             
-        logger.log(f"Temporary file created successfully, size: {os.path.getsize(temp_file)} bytes")
+        logger.log_debug(f"Temporary file created successfully, size: {os.path.getsize(temp_file)} bytes")
         
         # Call the test_whisper_transcription function instead of using whisper directly
-        logger.log(f"Calling test_whisper_transcription function")
+        logger.log_debug(f"Calling test_whisper_transcription function")
         result = test_whisper_transcription(temp_file)
         
         if result["success"]:
@@ -116,6 +118,6 @@ def transcribe_audio(audio_input, model_name="base") -> str:
         if temp_file and os.path.exists(temp_file):
             try:
                 os.remove(temp_file)
-                logger.log(f"Temporary file removed: {temp_file}")
+                logger.log_debug(f"Temporary file removed: {temp_file}")
             except Exception as e:
                 logger.log_warning(f"Failed to remove temporary file: {e}")
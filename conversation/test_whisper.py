@@ -16,8 +16,8 @@ def test_whisper_transcription(audio_path):
     file_exists = os.path.exists(audio_path)
     file_is_valid = os.path.isfile(audio_path)
     
-    logger.log(f"Testing whisper transcription on: {audio_path}")
-    logger.log(f"File exists: {file_exists}, is valid file: {file_is_valid}")
+    logger.log_debug(f"Testing whisper transcription on: {audio_path}")
+    logger.log_debug(f"File exists: {file_exists}, is valid file: {file_is_valid}")
     
     if not file_exists or not file_is_valid:
         logger.log_error(f"Invalid audio file: exists={file_exists}, is_file={file_is_valid}")
@@ -27,7 +27,7 @@ def test_whisper_transcription(audio_path):
         }
     
     try:
-        logger.log("Loading whisper model (base)...")
+        logger.log_debug("Loading whisper model (base)...")
         # Try to load the model, handling potential checksum errors
         try:
             model = whisper.load_model("base")
@@ -49,14 +49,14 @@ def test_whisper_transcription(audio_path):
                 raise
         
         # Set explicit FFmpeg parameters
-        logger.log("Transcribing audio...")
+        logger.log_debug("Transcribing audio...")
         result = model.transcribe(
             audio_path,
             fp16=False,  # Use float32 for better compatibility
-            verbose=True  # Show detailed logs during transcription
+            verbose=False  # Printing every segment costs time on the request thread
         )
         
-        logger.log(f"Transcription successful")
+        logger.log_debug(f"Transcription successful")
         return {"success": True, "result": result}
     except Exception as e:
         logger.log_error(f"Transcription failed: {str(e)}")
@@ -0,0 +1,263 @@
+"""
+Lightweight tracing of where a conversation turn spends its time.
+
+Wrap a turn in `turn()` and each stage in `span("stage.name")`:
+
+    with tracing.turn(session_id=...):
+        with tracing.span("asr.transcribe"):
+            ...
+
+Every span is timed and added to a per-stage latency histogram; spans also
+carry the ID of the enclosing turn, and the stage breakdown of the most recent
+turns is kept, so a slow turn can be attributed to the stage that caused it.
+Turns slower than SLOW_TURN_SECONDS are logged with their breakdown.
+
+The histograms are exposed in Prometheus text format (`render_prometheus()`)
+and as a JSON dump (`snapshot()`, `dump()`), and over HTTP on METRICS_PORT by
+`start_metrics_server()` at /metrics and /metrics.json.
+"""
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+from logger import Logger
+
+load_dotenv()
+
+SLOW_TURN_SECONDS = float(os.getenv("SLOW_TURN_SECONDS", "10"))
+# Port of the metrics HTTP server; 0 disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+# Upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Measurements per stage kept for exact percentiles, and turns kept for breakdowns
+RECENT_SAMPLES = 1024
+RECENT_TURNS = 100
+
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds):
+        self.bucket_counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def percentiles(self):
+        """p50/p95/p99 (seconds) of the recent measurements."""
+        samples = sorted(self.recent)
+        if not samples:
+            return {}
+        return {q: samples[min(len(samples) - 1, int(round(q / 100.0 * (len(samples) - 1))))] for q in (50, 95, 99)}
+
+
+class _Turn:
+    def __init__(self, turn_id, attributes):
+        self.turn_id = turn_id
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.stages = {}  # Stage -> total seconds within this turn
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+class _Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.turns = deque(maxlen=RECENT_TURNS)
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds, failed=False):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+            if failed:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+
+
+_registry = _Registry()
+
+
+def current_turn_id():
+    """ID of the turn the caller is part of, or None."""
+    turn = _current_turn.get()
+    return turn.turn_id if turn else None
+
+
+@contextmanager
+def span(stage):
+    """Time a stage; the duration goes to the stage's histogram and the current turn's breakdown."""
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _registry.observe(stage, elapsed, failed)
+        turn = _current_turn.get()
+        if turn is not None:
+            turn.add(stage, elapsed)
+
+
+@contextmanager
+def turn(name="turn", **attributes):
+    """
+    Time a whole turn under a new turn ID. Inside an active turn this is just a span named `name`,
+    so handlers and ConversationManager can both open one.
+
+    Yields:
+        str: The turn ID.
+    """
+    active = _current_turn.get()
+    if active is not None:
+        with span(name):
+            yield active.turn_id
+        return
+
+    current = _Turn(uuid.uuid4().hex[:12], attributes)
+    token = _current_turn.set(current)
+    failed = False
+    try:
+        # Log records of this turn carry its IDs
+        with Logger().context(turn_id=current.turn_id, session_id=attributes.get("session_id", "-")):
+            yield current.turn_id
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _current_turn.reset(token)
+        elapsed = time.perf_counter() - current.started
+        _registry.observe(name, elapsed, failed)
+        record = {
+            "turn_id": current.turn_id,
+            "name": name,
+            "seconds": round(elapsed, 4),
+            "failed": failed,
+            "stages": {stage: round(seconds, 4) for stage, seconds in current.stages.items()},
+            **current.attributes,
+        }
+        with _registry.lock:
+            _registry.turns.append(record)
+        if elapsed > SLOW_TURN_SECONDS:
+            breakdown = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in
+                                  sorted(current.stages.items(), key=lambda item: item[1], reverse=True))
+            Logger().log_warning(f"Slow {name} {current.turn_id} took {elapsed:.2f}s: {breakdown}")
+
+
+def snapshot() -> dict:
+    """Per-stage count, mean and p50/p95/p99 (ms), error counts and the most recent turns."""
+    with _registry.lock:
+        stages = {}
+        for stage, histogram in sorted(_registry.histograms.items()):
+            percentiles = histogram.percentiles()
+            stages[stage] = {
+                "count": histogram.count,
+                "errors": _registry.errors.get(stage, 0),
+                "mean_ms": round(1000 * histogram.sum / histogram.count, 3),
+                **{f"p{q}_ms": round(1000 * value, 3) for q, value in percentiles.items()},
+            }
+        return {"stages": stages, "recent_turns": list(_registry.turns)}
+
+
+def dump(path) -> None:
+    """Write snapshot() to a JSON file."""
+    with open(path, "w") as f:
+        json.dump(snapshot(), f, indent=2)
+
+
+def reset() -> None:
+    """Forget all measurements."""
+    with _registry.lock:
+        _registry.histograms.clear()
+        _registry.turns.clear()
+        _registry.errors.clear()
+
+
+def render_prometheus() -> str:
+    """All histograms in the Prometheus text exposition format."""
+    lines = [
+        "# HELP conversation_stage_duration_seconds Duration of conversation pipeline stages.",
+        "# TYPE conversation_stage_duration_seconds histogram",
+    ]
+    quantile_lines = [
+        "# HELP conversation_stage_duration_quantile_seconds Percentiles of recent stage durations.",
+        "# TYPE conversation_stage_duration_quantile_seconds gauge",
+    ]
+    error_lines = [
+        "# HELP conversation_stage_errors_total Stages that ended with an exception.",
+        "# TYPE conversation_stage_errors_total counter",
+    ]
+    with _registry.lock:
+        for stage, histogram in sorted(_registry.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram.bucket_counts):
+                cumulative += count
+                lines.append(f'conversation_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'conversation_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'conversation_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+            for q, value in histogram.percentiles().items():
+                quantile_lines.append(
+                    f'conversation_stage_duration_quantile_seconds{{stage="{stage}",quantile="0.{q}"}} {value}')
+            error_lines.append(f'conversation_stage_errors_total{{stage="{stage}"}} {_registry.errors.get(stage, 0)}')
+    return "\n".join(lines + quantile_lines + error_lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = render_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(snapshot()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics and /metrics.json on a background thread; once per process, no-op for port 0."""
+    global _server
+    with _server_lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError as e:
+            Logger().log_warning(f"Metrics server not started on port {port}: {e}")
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        Logger().log(f"Metrics served on port {port} at /metrics and /metrics.json")
+        return _server
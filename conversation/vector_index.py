@@ -0,0 +1,169 @@
+"""
+Append-only on-disk vector index with exact top-k search in NumPy.
+
+An index is a directory holding two files that grow in lockstep:
+
+- vectors.f16: row-major float16 embeddings, one row per entry
+- payloads.jsonl: one JSON payload per line, in the same order
+
+Appending writes only the new rows, so adding an entry costs the same no matter
+how large the index is. Vectors are kept L2-normalised in memory as float32, and
+a search is a single matrix-vector product followed by argpartition. That stays
+in the low milliseconds for tens of thousands of 384-dimensional entries.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+VECTORS_FILE = "vectors.f16"
+PAYLOADS_FILE = "payloads.jsonl"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalise rows so a dot product is the cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[np.newaxis, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    def __init__(self, directory: str, dim: int):
+        """
+        Parameters:
+            directory (str): Where the index files live; created if missing.
+            dim (int): Embedding dimension.
+        """
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._size = 0
+        self._payloads = []
+        self._keys = set()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __len__(self):
+        return self._size
+
+    def _load(self):
+        vectors_path = os.path.join(self.directory, VECTORS_FILE)
+        payloads_path = os.path.join(self.directory, PAYLOADS_FILE)
+        if not os.path.exists(vectors_path) and not os.path.exists(payloads_path):
+            return
+
+        vectors = np.zeros(0, dtype=np.float16)
+        if os.path.exists(vectors_path):
+            vectors = np.fromfile(vectors_path, dtype=np.float16)
+        vectors = vectors[: len(vectors) // self.dim * self.dim].reshape(-1, self.dim)
+
+        # Byte offset just past each complete payload line; a torn last line is not a payload
+        payloads, ends = [], []
+        if os.path.exists(payloads_path):
+            with open(payloads_path, "rb") as f:
+                offset = 0
+                for line in f:
+                    offset += len(line)
+                    if not line.endswith(b"\n"):
+                        break
+                    if not line.strip():
+                        continue
+                    try:
+                        payloads.append(json.loads(line))
+                    except ValueError:
+                        break
+                    ends.append(offset)
+
+        # An interrupted append may leave one file a row ahead of the other. Cut both files back
+        # to the rows they share, so the next append lines up again after a restart.
+        size = min(len(vectors), len(payloads))
+        self._truncate(vectors_path, size * self.dim * np.dtype(np.float16).itemsize)
+        self._truncate(payloads_path, ends[size - 1] if size else 0)
+
+        self._vectors = vectors[:size].astype(np.float32)
+        self._size = size
+        self._payloads = payloads[:size]
+        self._keys = {payload["key"] for payload in self._payloads if "key" in payload}
+
+    @staticmethod
+    def _truncate(path, length):
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        elif os.path.getsize(path) != length:
+            os.truncate(path, length)
+
+    def contains(self, key) -> bool:
+        return key in self._keys
+
+    def add(self, vectors, payloads) -> int:
+        """
+        Append entries to the index and to disk.
+
+        Payloads with a "key" that is already indexed are skipped, which makes
+        re-adding the same entries (e.g. during a backfill) harmless.
+
+        Returns:
+            int: Number of entries actually added.
+        """
+        vectors = normalize(vectors)
+        with self._lock:
+            fresh = [i for i, payload in enumerate(payloads)
+                     if "key" not in payload or payload["key"] not in self._keys]
+            if not fresh:
+                return 0
+            vectors = vectors[fresh]
+            payloads = [payloads[i] for i in fresh]
+
+            with open(os.path.join(self.directory, VECTORS_FILE), "ab") as f:
+                f.write(vectors.astype(np.float16).tobytes())
+            with open(os.path.join(self.directory, PAYLOADS_FILE), "a", encoding="utf-8") as f:
+                for payload in payloads:
+                    f.write(json.dumps(payload, default=str) + "\n")
+
+            self._append_in_memory(vectors)
+            self._payloads.extend(payloads)
+            self._keys.update(payload["key"] for payload in payloads if "key" in payload)
+            return len(payloads)
+
+    def _append_in_memory(self, vectors):
+        needed = self._size + len(vectors)
+        if needed > len(self._vectors):
+            # Grow geometrically so appends are amortised O(1)
+            capacity = max(needed, 2 * len(self._vectors), 64)
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[: self._size] = self._vectors[: self._size]
+            self._vectors = grown
+        self._vectors[self._size: needed] = vectors
+        self._size = needed
+
+    def search(self, query, k=5, min_score=None):
+        """
+        Exact cosine-similarity search.
+
+        Returns:
+            list: Up to k (score, payload) tuples, best first.
+        """
+        with self._lock:
+            size = self._size
+            if size == 0 or k <= 0:
+                return []
+            matrix = self._vectors[:size]
+            payloads = self._payloads
+
+        scores = matrix @ normalize(query)[0]
+        k = min(k, size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            score = float(scores[i])
+            if min_score is not None and score < min_score:
+                break
+            results.append((score, payloads[i]))
+        return results
@@ -0,0 +1,204 @@
+"""
+Write-behind queue for MongoDB.
+
+Callers hand over pymongo write operations (InsertOne, UpdateOne, ...) and return
+immediately; a background thread collects them and ships them with one
+bulk_write per collection once the batch is full or the flush interval expires.
+Transient errors are retried with exponential backoff, and everything still
+queued is flushed when the process exits.
+
+Delivery is at-least-once, so queued operations should be idempotent
+(inserts carry their own _id, updates should be upserts keyed on a natural id).
+"""
+import atexit
+import threading
+import time
+from collections import deque
+
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure, PyMongoError
+
+from logger import Logger
+
+# Raised for network blips and primary elections; worth retrying
+TRANSIENT_ERRORS = (AutoReconnect, ConnectionFailure)
+DUPLICATE_KEY_ERROR = 11000
+
+
+class WriteBehindQueue:
+    def __init__(self, database, batch_size=100, flush_interval=1.0, max_retries=5, retry_backoff=0.5):
+        """
+        Parameters:
+            database: pymongo Database the operations are written to.
+            batch_size (int): Number of queued operations that triggers a flush.
+            flush_interval (float): Maximum seconds an operation waits before being flushed.
+            max_retries (int): Attempts per batch on transient errors before the unwritten rest is dropped.
+            retry_backoff (float): Initial retry delay in seconds, doubled on every attempt.
+        """
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.logger = Logger()
+
+        self._pending = deque()
+        self._in_flight = 0
+        self._enqueued = 0  # Total operations ever accepted
+        self._completed = 0  # Total operations written or given up on
+        self._flush_target = 0  # Highest _enqueued value a flush() caller is waiting for
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run, name="mongo-write-behind", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    @property
+    def depth(self) -> int:
+        """Number of operations accepted but not yet written."""
+        with self._condition:
+            return len(self._pending) + self._in_flight
+
+    def put(self, collection_name: str, operation, on_written=None) -> None:
+        """
+        Queue a pymongo write operation for the named collection without blocking.
+
+        Parameters:
+            collection_name (str): Target collection.
+            operation: pymongo write operation (InsertOne, UpdateOne, ...).
+            on_written (callable, optional): Called from the worker thread once the
+                operation is known to be in the database. Not called if it is dropped.
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Write-behind queue is closed")
+            self._pending.append((collection_name, operation, on_written))
+            self._enqueued += 1
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify_all()
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Block until every operation queued before this call has been written.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            target = self._enqueued
+            self._flush_target = max(self._flush_target, target)
+            self._condition.notify_all()
+            while self._completed < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=30.0) -> None:
+        """Flush everything still queued and stop the worker thread."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._worker.join(timeout)
+        if self._worker.is_alive():
+            self.logger.log_error(f"Write-behind queue closed with {self.depth} operations unwritten")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._pending) < self.batch_size \
+                        and self._flush_target <= self._completed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                if not self._pending:
+                    if self._closed:
+                        return
+                    continue
+
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                self._in_flight = len(batch)
+
+            self._write_batch(batch)
+
+            with self._condition:
+                self._in_flight = 0
+                self._completed += len(batch)
+                self._condition.notify_all()
+
+    def _write_batch(self, batch):
+        """Write one batch as a single bulk_write per collection, preserving queue order."""
+        by_collection = {}
+        for collection_name, operation, on_written in batch:
+            by_collection.setdefault(collection_name, []).append((operation, on_written))
+
+        for collection_name, entries in by_collection.items():
+            written = self._bulk_write_with_retry(collection_name, [operation for operation, _ in entries])
+            for (_, on_written), done in zip(entries, written):
+                if on_written is None or not done:
+                    continue
+                try:
+                    on_written()
+                except Exception as e:
+                    self.logger.log_error(f"Write-behind callback failed: {e}")
+
+    def _bulk_write_with_retry(self, collection_name, operations) -> list:
+        """
+        Write the operations in order. Transient errors retry what is not confirmed yet; an operation
+        that fails on its own is dropped and the ones after it are still written.
+
+        Returns:
+            list: Per operation, True once it is known to be in the database.
+        """
+        written = [False] * len(operations)
+        start = 0
+        attempt = 1
+        delay = self.retry_backoff
+        while start < len(operations):
+            try:
+                self.database[collection_name].bulk_write(operations[start:], ordered=True)
+                written[start:] = [True] * (len(operations) - start)
+                break
+            except BulkWriteError as e:
+                write_errors = e.details.get("writeErrors", [])
+                if write_errors:
+                    # Ordered: everything before the failed operation landed, nothing after it was tried
+                    failed = start + write_errors[0]["index"]
+                    written[start:failed] = [True] * (failed - start)
+                    if write_errors[0]["code"] == DUPLICATE_KEY_ERROR:
+                        # An earlier attempt already landed this operation
+                        written[failed] = True
+                    else:
+                        self.logger.log_error(f"Dropping a write to {collection_name}: {write_errors[0]}")
+                    # Resuming after a single operation does not use up a retry
+                    start = failed + 1
+                    continue
+                error = e  # Only a write concern error; resend, the operations are idempotent
+            except TRANSIENT_ERRORS as e:
+                error = e
+            except PyMongoError as e:
+                if len(operations) - start == 1:
+                    self.logger.log_error(f"Dropping a write to {collection_name}: {e}")
+                    break
+                # Not attributable to one operation: write them one by one so only the culprit is dropped
+                for i in range(start, len(operations)):
+                    written[i] = self._bulk_write_with_retry(collection_name, [operations[i]])[0]
+                break
+
+            if attempt == self.max_retries:
+                self.logger.log_error(f"Giving up on {len(operations) - start} writes to {collection_name} "
+                                      f"after {self.max_retries} attempts")
+                break
+            self.logger.log_warning(f"Transient error writing to {collection_name} "
+                                    f"(attempt {attempt}/{self.max_retries}): {error}")
+            time.sleep(delay)
+            delay *= 2
+            attempt += 1
+        return written
@@ -1,116 +1,600 @@
-from flask import Flask, jsonify, Response
+from flask import Flask, jsonify, Response, request
 from threading import Thread
+import argparse
+import json
+import os
 import cv2
 import time
-from deepface import DeepFace
 import numpy as np
 
+from emotion_model import EmotionModel
+from face_tracker import FaceTracker
+import frame_bus
+from frame_broadcast import FrameBroadcaster
+from frame_sources import open_source
+from frame_store import StageTimings
+from sessions import LOCAL_SESSION, SessionLimitError, SessionRegistry
+
 app = Flask(__name__)
 
+# Configuration
+INFERENCE_FPS = float(os.getenv("INFERENCE_FPS", "5"))  # Max emotion inferences per second, per session
+EMOTION_BUFFER_SIZE = int(os.getenv("EMOTION_BUFFER_SIZE", "1024"))  # Analyzed frames kept for window queries
+SSE_KEEPALIVE_SECONDS = 15.0  # Idle time after which /emotion/stream sends a keep-alive comment
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "64"))  # Concurrent sessions, local camera included
+SESSION_UPLOAD_FPS = float(os.getenv("SESSION_UPLOAD_FPS", "10"))  # Frame uploads per second accepted per session
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "300"))  # Sessions without uploads are dropped after this
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", "20"))  # Time spent gathering frames into one batch
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "32"))  # Frames per batch
+MODEL_RETRY_SECONDS = 30  # Delay before retrying a failed model load
+MAX_FACES_PER_FRAME = 5  # Faces analyzed per frame, largest first
+FACE_TRACKING = os.getenv("FACE_TRACKING", "true").lower() == "true"  # Track faces between full detections
+DETECT_EVERY_FRAMES = int(os.getenv("DETECT_EVERY_FRAMES", "10"))  # Analyzed frames between full detections
+TRACK_MIN_CONFIDENCE = float(os.getenv("TRACK_MIN_CONFIDENCE", "0.6"))  # Below this match score, detect again
+DETECT_BUDGET_MS = float(os.getenv("DETECT_BUDGET_MS", "15"))  # Frames are downscaled to keep detection within this
+FRAME_SOURCE = os.getenv("FRAME_SOURCE", "camera:0")  # Local frames: camera[:i], video:<path>, images:<dir>, synthetic, none
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "1"))  # Replay speed of recorded sources; 0 = as fast as possible
+FRAME_SOURCE_LOOP = os.getenv("FRAME_SOURCE_LOOP", "false").lower() == "true"  # Restart recorded sources at the end
+SHOW_DISPLAY = os.getenv("SHOW_DISPLAY", "false").lower() == "true"  # Local preview window; needs a GUI build of OpenCV
+ENGINE_STATUS_TIMEOUT = 5.0  # API workers consider the engine dead if its status is older than this
+UPLOAD_MAX_WIDTH = 640  # Uploaded frames wider than this are downscaled before analysis
+app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024  # Largest accepted frame upload
+
 # Global Variables
-current_emotion = "unknown"
 running = True
-show_display = True  # Set to False for headless environments
-latest_frame = None
-latest_processed_frame = None
-
-def capture_emotion():
-    global current_emotion, running, latest_frame, latest_processed_frame
-    # Init Camera
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Cannot Open Camera")
-        running = False
+timings = StageTimings()  # Per-stage latency counters, served on /stats
+sessions = SessionRegistry(max_sessions=MAX_SESSIONS, session_ttl=SESSION_TTL_SECONDS,
+                           buffer_size=EMOTION_BUFFER_SIZE, inference_fps=INFERENCE_FPS,
+                           upload_fps=SESSION_UPLOAD_FPS)
+local = sessions.get_or_create(LOCAL_SESSION)  # The camera attached to this machine
+emotion_model = EmotionModel()  # Loaded and warmed up by the inference worker at startup
+workers = {}  # Background threads by name, reported on /healthz
+# Shared-memory bus to the engine process when running under gunicorn (see gunicorn.conf.py), else None.
+# With a bus, this process is either the engine (run_engine) or a stateless API worker.
+bus = frame_bus.current()
+
+
+def annotate(item):
+    """Draw an inference result onto a copy of its frame; `item` is a (FrameSnapshot, InferenceResult) pair"""
+    snapshot, result = item
+    processed = snapshot.frame.copy()
+    for (x, y, w, h), emotion in result.faces:
+        cv2.rectangle(processed, (x, y), (x+w, y+h), (0, 255, 0), 2)
+        cv2.putText(processed, emotion, (x, y - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
+    cv2.putText(processed, f"Emotion: {result.emotion}", (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+    return processed
+
+
+video_feed_hub = FrameBroadcaster(render=annotate, timings=timings)  # Fans annotated frames out to /video_feed clients
+
+
+def tracker_for(session, face_cascade):
+    """The session's face tracker, created on its first frame"""
+    if session.tracker is None:
+        session.tracker = FaceTracker(face_cascade,
+                                      detect_every=DETECT_EVERY_FRAMES if FACE_TRACKING else 1,
+                                      min_confidence=TRACK_MIN_CONFIDENCE,
+                                      detect_budget_ms=DETECT_BUDGET_MS,
+                                      max_faces=MAX_FACES_PER_FRAME)
+    return session.tracker
+
+
+def capture_frames(source=None, max_frames=None):
+    """
+    Read frames from the local frame source as fast as it delivers them and publish them without copying.
+
+    Parameters:
+        source (FrameSource, optional): Defaults to the source configured by FRAME_SOURCE.
+        max_frames (int, optional): Stop after this many frames.
+    """
+    global running
+    if source is None:
+        try:
+            source = open_source(FRAME_SOURCE, speed=REPLAY_SPEED, loop=FRAME_SOURCE_LOOP)
+        except (IOError, ValueError) as e:
+            # Uploaded sessions keep working without a local source
+            print("Cannot Open Frame Source:", e)
+            source = None
+    if source is None:
+        local.frames.close()
         return
-    
+
+    captured = 0
+    while running and (max_frames is None or captured < max_frames):
+        with timings.time("capture"):
+            # Sources return a fresh array per frame, which is then handed over read-only
+            frame = source.read()
+        if frame is None:
+            print(f"Frame Source Ended: {source.name}")
+            break
+        captured += 1
+
+        # Publish the newest frame; the inference worker only ever looks at the latest one
+        sessions.submit(LOCAL_SESSION, frame, rate_limited=False)
+        snapshot = local.frames.frame()
+        # Overlay is drawn lazily, once per frame actually sent to a viewer
+        video_feed_hub.publish((snapshot, local.frames.result()))
+
+        # Display if enabled
+        if SHOW_DISPLAY:
+            cv2.imshow('Emotion Detection', annotate((snapshot, local.frames.result())))
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                running = False
+                break
+
+    local.frames.close()
+    video_feed_hub.close()
+    source.close()
+    if SHOW_DISPLAY:
+        cv2.destroyAllWindows()
+
+
+def collect_jobs():
+    """
+    Gather frames to analyze: wait for the first one, then keep collecting for up to
+    INFERENCE_BATCH_WINDOW_MS, so frames of different sessions share one model call.
+    """
+    job = sessions.next_job(timeout=0.5)
+    if job is None:
+        return []
+    jobs = [job]
+    deadline = time.monotonic() + INFERENCE_BATCH_WINDOW_MS / 1000.0
+    while len(jobs) < INFERENCE_MAX_BATCH:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        job = sessions.next_job(timeout=remaining)
+        if job is None:
+            break
+        jobs.append(job)
+    return jobs
+
+
+def run_inference():
+    """
+    Analyze the newest frame of every session, round-robin, within each session's INFERENCE_FPS.
+    All faces of all frames collected together are classified in a single batch.
+    """
     face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    
+    # Preload the weights and warm up before serving, so early requests never see a cold model
+    while running and not emotion_model.load(warmup_batch_size=INFERENCE_MAX_BATCH):
+        print("Cannot Load Emotion Model:", emotion_model.error)
+        time.sleep(MODEL_RETRY_SECONDS)
+    model = emotion_model
+
     while running:
-        ret, frame = cap.read()
-        if not ret:
-            print("Cannot Read Frame from Camera")
-            break
-            
-        # Store original frame
-        latest_frame = frame.copy()
-        
+        jobs = collect_jobs()
+        if not jobs:
+            continue
+        started = time.monotonic()
+
         try:
-            # Face detection
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-            
-            # Draw rectangle around faces
-            for (x, y, w, h) in faces:
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            
-            # Emotion Analysis
-            result = DeepFace.analyze(latest_frame, actions=['emotion'], enforce_detection=False)
-            if isinstance(result, list):
-                result = result[0]
-            current_emotion = result['dominant_emotion']
-            
-            # Add emotion text to frame
-            cv2.putText(frame, f"Emotion: {current_emotion}", (10, 30), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            
-            # Store processed frame
-            latest_processed_frame = frame.copy()
-            
-            # Display if enabled
-            if show_display:
-                cv2.imshow('Emotion Detection', frame)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
+            # Locate every face of every frame, remembering which frame each crop came from
+            crops, owners = [], []
+            with timings.time("detect"):
+                for index, (session, snapshot) in enumerate(jobs):
+                    for x, y, w, h in tracker_for(session, face_cascade).update(snapshot.frame):
+                        crops.append(snapshot.frame[y:y+h, x:x+w])
+                        owners.append((index, (x, y, w, h)))
+
+            with timings.time("analyze"):
+                probabilities = model.predict(crops)
 
+            # Scatter the per-face results back to their sessions
+            per_job = [[] for _ in jobs]
+            for (index, box), row in zip(owners, probabilities):
+                per_job[index].append((box, row))
+            for (session, snapshot), faces in zip(jobs, per_job):
+                if not faces:
+                    record_result(session, snapshot, "unknown")
+                    continue
+                labelled = [(box, model.labels[int(np.argmax(row))]) for box, row in faces]
+                # The largest face is taken to be the session's user
+                face_box, emotion = labelled[0]
+                record_result(session, snapshot, emotion, face_box, labelled, faces[0][1])
+            for session, snapshot in jobs:
+                # Capture (or upload) to published result
+                timings.record("frame_latency", time.time() - snapshot.timestamp)
         except Exception as e:
             print("Exception:", e)
-            current_emotion = "error"
-            if frame is not None:
-                cv2.putText(frame, "No face detected", (10, 30), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-                latest_processed_frame = frame.copy()
-                
-                if show_display:
-                    cv2.imshow('Emotion Detection', frame)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        break
-        
-        # Process at reasonable rate
-        time.sleep(0.03)  # ~30 fps
-    
-    cap.release()
-    if show_display:
-        cv2.destroyAllWindows()
+            for session, snapshot in jobs:
+                session.frames.publish_result(snapshot.version, snapshot.timestamp, "error")
+        timings.record("inference", time.monotonic() - started)
+
 
-def generate_frames():
-    global latest_processed_frame
+def record_result(session, snapshot, emotion, face_box=None, faces=(), probabilities=None):
+    """Publish an inference result to the session and, under gunicorn, to the API workers"""
+    session.frames.publish_result(snapshot.version, snapshot.timestamp, emotion, face_box, faces)
+    session.history.append(probabilities, timestamp=snapshot.timestamp)
+    if bus is not None:
+        bus.emotions.append(session.session_id, snapshot.timestamp, probabilities, emotion, face_box)
+
+
+def publish_video():
+    """Engine: encode annotated local frames into the shared video ring while API workers have viewers"""
+    version = 0
+    while running:
+        if not bus.video.has_readers():
+            time.sleep(0.1)
+            continue
+        snapshot = local.frames.wait_for_frame(version, timeout=0.5)
+        if snapshot is None:
+            if local.frames.closed:
+                return
+            continue
+        version = snapshot.version
+        with timings.time("render"):
+            processed = annotate((snapshot, local.frames.result()))
+        with timings.time("encode"):
+            ok, buffer = cv2.imencode('.jpg', processed, [cv2.IMWRITE_JPEG_QUALITY, video_feed_hub.jpeg_quality])
+        if ok and buffer.nbytes <= bus.video.slot_bytes:
+            bus.video.write(buffer, timestamp=snapshot.timestamp)
+
+
+def drain_inbox():
+    """Engine: hand frames uploaded through any API worker to their sessions"""
+    version = bus.inbox.latest
     while running:
-        if latest_processed_frame is not None:
-            # Convert frame to JPEG
-            ret, buffer = cv2.imencode('.jpg', latest_processed_frame)
-            frame_bytes = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        time.sleep(0.03)  # ~30 fps
+        latest = bus.inbox.latest
+        if latest == version:
+            time.sleep(0.005)
+            continue
+        # If we fell more than a ring behind, the oldest uploads are lost; skip to what is left
+        version = max(version, latest - bus.inbox.slots + 1)
+        for version in range(version + 1, latest + 1):
+            item = bus.inbox.read(version)
+            if item is None:
+                continue
+            timestamp, session_id, payload = item
+            if not payload:
+                sessions.remove(session_id)
+                continue
+            height, width = np.frombuffer(payload[:8], dtype=np.uint32)
+            frame = np.frombuffer(payload, dtype=np.uint8, offset=8).reshape(int(height), int(width), 3)
+            try:
+                sessions.submit(session_id, frame, timestamp=timestamp)
+            except SessionLimitError as e:
+                print("Upload Rejected:", e)
+
+
+def publish_status():
+    """Engine: share health and stats with the API workers about once a second"""
+    while running:
+        status = health()
+        status["ready"] = readiness(status)
+        status["stats"] = stats()
+        bus.publish_status(status)
+        time.sleep(1.0)
+
+
+def run_engine():
+    """Engine process under gunicorn: capture, inference and everything the API workers read from the bus"""
+    for name, target in (("capture", capture_frames), ("inference", run_inference), ("video", publish_video),
+                         ("inbox", drain_inbox), ("status", publish_status)):
+        t = Thread(target=target, name=name)
+        t.daemon = True
+        t.start()
+        workers[name] = t
+    while running:
+        time.sleep(1.0)
+
+
+def find_session(session_id):
+    """The session (or, in an API worker, a read-only view of it), or None if unknown"""
+    if bus is None:
+        return sessions.get(session_id)
+    if session_id == LOCAL_SESSION or session_id in bus.status().get("stats", {}).get("sessions", {}) or bus.emotions.newest(session_id) is not None:
+        return bus.session(session_id)
+    return None
+
+
+def decode_upload():
+    """Decode the uploaded frame (raw image body or multipart field `frame`) into a BGR array, or None"""
+    upload = request.files.get("frame")
+    data = upload.read() if upload is not None else request.get_data()
+    if not data:
+        return None
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None
+    height, width = frame.shape[:2]
+    if width > UPLOAD_MAX_WIDTH:
+        frame = cv2.resize(frame, (UPLOAD_MAX_WIDTH, int(height * UPLOAD_MAX_WIDTH / width)),
+                           interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def emotion_response(session):
+    """Emotion detected on the latest analyzed frame of a session"""
+    latest = session.history.latest()
+    result = session.frames.result()
+    response = {"emotion": result.emotion, "timestamp": None, "confidence": None, "staleness": None,
+                "faces": [{"box": list(box), "emotion": emotion} for box, emotion in result.faces]}
+    if latest is not None:
+        timestamp, probabilities = latest
+        response["timestamp"] = timestamp
+        response["staleness"] = max(0.0, time.time() - timestamp)
+        if probabilities is not None:
+            response["confidence"] = max(probabilities.values())
+    return jsonify(response)
+
+
+def emotion_window_response(session):
+    """
+    Aggregated emotion distribution of a session over a time window.
+
+    Query parameters (all optional):
+        start, end: Unix timestamps of the window, e.g. the span of the user's utterance
+        seconds: Window length ending now; used when start is not given (default 5)
+        method: "mean" (default) or "ewma"
+        half_life: Half-life in seconds for "ewma" (default 1.0)
+    """
+    try:
+        end = request.args.get("end", type=float)
+        start = request.args.get("start", type=float)
+        if start is None:
+            start = (end or time.time()) - request.args.get("seconds", default=5.0, type=float)
+        result = session.history.query(
+            start=start,
+            end=end,
+            method=request.args.get("method", default="mean"),
+            half_life=request.args.get("half_life", default=1.0, type=float),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+
+def emotion_stream_response(session):
+    """
+    Server-sent events: one `emotion` event per analyzed frame of a session, pushed as soon as it is available.
+
+    Event data is JSON with `timestamp`, `emotion` ("unknown" if no face was found) and
+    `probabilities` (normalised distribution, or null). Idle connections receive a
+    keep-alive comment every SSE_KEEPALIVE_SECONDS. The stream ends when the session does.
+    """
+    def events():
+        version = 0
+        while running:
+            version, latest = session.history.wait_for_update(version, timeout=SSE_KEEPALIVE_SECONDS)
+            if latest is None:
+                # An active session cannot have ended; only idle streams check whether it still exists
+                if session.session_id != LOCAL_SESSION and find_session(session.session_id) is None:
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            timestamp, probabilities = latest
+            emotion = max(probabilities, key=probabilities.get) if probabilities else "unknown"
+            payload = {"timestamp": timestamp, "emotion": emotion, "probabilities": probabilities}
+            yield f"id: {version}\nevent: emotion\ndata: {json.dumps(payload)}\n\n"
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 
 @app.route('/emotion', methods=['GET'])
 def get_emotion():
-    """return emotion detected"""
-    print("emotion detected:", current_emotion)
-    return jsonify({"emotion": current_emotion})
+    """return emotion detected on the latest analyzed frame of the local camera"""
+    return emotion_response(find_session(LOCAL_SESSION))
+
+@app.route('/emotion/window', methods=['GET'])
+def get_emotion_window():
+    """Aggregated emotion distribution of the local camera over a time window"""
+    return emotion_window_response(find_session(LOCAL_SESSION))
+
+@app.route('/emotion/stream')
+def emotion_stream():
+    """Server-sent events of the local camera's analyzed frames"""
+    return emotion_stream_response(find_session(LOCAL_SESSION))
+
+@app.route('/sessions/<session_id>/frames', methods=['POST'])
+def upload_frame(session_id):
+    """
+    Ingest one frame of a remote session. The body is the encoded image (JPEG/PNG), either raw
+    or as multipart field `frame`; it is timestamped on arrival. Clients should send frames
+    downscaled to about 320-640 px wide, at most SESSION_UPLOAD_FPS per second.
+    """
+    if session_id == LOCAL_SESSION:
+        return jsonify({"error": f"Session ID '{LOCAL_SESSION}' is reserved for the local camera"}), 400
+    frame = decode_upload()
+    if frame is None:
+        return jsonify({"error": "Body is not a decodable image"}), 400
+    if bus is not None:
+        # Decoded here, in parallel across workers; the engine applies session limits
+        height, width = frame.shape[:2]
+        frame = np.ascontiguousarray(frame)
+        try:
+            version = bus.inbox.write(np.array([height, width], dtype=np.uint32).tobytes() + frame.tobytes(),
+                                      timestamp=time.time(), tag=session_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 413
+        return jsonify({"session_id": session_id, "queued": version}), 202
+    try:
+        session = sessions.submit(session_id, frame, timestamp=time.time())
+    except SessionLimitError as e:
+        return jsonify({"error": str(e)}), 503
+    if session is None:
+        return jsonify({"error": "Upload rate limit exceeded"}), 429, {"Retry-After": "1"}
+    return jsonify({"session_id": session_id, "frame_version": session.frames.frame().version}), 202
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def end_session(session_id):
+    """Drop a remote session and its emotion history"""
+    if session_id == LOCAL_SESSION or find_session(session_id) is None:
+        return jsonify({"error": "Unknown session"}), 404
+    if bus is not None:
+        # An empty inbox payload asks the engine to drop the session
+        bus.inbox.write(b"", tag=session_id)
+    else:
+        sessions.remove(session_id)
+    return "", 204
+
+@app.route('/sessions/<session_id>/emotion', methods=['GET'])
+def get_session_emotion(session_id):
+    session = find_session(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown session"}), 404
+    return emotion_response(session)
+
+@app.route('/sessions/<session_id>/emotion/window', methods=['GET'])
+def get_session_emotion_window(session_id):
+    session = find_session(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown session"}), 404
+    return emotion_window_response(session)
+
+@app.route('/sessions/<session_id>/emotion/stream')
+def session_emotion_stream(session_id):
+    session = find_session(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown session"}), 404
+    return emotion_stream_response(session)
+
+def health():
+    analyze = timings.snapshot().get("analyze")
+    return {
+        "model": emotion_model.status(),
+        "inference_latency_ms": None if analyze is None else {"mean": analyze["mean_ms"], "last": analyze["last_ms"]},
+        "workers": {name: thread.is_alive() for name, thread in workers.items()},
+    }
+
+def readiness(status):
+    return emotion_model.ready and status["workers"].get("inference", False)
+
+def stats():
+    return {
+        "stages": timings.snapshot(),
+        "sessions": sessions.stats(),
+        "video_feed_clients": video_feed_hub.subscribers,
+    }
+
+def engine_status():
+    """Health of this process, or in an API worker the engine's last report"""
+    if bus is None:
+        status = health()
+        status["ready"] = readiness(status)
+        return status
+    status = bus.status()
+    if not status:
+        return {"model": {"state": "not_loaded"}, "ready": False, "engine_age_seconds": None}
+    status.pop("stats", None)
+    # An engine that stopped reporting is neither live nor ready
+    if status["engine_age_seconds"] > ENGINE_STATUS_TIMEOUT:
+        status["ready"] = False
+        status["model"]["state"] = "engine_unresponsive"
+    return status
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process serves requests and its model did not fail to load"""
+    body = engine_status()
+    ok = body["model"]["state"] not in ("failed", "engine_unresponsive")
+    body["status"] = "ok" if ok else "failed"
+    return jsonify(body), 200 if ok else 503
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: the model is loaded and warmed up and the inference worker is running"""
+    body = engine_status()
+    ready = body.pop("ready")
+    body["status"] = "ready" if ready else "not_ready"
+    return jsonify(body), 200 if ready else 503
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """Per-stage timing counters and per-session frame/inference state"""
+    if bus is not None:
+        return jsonify(bus.status().get("stats", {}))
+    return jsonify(stats())
 
 @app.route('/video_feed')
 def video_feed():
     """Video streaming route for web integration"""
-    return Response(generate_frames(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+    stream = bus.video.stream(lambda: not running) if bus is not None else video_feed_hub.stream()
+    return Response(stream, mimetype='multipart/x-mixed-replace; boundary=frame')
 
-if __name__ == '__main__':
-    # Capture emotion by another thread
-    t = Thread(target=capture_emotion)
-    t.daemon = True
-    t.start()
-    # Use Flask service，Listen to 0.0.0.0:5005
-    app.run(host='0.0.0.0', port=5005)
+def benchmark(source, max_frames=None, inference_fps=None):
+    """
+    Run the capture and inference pipeline on `source` without the HTTP server and report
+    throughput, latency percentiles and dropped frames once the source is exhausted.
+
+    Parameters:
+        source (FrameSource): Frames to analyze; recorded sources should not loop without max_frames.
+        max_frames (int, optional): Stop after this many frames.
+        inference_fps (float, optional): Per-session inference limit; 0 removes it. Defaults to INFERENCE_FPS.
+
+    Returns:
+        dict: The report.
+    """
+    global running
+    if inference_fps is not None:
+        local.inference_interval = 1.0 / inference_fps if inference_fps > 0 else 0.0
 
+    inference = Thread(target=run_inference, name="inference", daemon=True)
+    inference.start()
+    # Model loading and warm-up are not part of the measurement
+    while not emotion_model.ready:
+        if emotion_model.state == "failed":
+            raise RuntimeError(f"Cannot load emotion model: {emotion_model.error}")
+        time.sleep(0.1)
+
+    started = time.monotonic()
+    capture_frames(source, max_frames=max_frames)
+    # Give the worker a moment to finish the last frame
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        snapshot = local.frames.frame()
+        if snapshot is None or local.frames.result().frame_version >= snapshot.version:
+            break
+        time.sleep(0.01)
+    elapsed = time.monotonic() - started
+    running = False
+
+    stats = local.stats()
+    stages = timings.snapshot()
+    return {
+        "source": source.name,
+        "elapsed_seconds": round(elapsed, 3),
+        "frames_captured": stats["frame_version"],
+        "frames_analyzed": stats["analyzed_frames"],
+        "frames_dropped": stats["dropped_frames"],
+        "capture_fps": round(stats["frame_version"] / elapsed, 2) if elapsed else None,
+        "analyzed_fps": round(stats["analyzed_frames"] / elapsed, 2) if elapsed else None,
+        "model": emotion_model.status(),
+        "stages": stages,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Facial emotion detection service")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Analyze the frame source without serving HTTP and print a JSON report")
+    parser.add_argument("--source", default=FRAME_SOURCE, help="Frame source spec (default: FRAME_SOURCE)")
+    parser.add_argument("--speed", type=float, default=REPLAY_SPEED,
+                        help="Replay speed of recorded sources, 0 = as fast as possible")
+    parser.add_argument("--frames", type=int, default=None, help="Stop the benchmark after this many frames")
+    parser.add_argument("--inference-fps", type=float, default=None,
+                        help="Per-session inference limit for the benchmark, 0 = unlimited")
+    parser.add_argument("--output", default=None, help="Also write the benchmark report to this file")
+    args = parser.parse_args()
 
+    if args.benchmark:
+        if args.frames is None and args.source.startswith(("camera", "synthetic")):
+            parser.error("--frames is required for live and synthetic sources")
+        report = benchmark(open_source(args.source, speed=args.speed), max_frames=args.frames,
+                           inference_fps=args.inference_fps)
+        print(json.dumps(report, indent=2))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+    else:
+        FRAME_SOURCE, REPLAY_SPEED = args.source, args.speed
+        # Capture frames and analyze emotions in separate threads
+        for name, target in (("capture", capture_frames), ("inference", run_inference)):
+            t = Thread(target=target, name=name)
+            t.daemon = True
+            t.start()
+            workers[name] = t
+        # Use Flask service，Listen to 0.0.0.0:5005
+        app.run(host='0.0.0.0', port=5005)
@@ -0,0 +1,156 @@
+"""
+Fixed-size ring buffer of per-frame emotion probability vectors.
+
+The inference worker appends one row per analyzed frame; HTTP handlers aggregate
+the rows that fall into a requested time window (e.g. the span of the user's
+utterance). Storage is preallocated NumPy arrays, so appends never allocate and
+a window query is a vectorised mask over at most `capacity` rows.
+"""
+import threading
+import time
+
+import numpy as np
+
+# Order of DeepFace's emotion model outputs
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+
+class EmotionRingBuffer:
+    def __init__(self, capacity=1024, labels=EMOTION_LABELS):
+        """
+        Parameters:
+            capacity (int): Number of most recent frames kept.
+            labels (list): Emotion label of each probability column.
+        """
+        self.capacity = capacity
+        self.labels = list(labels)
+        self._probabilities = np.zeros((capacity, len(self.labels)), dtype=np.float32)
+        self._timestamps = np.full(capacity, -np.inf, dtype=np.float64)
+        self._face_present = np.zeros(capacity, dtype=bool)
+        self._next = 0
+        self._count = 0
+        self._version = 0  # Number of frames ever appended
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+
+    def append(self, probabilities=None, timestamp=None):
+        """
+        Record the result of one analyzed frame.
+
+        Parameters:
+            probabilities (dict or array, optional): Emotion label to score (any scale; it is
+                normalised), or a vector in `labels` order. None means no face was found.
+            timestamp (float, optional): Unix time of the frame, defaults to now.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        row = np.zeros(len(self.labels), dtype=np.float32)
+        if probabilities is not None:
+            if isinstance(probabilities, dict):
+                row[:] = [probabilities.get(label, 0.0) for label in self.labels]
+            else:
+                row[:] = probabilities
+            total = row.sum()
+            if total > 0:
+                row /= total
+
+        with self._lock:
+            i = self._next
+            self._probabilities[i] = row
+            self._timestamps[i] = timestamp
+            self._face_present[i] = probabilities is not None
+            self._next = (i + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self._version += 1
+            self._updated.notify_all()
+
+    def latest(self):
+        """(timestamp, probabilities dict or None) of the newest frame, or None if empty."""
+        with self._lock:
+            return self._latest_locked()
+
+    def _latest_locked(self):
+        if self._count == 0:
+            return None
+        i = (self._next - 1) % self.capacity
+        probabilities = dict(zip(self.labels, self._probabilities[i].tolist())) if self._face_present[i] else None
+        return float(self._timestamps[i]), probabilities
+
+    def wait_for_update(self, after_version=0, timeout=None):
+        """
+        Block until a frame newer than `after_version` has been appended.
+
+        Returns:
+            tuple: (version, latest()) of the newest frame, or (after_version, None) on timeout.
+                Frames appended while the caller was busy are skipped, not queued.
+        """
+        with self._updated:
+            if not self._updated.wait_for(lambda: self._version > after_version, timeout):
+                return after_version, None
+            return self._version, self._latest_locked()
+
+    def query(self, start=None, end=None, method="mean", half_life=1.0, stale_after=2.0):
+        """
+        Aggregate the emotion distribution of the frames in [start, end].
+
+        Parameters:
+            start (float, optional): Unix time of the window start; defaults to the oldest frame.
+            end (float, optional): Unix time of the window end; defaults to now.
+            method (str): "mean" for a plain average, "ewma" to weight recent frames more.
+            half_life (float): Half-life in seconds of the "ewma" weights.
+            stale_after (float): Age in seconds after which the newest frame counts as stale.
+
+        Returns:
+            dict: Dominant emotion, distribution, sample counts and staleness metadata.
+        """
+        with self._lock:
+            timestamps = self._timestamps.copy()
+            probabilities = self._probabilities.copy()
+            face_present = self._face_present.copy()
+        return aggregate(self.labels, timestamps, probabilities, face_present, start, end, method, half_life, stale_after)
+
+
+def aggregate(labels, timestamps, probabilities, face_present, start=None, end=None, method="mean",
+              half_life=1.0, stale_after=2.0):
+    """
+    Aggregate emotion rows (timestamps, probability vectors in `labels` order, face flags) over
+    [start, end]; see EmotionRingBuffer.query. Rows with timestamp -inf are empty slots.
+    """
+    now = time.time()
+    end = now if end is None else end
+    start = -np.inf if start is None else start
+    filled = np.isfinite(timestamps)
+    newest = float(timestamps[filled].max()) if filled.any() else None
+
+    in_window = filled & (timestamps >= start) & (timestamps <= end)
+    with_face = in_window & face_present
+    samples = int(in_window.sum())
+    face_samples = int(with_face.sum())
+
+    result = {
+        "emotion": "unknown",
+        "distribution": None,
+        "samples": samples,
+        "face_samples": face_samples,
+        "window": {"start": None if np.isinf(start) else start, "end": end},
+        "latest_timestamp": newest,
+        "staleness": None if newest is None else max(0.0, now - newest),
+    }
+    result["stale"] = result["staleness"] is None or result["staleness"] > stale_after
+
+    if face_samples == 0:
+        return result
+
+    rows = probabilities[with_face]
+    if method == "ewma":
+        ages = end - timestamps[with_face]
+        weights = np.power(0.5, ages / max(half_life, 1e-6))
+        distribution = (rows * weights[:, np.newaxis]).sum(axis=0) / weights.sum()
+    elif method == "mean":
+        distribution = rows.mean(axis=0)
+    else:
+        raise ValueError(f"Unknown aggregation method: {method}")
+
+    result["distribution"] = {label: round(float(p), 4) for label, p in zip(labels, distribution)}
+    result["emotion"] = labels[int(np.argmax(distribution))]
+    result["confidence"] = round(float(distribution.max()), 4)
+    return result
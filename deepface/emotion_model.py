@@ -0,0 +1,113 @@
+"""
+Batched facial emotion classification.
+
+DeepFace.analyze handles a single image per call and pays its preprocessing and
+Keras `predict` overhead every time. EmotionModel instead loads DeepFace's
+emotion network once and classifies a whole stack of face crops with a single
+forward pass, applying the same preprocessing the network was trained with:
+grayscale, 48x48, scaled to [0, 1].
+
+The model is loaded and warmed up at service startup (`load()`), so the first
+real request does not pay for the weight download, graph construction or the
+first slow forward pass. `status()` reports the state for health checks.
+Weights are stored under $DEEPFACE_HOME/.deepface/weights (default: the home directory).
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from emotion_buffer import EMOTION_LABELS
+
+EMOTION_INPUT_SIZE = 48
+WARMUP_RUNS = 3
+
+
+class EmotionModel:
+    def __init__(self):
+        self.model = None
+        self.labels = EMOTION_LABELS
+        self.state = "not_loaded"  # not_loaded -> loading -> ready | failed
+        self.error = None
+        self.load_seconds = None
+        self.warmup_ms = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def load(self, warmup_batch_size=1) -> bool:
+        """
+        Build the network (downloading weights if needed) and run warm-up inferences
+        on a synthetic frame.
+
+        Parameters:
+            warmup_batch_size (int): Batch size used for the warm-up passes.
+
+        Returns:
+            bool: True if the model is ready.
+        """
+        with self._lock:
+            if self.ready:
+                return True
+            self.state = "loading"
+            started = time.monotonic()
+            try:
+                # Imported here so the service can report "loading" while TensorFlow starts
+                from deepface import DeepFace
+                # The DeepFace client wraps the Keras model; its predict() only takes one image.
+                # build_model defaults to task="facial_recognition", which has no "Emotion" model.
+                self.model = DeepFace.build_model(task="facial_attribute", model_name="Emotion").model
+                self.load_seconds = round(time.monotonic() - started, 3)
+                self.warmup_ms = self._warm_up(warmup_batch_size)
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                return False
+            self.state = "ready"
+            return True
+
+    def _warm_up(self, batch_size):
+        """Run a few passes on a synthetic face; returns the latency (ms) of the last one."""
+        face = np.full((96, 96, 3), 128, dtype=np.uint8)
+        cv2.circle(face, (48, 48), 36, (200, 200, 200), -1)
+        latency = None
+        for _ in range(WARMUP_RUNS):
+            started = time.perf_counter()
+            self.predict([face] * batch_size)
+            latency = round(1000 * (time.perf_counter() - started), 3)
+        return latency
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_ms": self.warmup_ms,
+            "weights_dir": os.path.join(os.getenv("DEEPFACE_HOME", os.path.expanduser("~")), ".deepface", "weights"),
+        }
+
+    @staticmethod
+    def preprocess(face):
+        """BGR face crop (any size) to a 48x48x1 float32 array in [0, 1]."""
+        gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY) if face.ndim == 3 else face
+        gray = cv2.resize(gray, (EMOTION_INPUT_SIZE, EMOTION_INPUT_SIZE), interpolation=cv2.INTER_AREA)
+        return (gray.astype(np.float32) / 255.0)[:, :, np.newaxis]
+
+    def predict(self, faces):
+        """
+        Classify face crops in one batch.
+
+        Parameters:
+            faces (list): BGR face crops.
+
+        Returns:
+            np.ndarray: (len(faces), len(labels)) probabilities in `labels` order.
+        """
+        if not faces:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+        batch = np.stack([self.preprocess(face) for face in faces])
+        return np.asarray(self.model.predict_on_batch(batch), dtype=np.float32)
@@ -0,0 +1,116 @@
+"""
+Detect-then-track face localisation with adaptive downscaling.
+
+Running the Haar cascade on every full-resolution frame dominates the per-frame
+cost on HD webcams. FaceTracker runs the full detection only every
+`detect_every` frames, or as soon as tracking confidence drops, and in between
+follows each face by normalised template matching in a small search window
+around its last position. Both detection and tracking work on a downscaled
+grayscale copy of the frame; the scale adapts so that a detection stays within
+`detect_budget_ms`. Boxes are always returned in full-resolution coordinates,
+so the emotion model still gets full-resolution face crops.
+"""
+import time
+
+import cv2
+
+# How far (relative to the face size) a face may move between two analyzed frames
+SEARCH_MARGIN = 0.5
+# Smallest face, in pixels of the downscaled image, the cascade looks for
+MIN_FACE_PIXELS = 24
+
+
+class FaceTracker:
+    def __init__(self, face_cascade, detect_every=10, min_confidence=0.6, detect_budget_ms=15.0,
+                 min_width=160, max_faces=5):
+        """
+        Parameters:
+            face_cascade (cv2.CascadeClassifier): Detector used for full detections.
+            detect_every (int): Frames between full detections; 1 disables tracking.
+            min_confidence (float): Template match score below which a face counts as lost.
+            detect_budget_ms (float): Target duration of one detection; drives the downscaling.
+            min_width (int): Smallest width the frame is downscaled to.
+            max_faces (int): Faces returned per frame, largest first.
+        """
+        self.face_cascade = face_cascade
+        self.detect_every = max(1, detect_every)
+        self.min_confidence = min_confidence
+        self.detect_budget = detect_budget_ms / 1000.0
+        self.min_width = min_width
+        self.max_faces = max_faces
+        self.scale = 1.0
+        self.detections = 0
+        self.tracked = 0
+        self._faces = []  # (box in downscaled coordinates, grayscale template)
+        self._since_detection = 0
+
+    def update(self, frame):
+        """
+        Locate the faces in the next frame.
+
+        Returns:
+            list: (x, y, w, h) boxes in frame coordinates, largest first.
+        """
+        small = frame
+        if self.scale < 1.0:
+            small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        boxes = None
+        if self._faces and self._since_detection < self.detect_every:
+            boxes = self._track(gray)
+        if boxes is None:
+            boxes = self._detect(gray, frame.shape[1])
+        self._since_detection += 1
+
+        inverse = 1.0 / self.scale
+        return [(int(x * inverse), int(y * inverse), int(w * inverse), int(h * inverse)) for x, y, w, h in boxes]
+
+    def _detect(self, gray, full_width):
+        started = time.perf_counter()
+        faces = self.face_cascade.detectMultiScale(gray, 1.1, 4, minSize=(MIN_FACE_PIXELS, MIN_FACE_PIXELS))
+        elapsed = time.perf_counter() - started
+        faces = sorted(faces, key=lambda face: face[2] * face[3], reverse=True)[:self.max_faces]
+        boxes = [(int(x), int(y), int(w), int(h)) for x, y, w, h in faces]
+        self._faces = [(box, gray[box[1]:box[1] + box[3], box[0]:box[0] + box[2]].copy()) for box in boxes]
+        self._since_detection = 0
+        self.detections += 1
+        boxes_scale = self.scale
+        self._adapt_scale(elapsed, full_width)
+        if self.scale != boxes_scale:
+            # Templates are only valid at the scale they were cut at
+            self._faces = []
+        return [tuple(int(v * self.scale / boxes_scale) for v in box) for box in boxes]
+
+    def _adapt_scale(self, elapsed, full_width):
+        """Shrink the working resolution when detection exceeds its budget, grow it when well below."""
+        min_scale = min(1.0, self.min_width / float(full_width))
+        if elapsed > self.detect_budget:
+            self.scale = max(min_scale, self.scale * 0.8)
+        elif elapsed < self.detect_budget / 2:
+            self.scale = min(1.0, self.scale * 1.1)
+
+    def _track(self, gray):
+        """Follow every face by template matching; None if any face was lost."""
+        height, width = gray.shape[:2]
+        tracked = []
+        for (x, y, w, h), template in self._faces:
+            margin_x, margin_y = int(w * SEARCH_MARGIN), int(h * SEARCH_MARGIN)
+            x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+            x1, y1 = min(width, x + w + margin_x), min(height, y + h + margin_y)
+            window = gray[y0:y1, x0:x1]
+            if window.shape[0] < h or window.shape[1] < w:
+                return None
+            scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, confidence, _, (dx, dy) = cv2.minMaxLoc(scores)
+            if confidence < self.min_confidence:
+                return None
+            box = (x0 + dx, y0 + dy, w, h)
+            # Refresh the template so slow appearance changes do not accumulate
+            tracked.append((box, gray[box[1]:box[1] + h, box[0]:box[0] + w].copy()))
+        self._faces = tracked
+        self.tracked += 1
+        return [box for box, _ in tracked]
+
+    def stats(self) -> dict:
+        return {"scale": round(self.scale, 3), "detections": self.detections, "tracked_frames": self.tracked}
@@ -0,0 +1,100 @@
+"""
+Push-based MJPEG fan-out for /video_feed.
+
+The capture thread publishes each processed frame; every connected client blocks
+on a condition variable until a newer frame exists. A frame is JPEG-encoded at
+most once, by whichever client asks for it first, and the bytes are shared by
+all clients. Slow clients simply pick up the newest frame when they are ready,
+skipping the ones they missed, so nothing queues up per client and encoding
+cost does not grow with the number of viewers. With no viewers nothing is encoded.
+
+An optional `render` callable turns a published item into the image to encode,
+so per-frame drawing (e.g. the emotion overlay) is also only paid for frames
+that are actually sent.
+"""
+import threading
+import time
+
+import cv2
+
+
+class FrameBroadcaster:
+    def __init__(self, jpeg_quality=80, render=None, timings=None):
+        """
+        Parameters:
+            jpeg_quality (int): JPEG quality of the stream.
+            render (callable, optional): Maps a published item to the BGR image to encode.
+            timings (StageTimings, optional): Receives "render" and "encode" durations.
+        """
+        self.jpeg_quality = jpeg_quality
+        self.render = render
+        self.timings = timings
+        self._condition = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._closed = False
+        self._subscribers = 0
+        # Encoded JPEG of frame number _encoded_seq
+        self._encode_lock = threading.Lock()
+        self._encoded_seq = 0
+        self._encoded = None
+
+    @property
+    def subscribers(self) -> int:
+        with self._condition:
+            return self._subscribers
+
+    def publish(self, frame) -> None:
+        """Make `frame` (or an item for `render`) the newest frame and wake up all clients. It must not be modified afterwards."""
+        with self._condition:
+            self._frame = frame
+            self._seq += 1
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        """End all client streams."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _jpeg(self, seq, frame):
+        with self._encode_lock:
+            # A newer frame may already be encoded; serve that instead of encoding an old one
+            if self._encoded_seq < seq:
+                started = time.perf_counter()
+                if self.render is not None:
+                    frame = self.render(frame)
+                rendered = time.perf_counter()
+                ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                if self.timings is not None:
+                    if self.render is not None:
+                        self.timings.record("render", rendered - started)
+                    self.timings.record("encode", time.perf_counter() - rendered)
+                if not ok:
+                    return None
+                self._encoded_seq, self._encoded = seq, buffer.tobytes()
+            return self._encoded
+
+    def stream(self, timeout=5.0):
+        """Generator of multipart MJPEG chunks for one client."""
+        with self._condition:
+            self._subscribers += 1
+        try:
+            last_seq = 0
+            while True:
+                with self._condition:
+                    while not self._closed and self._seq == last_seq:
+                        self._condition.wait(timeout)
+                    if self._closed:
+                        return
+                    seq, frame = self._seq, self._frame
+                last_seq = seq
+
+                frame_bytes = self._jpeg(seq, frame)
+                if frame_bytes is None:
+                    continue
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        finally:
+            with self._condition:
+                self._subscribers -= 1
@@ -0,0 +1,437 @@
+"""
+Shared-memory bus between the capture/inference engine and the HTTP workers.
+
+Under gunicorn (see gunicorn.conf.py) one engine process owns the frame source,
+the sessions and the model, and any number of stateless API worker processes
+serve HTTP. They exchange data only through `multiprocessing.shared_memory`
+segments created by the gunicorn master before it forks:
+
+    video     ring of JPEG-encoded, annotated local frames (engine -> workers)
+    emotions  ring of per-frame emotion rows of all sessions (engine -> workers)
+    inbox     ring of uploaded frames and session commands (workers -> engine)
+    status    health and stats JSON, rewritten about once a second (engine -> workers)
+
+Every ring slot is guarded by a sequence counter (a seqlock): the writer makes it
+odd while writing and even again afterwards, and a reader accepts a slot only
+if the counter was even and unchanged around its read. Readers therefore never
+block the writer and never see a torn slot; they read straight out of the
+shared segment, with no pickling or IPC round-trip.
+"""
+import json
+import os
+import time
+from multiprocessing import Lock, resource_tracker, shared_memory
+
+import numpy as np
+
+from emotion_buffer import EMOTION_LABELS, aggregate
+from frame_store import InferenceResult, NO_RESULT
+
+FRAME_BUS_NAME = os.getenv("FRAME_BUS_NAME", "deepface")
+# Segment sizes. Together they must fit in /dev/shm, which Docker limits to 64 MB unless the
+# container sets shm_size; touching a page beyond that limit kills the process with SIGBUS.
+# JPEG-encoded local frames for /video_feed
+VIDEO_SLOTS = int(os.getenv("FRAME_BUS_VIDEO_SLOTS", "4"))
+VIDEO_SLOT_BYTES = int(os.getenv("FRAME_BUS_VIDEO_SLOT_KB", "512")) * 1024
+# Decoded uploads (height x width x 3 bytes; a 640x480 frame is 900 KB)
+INBOX_SLOTS = int(os.getenv("FRAME_BUS_INBOX_SLOTS", "16"))
+INBOX_SLOT_BYTES = int(os.getenv("FRAME_BUS_INBOX_SLOT_KB", "1024")) * 1024
+# Emotion rows of all sessions (141 bytes each), about 100 s of 64 sessions at 5 fps
+EMOTION_ROWS = int(os.getenv("FRAME_BUS_EMOTION_ROWS", "32768"))
+STATUS_SLOT_BYTES = int(os.getenv("FRAME_BUS_STATUS_KB", "256")) * 1024
+SHM_DIR = "/dev/shm"
+# Attempts at reading a status the engine is rewriting before falling back to the previous one
+STATUS_READ_ATTEMPTS = 5
+# A viewer that polled the video ring within this many seconds keeps the engine encoding
+VIDEO_VIEWER_TIMEOUT = 2.0
+# Polling interval of readers waiting for new data; a poll only reads a version counter
+POLL_INTERVAL = 0.01
+# Rows compared per step when looking for a session's newest row, newest first
+NEWEST_SCAN_ROWS = 1024
+
+_bus = None
+
+
+def _open_segment(name, size=None):
+    """Create a segment of `size` bytes (replacing a stale one of the same name) or attach to it."""
+    if size is None:
+        segment = shared_memory.SharedMemory(name=name)
+        # Only the creator may unlink; stop this process's resource tracker from doing it at exit
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+    try:
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+    except FileNotFoundError:
+        pass
+    return shared_memory.SharedMemory(name=name, create=True, size=size)
+
+
+class SharedFrameRing:
+    """Ring of variable-length byte payloads, each tagged with a timestamp and a short string."""
+    CONTROL = np.dtype([("latest", "<u8"), ("reader_seen", "<f8"), ("slots", "<u4"), ("slot_bytes", "<u8")])
+    HEADER = np.dtype([("seq", "<u8"), ("version", "<u8"), ("timestamp", "<f8"), ("length", "<u8"),
+                       ("tag", "S64")])
+
+    def __init__(self, name, slots=None, slot_bytes=None, lock=None):
+        """
+        Parameters:
+            name (str): Shared memory segment name.
+            slots, slot_bytes (int, optional): Size of a new ring; omit both to attach to an existing one.
+            lock (multiprocessing.Lock, optional): Serializes writers if there is more than one.
+        """
+        create = slots is not None
+        size = None
+        if create:
+            size = self.CONTROL.itemsize + slots * (self.HEADER.itemsize + slot_bytes)
+        self.shm = _open_segment(name, size)
+        self.control = np.ndarray((1,), dtype=self.CONTROL, buffer=self.shm.buf)
+        if create:
+            self.control[0] = (0, 0.0, slots, slot_bytes)
+        self.slots = int(self.control["slots"][0])
+        self.slot_bytes = int(self.control["slot_bytes"][0])
+        self.headers = np.ndarray((self.slots,), dtype=self.HEADER, buffer=self.shm.buf,
+                                  offset=self.CONTROL.itemsize)
+        self.data = np.ndarray((self.slots, self.slot_bytes), dtype=np.uint8, buffer=self.shm.buf,
+                               offset=self.CONTROL.itemsize + self.slots * self.HEADER.itemsize)
+        if create:
+            self.headers[:] = np.zeros(self.slots, dtype=self.HEADER)
+        self.lock = lock
+
+    @property
+    def latest(self) -> int:
+        """Version of the newest payload; 0 if nothing was written."""
+        return int(self.control["latest"][0])
+
+    def write(self, payload, timestamp=None, tag=""):
+        """
+        Append a payload (bytes-like, at most slot_bytes).
+
+        Returns:
+            int: Its version.
+        """
+        if len(payload) > self.slot_bytes:
+            raise ValueError(f"Payload of {len(payload)} bytes exceeds the slot size of {self.slot_bytes}")
+        if self.lock is not None:
+            with self.lock:
+                return self._write(payload, timestamp, tag)
+        return self._write(payload, timestamp, tag)
+
+    def _write(self, payload, timestamp, tag):
+        version = self.latest + 1
+        slot = version % self.slots
+        headers = self.headers
+        headers["seq"][slot] += 1  # Odd: slot is being written
+        self.data[slot, :len(payload)] = np.frombuffer(payload, dtype=np.uint8)
+        headers["version"][slot] = version
+        headers["timestamp"][slot] = time.time() if timestamp is None else timestamp
+        headers["length"][slot] = len(payload)
+        headers["tag"][slot] = tag.encode()[:64]
+        headers["seq"][slot] += 1
+        self.control["latest"][0] = version
+        return version
+
+    def read(self, version):
+        """
+        The payload with this version, as (timestamp, tag, bytes), or None if it has been
+        overwritten or not written yet.
+        """
+        if version <= 0:
+            return None
+        slot = version % self.slots
+        headers = self.headers
+        for _ in range(3):
+            seq = int(headers["seq"][slot])
+            if seq % 2:
+                time.sleep(0)
+                continue
+            if int(headers["version"][slot]) != version:
+                return None
+            timestamp = float(headers["timestamp"][slot])
+            tag = headers["tag"][slot].decode()
+            payload = self.data[slot, :int(headers["length"][slot])].tobytes()
+            if int(headers["seq"][slot]) == seq:
+                return timestamp, tag, payload
+        return None
+
+    def mark_read(self):
+        """Record that a reader is interested in this ring (e.g. a /video_feed client is connected)."""
+        self.control["reader_seen"][0] = time.time()
+
+    def has_readers(self, timeout=VIDEO_VIEWER_TIMEOUT) -> bool:
+        return time.time() - float(self.control["reader_seen"][0]) < timeout
+
+    def stream(self, stopped=lambda: False):
+        """Generator of multipart MJPEG chunks, for a ring of JPEG payloads."""
+        version = 0
+        while not stopped():
+            self.mark_read()
+            latest = self.latest
+            if latest == version:
+                time.sleep(POLL_INTERVAL)
+                continue
+            item = self.read(latest)
+            version = latest
+            if item is None:
+                continue
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + item[2] + b'\r\n')
+
+    def close(self, unlink=False):
+        # Views into the buffer must be released before the segment can be closed
+        del self.control, self.headers, self.data
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SharedEmotionRing:
+    """Ring of per-frame emotion rows of all sessions; single writer."""
+    CONTROL = np.dtype([("total", "<u8"), ("capacity", "<u8")])
+    ROW = np.dtype([("seq", "<u8"), ("session", "S64"), ("timestamp", "<f8"), ("face", "?"),
+                    ("probabilities", "<f4", (len(EMOTION_LABELS),)), ("box", "<i4", (4,)), ("emotion", "S16")])
+
+    def __init__(self, name, capacity=None):
+        create = capacity is not None
+        size = self.CONTROL.itemsize + capacity * self.ROW.itemsize if create else None
+        self.shm = _open_segment(name, size)
+        self.control = np.ndarray((1,), dtype=self.CONTROL, buffer=self.shm.buf)
+        if create:
+            self.control[0] = (0, capacity)
+        self.capacity = int(self.control["capacity"][0])
+        self.rows = np.ndarray((self.capacity,), dtype=self.ROW, buffer=self.shm.buf, offset=self.CONTROL.itemsize)
+        if create:
+            self.rows[:] = np.zeros(self.capacity, dtype=self.ROW)
+            self.rows["timestamp"] = -np.inf
+        self.labels = EMOTION_LABELS
+
+    @property
+    def total(self) -> int:
+        """Number of rows ever appended."""
+        return int(self.control["total"][0])
+
+    def append(self, session_id, timestamp, probabilities=None, emotion="unknown", face_box=None):
+        """
+        Parameters:
+            probabilities (array, optional): Normalised vector in EMOTION_LABELS order; None if no face.
+        """
+        i = self.total % self.capacity
+        rows = self.rows
+        rows["seq"][i] += 1
+        rows["session"][i] = session_id.encode()[:64]
+        rows["timestamp"][i] = timestamp
+        rows["face"][i] = probabilities is not None
+        rows["probabilities"][i] = 0.0 if probabilities is None else probabilities
+        rows["box"][i] = face_box if face_box is not None else (-1, -1, -1, -1)
+        rows["emotion"][i] = emotion.encode()[:16]
+        rows["seq"][i] += 1
+        self.control["total"][0] += 1
+
+    def _select(self, session_id, start=-np.inf, end=np.inf):
+        """Consistent copy of the session's rows with a timestamp in [start, end]."""
+        rows = self.rows
+        # Filter on column views; only the matching rows are copied
+        timestamps = rows["timestamp"]
+        matches = np.nonzero((rows["session"] == session_id.encode()[:64]) & (rows["seq"] > 0)
+                             & (timestamps >= start) & (timestamps <= end))[0]
+        selected = rows[matches]
+        stable = (selected["seq"] % 2 == 0) & (rows["seq"][matches] == selected["seq"])
+        return selected[stable]
+
+    def query(self, session_id, start=None, end=None, method="mean", half_life=1.0, stale_after=2.0):
+        """Same result as EmotionRingBuffer.query, for one session."""
+        rows = self._select(session_id, -np.inf if start is None else start, np.inf if end is None else end)
+        result = aggregate(self.labels, rows["timestamp"], rows["probabilities"], rows["face"],
+                           start, end, method, half_life, stale_after)
+        # The staleness refers to the session's newest frame, inside the window or not
+        newest = self.newest(session_id)
+        result["latest_timestamp"] = None if newest is None else float(newest["timestamp"])
+        result["staleness"] = None if newest is None else max(0.0, time.time() - result["latest_timestamp"])
+        result["stale"] = result["staleness"] is None or result["staleness"] > stale_after
+        return result
+
+    def _newest_index(self, session_id):
+        """Slot of the session's newest row, scanning back from the newest row of the ring, or None."""
+        key = session_id.encode()[:64]
+        sessions = self.rows["session"]
+        end = self.total
+        oldest = max(0, end - self.capacity)
+        while end > oldest:
+            begin = max(oldest, end - NEWEST_SCAN_ROWS)
+            slots = np.arange(begin, end) % self.capacity
+            matches = np.nonzero(sessions[slots] == key)[0]
+            if len(matches):
+                return int(slots[matches[-1]])
+            end = begin
+        return None
+
+    def newest(self, session_id):
+        """The session's newest row, or None."""
+        key = session_id.encode()[:64]
+        for _ in range(3):
+            i = self._newest_index(session_id)
+            if i is None:
+                return None
+            seq = int(self.rows["seq"][i])
+            row = self.rows[i:i + 1].copy()[0]
+            # Retry if the slot was being written or has been reused meanwhile
+            if seq % 2 == 0 and int(self.rows["seq"][i]) == seq and row["session"] == key:
+                return row
+        return None
+
+    def close(self, unlink=False):
+        del self.control, self.rows
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class BusHistory:
+    """Read-only view of one session's rows, with EmotionRingBuffer's reading interface."""
+
+    def __init__(self, emotions, session_id):
+        self.emotions = emotions
+        self.session_id = session_id
+
+    def latest(self):
+        row = self.emotions.newest(self.session_id)
+        if row is None:
+            return None
+        probabilities = dict(zip(self.emotions.labels, row["probabilities"].tolist())) if row["face"] else None
+        return float(row["timestamp"]), probabilities
+
+    def query(self, start=None, end=None, method="mean", half_life=1.0, stale_after=2.0):
+        return self.emotions.query(self.session_id, start, end, method, half_life, stale_after)
+
+    def wait_for_update(self, after_version=0, timeout=None):
+        """Wait until the session has a row newer than `after_version` (its timestamp in microseconds)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        seen_total = None
+        while True:
+            # The session is only looked up when any row was appended since the last look
+            total = self.emotions.total
+            if total != seen_total:
+                seen_total = total
+                latest = self.latest()
+                if latest is not None and int(latest[0] * 1e6) > after_version:
+                    return int(latest[0] * 1e6), latest
+            if deadline is not None and time.monotonic() >= deadline:
+                return after_version, None
+            time.sleep(POLL_INTERVAL)
+
+
+class BusResults:
+    """Newest inference result of one session, with FrameStore's `result()` interface."""
+
+    def __init__(self, emotions, session_id):
+        self.emotions = emotions
+        self.session_id = session_id
+
+    def result(self):
+        row = self.emotions.newest(self.session_id)
+        if row is None:
+            return NO_RESULT
+        box = tuple(int(v) for v in row["box"])
+        emotion = row["emotion"].decode()
+        face_box = box if box[2] >= 0 else None
+        faces = ((face_box, emotion),) if face_box else ()
+        return InferenceResult(0, float(row["timestamp"]), emotion, face_box, faces)
+
+
+class BusSession:
+    """What an API worker knows about a session: its history and newest result."""
+
+    def __init__(self, emotions, session_id):
+        self.session_id = session_id
+        self.history = BusHistory(emotions, session_id)
+        self.frames = BusResults(emotions, session_id)
+
+
+class FrameBus:
+    def __init__(self, name=FRAME_BUS_NAME, create=False, video_slots=VIDEO_SLOTS, video_slot_bytes=VIDEO_SLOT_BYTES,
+                 emotion_rows=EMOTION_ROWS, inbox_slots=INBOX_SLOTS, inbox_slot_bytes=INBOX_SLOT_BYTES,
+                 status_slot_bytes=STATUS_SLOT_BYTES):
+        """
+        Create (in the gunicorn master) or attach to the bus segments named `<name>-video` etc.
+        Sizes only apply when creating.
+        """
+        self.name = name
+        self.created = create
+        if create:
+            _check_shm_space(
+                video_slots * (SharedFrameRing.HEADER.itemsize + video_slot_bytes)
+                + emotion_rows * SharedEmotionRing.ROW.itemsize
+                + inbox_slots * (SharedFrameRing.HEADER.itemsize + inbox_slot_bytes)
+                + 2 * (SharedFrameRing.HEADER.itemsize + status_slot_bytes)
+            )
+        self.inbox_lock = Lock() if create else None
+        self.video = SharedFrameRing(f"{name}-video", *((video_slots, video_slot_bytes) if create else (None, None)))
+        self.emotions = SharedEmotionRing(f"{name}-emotions", emotion_rows if create else None)
+        self.inbox = SharedFrameRing(f"{name}-inbox", *((inbox_slots, inbox_slot_bytes) if create else (None, None)),
+                                     lock=self.inbox_lock)
+        self.status_ring = SharedFrameRing(f"{name}-status", *((2, status_slot_bytes) if create else (None, None)))
+        self._status = None  # (version, timestamp, parsed status) of the last status read
+
+    def session(self, session_id):
+        return BusSession(self.emotions, session_id)
+
+    def publish_status(self, status) -> None:
+        self.status_ring.write(json.dumps(status).encode())
+
+    def status(self) -> dict:
+        """
+        The engine's latest status, with `engine_age_seconds`; empty if the engine never reported.
+        A status being rewritten while it is read is retried, and the previous one is returned if
+        the retries keep racing the engine, so health checks do not flap.
+        """
+        cached = self._status
+        for _ in range(STATUS_READ_ATTEMPTS):
+            version = self.status_ring.latest
+            if version == 0 or (cached is not None and cached[0] == version):
+                break
+            # Parsed once per status the engine publishes, not once per request
+            item = self.status_ring.read(version)
+            if item is not None:
+                timestamp, _, payload = item
+                cached = self._status = (version, timestamp, json.loads(payload))
+                break
+            time.sleep(0)
+        if cached is None:
+            return {}
+        _, timestamp, status = cached
+        return dict(status, engine_age_seconds=round(time.time() - timestamp, 3))
+
+    def close(self):
+        for ring in (self.video, self.emotions, self.inbox, self.status_ring):
+            ring.close(unlink=self.created)
+
+
+def _check_shm_space(size):
+    """Refuse to create segments that do not fit in /dev/shm, instead of crashing on first use."""
+    try:
+        stats = os.statvfs(SHM_DIR)
+    except OSError:
+        return  # Not Linux; shared memory is not backed by a size-limited tmpfs
+    available = stats.f_bavail * stats.f_frsize
+    if size > available:
+        raise RuntimeError(
+            f"The frame bus needs {size / 2 ** 20:.1f} MiB of shared memory but {SHM_DIR} has "
+            f"{available / 2 ** 20:.1f} MiB free; raise the container's shm_size or lower the FRAME_BUS_* sizes"
+        )
+
+
+def create(name=FRAME_BUS_NAME, **sizes):
+    """Create the bus; call in the gunicorn master before workers and the engine are forked."""
+    global _bus
+    _bus = FrameBus(name, create=True, **sizes)
+    return _bus
+
+
+def current():
+    """The bus of this process tree: inherited from the master, or attached by FRAME_BUS_NAME if
+    FRAME_BUS=true; None when the service runs as a single process."""
+    global _bus
+    if _bus is None and os.getenv("FRAME_BUS", "false").lower() == "true":
+        _bus = FrameBus(FRAME_BUS_NAME)
+    return _bus
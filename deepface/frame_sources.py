@@ -0,0 +1,183 @@
+"""
+Frame sources for the local capture loop.
+
+A source yields BGR frames from a camera, a video file, a directory of images or
+a synthetic generator, so the service (and its benchmark mode) can run on a
+headless machine without a camera. Recorded sources are replayed at their
+nominal frame rate times a speed factor; speed 0 replays as fast as possible.
+
+Sources are selected with a spec string (FRAME_SOURCE):
+
+    camera[:index]          e.g. camera:0 (default)
+    video:<path>            any file OpenCV can decode
+    images:<directory>      .jpg/.jpeg/.png/.bmp files in name order
+    synthetic[:WxH]         generated frames with a moving face-like shape
+    none                    no local frames (uploaded sessions only)
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameSource:
+    """Base class: `read()` returns the next BGR frame, or None when the source is exhausted."""
+    name = "source"
+    fps = 30.0  # Nominal frame rate used for paced replay
+    live = False  # Live sources are paced by the device, never by replay speed
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    live = True
+
+    def __init__(self, index=0):
+        self.name = f"camera:{index}"
+        self.capture = cv2.VideoCapture(index)
+        if not self.capture.isOpened():
+            raise IOError(f"Cannot open camera {index}")
+
+    def read(self):
+        ret, frame = self.capture.read()
+        return frame if ret else None
+
+    def close(self):
+        self.capture.release()
+
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path, loop=False):
+        self.name = f"video:{path}"
+        self.path = path
+        self.loop = loop
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError(f"Cannot open video file {path}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+    def read(self):
+        ret, frame = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        return frame if ret else None
+
+    def close(self):
+        self.capture.release()
+
+
+class ImageDirectorySource(FrameSource):
+    def __init__(self, directory, loop=False, fps=30.0):
+        self.name = f"images:{directory}"
+        self.paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.paths:
+            raise IOError(f"No images found in {directory}")
+        self.loop = loop
+        self.fps = fps
+        self._next = 0
+
+    def read(self):
+        while True:
+            if self._next >= len(self.paths):
+                if not self.loop:
+                    return None
+                self._next = 0
+            path = self.paths[self._next]
+            self._next += 1
+            frame = cv2.imread(path, cv2.IMREAD_COLOR)
+            if frame is not None:
+                return frame
+
+
+class SyntheticSource(FrameSource):
+    def __init__(self, width=640, height=480, frames=None, fps=30.0):
+        """
+        Parameters:
+            frames (int, optional): Number of frames to generate; unlimited by default.
+        """
+        self.name = f"synthetic:{width}x{height}"
+        self.width = width
+        self.height = height
+        self.frames = frames
+        self.fps = fps
+        self._count = 0
+
+    def read(self):
+        if self.frames is not None and self._count >= self.frames:
+            return None
+        t = self._count / self.fps
+        self._count += 1
+        frame = np.full((self.height, self.width, 3), 90, dtype=np.uint8)
+        # A face-like shape drifting across the frame
+        cx = int(self.width / 2 + self.width / 4 * np.sin(t))
+        cy = self.height // 2
+        r = self.height // 5
+        cv2.ellipse(frame, (cx, cy), (r, int(r * 1.25)), 0, 0, 360, (150, 180, 210), -1)
+        for dx in (-r // 3, r // 3):
+            cv2.circle(frame, (cx + dx, cy - r // 4), r // 8, (40, 40, 40), -1)
+        cv2.ellipse(frame, (cx, cy + r // 2), (r // 3, r // 8), 0, 0, 180, (60, 60, 120), 3)
+        return frame
+
+
+class PacedSource(FrameSource):
+    """Replays a recorded source at `speed` times its nominal frame rate; speed 0 means unpaced."""
+
+    def __init__(self, source, speed=1.0):
+        self.source = source
+        self.name = source.name
+        self.fps = source.fps
+        self.live = source.live
+        self.interval = 0.0 if speed <= 0 or source.live else 1.0 / (source.fps * speed)
+        self._next_at = None
+
+    def read(self):
+        if self.interval:
+            now = time.monotonic()
+            if self._next_at is None:
+                self._next_at = now
+            elif now < self._next_at:
+                time.sleep(self._next_at - now)
+            # Keep to the schedule, but do not try to catch up after a stall
+            self._next_at = max(self._next_at + self.interval, time.monotonic())
+        return self.source.read()
+
+    def close(self):
+        self.source.close()
+
+
+def open_source(spec="camera:0", speed=1.0, loop=False):
+    """
+    Open a frame source from a spec string (see module docstring).
+
+    Returns:
+        FrameSource or None: The paced source, or None for "none".
+
+    Raises:
+        IOError: If the source cannot be opened.
+        ValueError: If the spec is not recognized.
+    """
+    kind, _, argument = spec.partition(":")
+    kind = kind.strip().lower()
+    if kind == "none":
+        return None
+    if kind == "camera":
+        source = CameraSource(int(argument or 0))
+    elif kind == "video":
+        source = VideoFileSource(argument, loop=loop)
+    elif kind == "images":
+        source = ImageDirectorySource(argument, loop=loop)
+    elif kind == "synthetic":
+        width, _, height = (argument or "640x480").partition("x")
+        source = SyntheticSource(int(width), int(height))
+    else:
+        raise ValueError(f"Unknown frame source: {spec}")
+    return PacedSource(source, speed)
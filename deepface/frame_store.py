@@ -0,0 +1,147 @@
+"""
+Shared frame state of the capture, inference and streaming threads.
+
+FrameStore has two slots, the newest captured frame and the newest inference
+result, and each slot only ever holds an immutable snapshot. Writers build a new
+snapshot and publish it by swapping a single reference, so a reader always gets
+a consistent (version, timestamp, frame) or (emotion, face box) pair without
+taking a lock, and nothing has to be copied defensively: published frames are
+marked read-only and are never written to again. Each snapshot carries a version
+number so consumers can wait for, or skip to, the newest one.
+
+StageTimings collects per-stage latency counters (capture, detect, analyze, ...),
+including percentiles over the most recent measurements.
+"""
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+FrameSnapshot = namedtuple("FrameSnapshot", ["version", "timestamp", "frame"])
+# `frame_version` is the version of the frame the result was computed on. `emotion` and `face_box`
+# belong to the largest face; `faces` holds a (face_box, emotion) pair for every analyzed face.
+InferenceResult = namedtuple("InferenceResult", ["frame_version", "timestamp", "emotion", "face_box", "faces"])
+
+NO_RESULT = InferenceResult(frame_version=0, timestamp=None, emotion="unknown", face_box=None, faces=())
+
+
+class FrameStore:
+    def __init__(self):
+        self._frame = None
+        self._result = NO_RESULT
+        self._version = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def frame(self):
+        """Newest FrameSnapshot, or None before the first frame."""
+        return self._frame
+
+    def result(self):
+        """Newest InferenceResult."""
+        return self._result
+
+    def publish_frame(self, frame, timestamp=None):
+        """
+        Make `frame` the newest frame. The array is marked read-only; the caller must not reuse it.
+
+        Returns:
+            FrameSnapshot: The published snapshot.
+        """
+        frame.flags.writeable = False
+        with self._condition:
+            self._version += 1
+            snapshot = FrameSnapshot(self._version, time.time() if timestamp is None else timestamp, frame)
+            self._frame = snapshot
+            self._condition.notify_all()
+        return snapshot
+
+    def publish_result(self, frame_version, timestamp, emotion, face_box=None, faces=()):
+        """Replace the newest inference result."""
+        self._result = InferenceResult(frame_version, timestamp, emotion, face_box, tuple(faces))
+
+    def wait_for_frame(self, after_version=0, timeout=None):
+        """
+        Block until a frame newer than `after_version` is published.
+
+        Returns:
+            FrameSnapshot or None: The newest frame (intermediate ones are skipped), or None on
+                timeout or when the store is closed.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._closed or self._version > after_version, timeout)
+            if self._closed or self._version <= after_version:
+                return None
+            return self._frame
+
+    def close(self) -> None:
+        """Wake up all waiting consumers; no more frames will be published."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class StageTimings:
+    def __init__(self, window=2048):
+        """
+        Parameters:
+            window (int): Number of most recent measurements per stage used for percentiles.
+        """
+        self.window = window
+        self._stages = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds) -> None:
+        """Add one measurement of `stage`."""
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+                self._samples[stage] = deque(maxlen=self.window)
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["last"] = seconds
+            self._samples[stage].append(seconds)
+
+    def time(self, stage):
+        """Context manager that records the duration of its block as `stage`."""
+        return _StageTimer(self, stage)
+
+    def snapshot(self) -> dict:
+        """Count, mean, max, last and recent p50/p95/p99 duration (ms) of every stage."""
+        with self._lock:
+            stages = {stage: (dict(stats), np.array(self._samples[stage])) for stage, stats in self._stages.items()}
+        snapshot = {}
+        for stage, (stats, samples) in stages.items():
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            snapshot[stage] = {
+                "count": stats["count"],
+                "mean_ms": round(1000 * stats["total"] / stats["count"], 3),
+                "max_ms": round(1000 * stats["max"], 3),
+                "last_ms": round(1000 * stats["last"], 3),
+                "p50_ms": round(1000 * float(p50), 3),
+                "p95_ms": round(1000 * float(p95), 3),
+                "p99_ms": round(1000 * float(p99), 3),
+            }
+        return snapshot
+
+
+class _StageTimer:
+    def __init__(self, timings, stage):
+        self.timings = timings
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.record(self.stage, time.perf_counter() - self.started)
+        return False
@@ -0,0 +1,45 @@
+"""
+gunicorn configuration: one engine process plus N stateless API workers.
+
+The master creates the shared-memory frame bus (frame_bus.py) and starts the
+engine process, which owns the frame source, the sessions and the emotion model.
+The API workers forked afterwards inherit the bus and serve every endpoint from
+it, so HTTP serving scales across cores independently of inference.
+
+    gunicorn -c gunicorn.conf.py app:app
+"""
+import multiprocessing
+import os
+
+import frame_bus
+
+bind = os.getenv("BIND", "0.0.0.0:5005")
+workers = int(os.getenv("API_WORKERS", str(min(4, multiprocessing.cpu_count()))))
+# SSE and MJPEG clients hold a thread each for as long as they are connected
+worker_class = "gthread"
+threads = int(os.getenv("API_THREADS", "16"))
+
+engine = None
+
+
+def run_engine():
+    # Imported only in the engine process: TensorFlow and the frame source live here
+    import app
+    app.run_engine()
+
+
+def on_starting(server):
+    global engine
+    frame_bus.create()
+    engine = multiprocessing.Process(target=run_engine, name="deepface-engine", daemon=True)
+    engine.start()
+    server.log.info(f"Started deepface engine (pid {engine.pid})")
+
+
+def on_exit(server):
+    if engine is not None and engine.is_alive():
+        engine.terminate()
+        engine.join(5)
+    bus = frame_bus.current()
+    if bus is not None:
+        bus.close()
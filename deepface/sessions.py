@@ -0,0 +1,185 @@
+"""
+Per-session facial emotion state for many concurrent users.
+
+Each browser session uploads (downscaled) frames tagged with its session ID. A
+Session keeps its own newest frame and inference result (a FrameStore) and its
+own emotion history, so sessions never see each other's emotions. The local
+camera is just another session, LOCAL_SESSION.
+
+The inference worker asks SessionRegistry.next_job() for work. Sessions are
+visited round-robin and each may have at most one frame analyzed per
+1 / inference_fps seconds, so a busy session cannot starve the others; frames
+uploaded in between simply replace the pending one. Uploads themselves are
+limited per session by a token bucket. Idle sessions expire.
+"""
+import threading
+import time
+from collections import deque
+
+from emotion_buffer import EmotionRingBuffer
+from frame_store import FrameStore
+
+LOCAL_SESSION = "local"
+
+
+class SessionLimitError(Exception):
+    """Raised when a new session would exceed the maximum number of sessions."""
+
+
+class Session:
+    def __init__(self, session_id, buffer_size=1024, inference_fps=5.0, upload_fps=10.0):
+        """
+        Parameters:
+            session_id (str): Client chosen session identifier.
+            buffer_size (int): Analyzed frames kept for window queries.
+            inference_fps (float): Maximum analyzed frames per second for this session.
+            upload_fps (float): Sustained uploads per second accepted from this session.
+        """
+        self.session_id = session_id
+        self.frames = FrameStore()
+        self.history = EmotionRingBuffer(capacity=buffer_size)
+        self.inference_interval = 1.0 / inference_fps
+        self.upload_fps = upload_fps
+        self.analyzed_version = 0  # Version of the newest frame handed to inference
+        self.analyzed_frames = 0
+        self.tracker = None  # FaceTracker, created by the inference worker
+        self.next_inference_at = 0.0  # Monotonic time before which no frame is analyzed
+        self.last_seen = time.monotonic()
+        self.uploads = 0
+        self.rejected_uploads = 0
+        self._tokens = upload_fps
+        self._tokens_at = time.monotonic()
+
+    def take_upload_token(self, now) -> bool:
+        """Token bucket with a burst of one second's worth of uploads."""
+        self._tokens = min(self.upload_fps, self._tokens + (now - self._tokens_at) * self.upload_fps)
+        self._tokens_at = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+    def stats(self) -> dict:
+        snapshot = self.frames.frame()
+        return {
+            "frame_version": snapshot.version if snapshot else 0,
+            "analyzed_version": self.analyzed_version,
+            "analyzed_frames": self.analyzed_frames,
+            # Frames replaced by a newer one before inference got to them
+            "dropped_frames": max(0, (snapshot.version if snapshot else 0) - self.analyzed_frames
+                                  - (1 if snapshot and snapshot.version > self.analyzed_version else 0)),
+            "emotion": self.frames.result().emotion,
+            "uploads": self.uploads,
+            "rejected_uploads": self.rejected_uploads,
+            "idle_seconds": round(time.monotonic() - self.last_seen, 1),
+            "tracker": None if self.tracker is None else self.tracker.stats(),
+        }
+
+
+class SessionRegistry:
+    def __init__(self, max_sessions=64, session_ttl=300.0, buffer_size=1024, inference_fps=5.0, upload_fps=10.0):
+        """
+        Parameters:
+            max_sessions (int): Maximum number of concurrent sessions, LOCAL_SESSION included.
+            session_ttl (float): Seconds without uploads after which a session is dropped.
+            buffer_size, inference_fps, upload_fps: Settings of every new Session.
+        """
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.session_settings = {"buffer_size": buffer_size, "inference_fps": inference_fps,
+                                 "upload_fps": upload_fps}
+        self._sessions = {}
+        self._order = deque()  # Round-robin order of session IDs
+        self._condition = threading.Condition()
+        self._next_expiry_check = 0.0
+
+    def get(self, session_id):
+        """The Session with this ID, or None."""
+        return self._sessions.get(session_id)
+
+    def get_or_create(self, session_id):
+        with self._condition:
+            session = self._sessions.get(session_id)
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    raise SessionLimitError(f"At most {self.max_sessions} sessions are supported")
+                session = Session(session_id, **self.session_settings)
+                self._sessions[session_id] = session
+                self._order.append(session_id)
+            return session
+
+    def remove(self, session_id) -> bool:
+        with self._condition:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._order.remove(session_id)
+        session.frames.close()
+        return True
+
+    def submit(self, session_id, frame, timestamp=None, rate_limited=True):
+        """
+        Publish a new frame of a session and wake up the inference worker.
+
+        Returns:
+            Session or None: The session, or None if the upload exceeded its rate limit.
+
+        Raises:
+            SessionLimitError: If the session is new and the registry is full.
+        """
+        session = self.get_or_create(session_id)
+        now = time.monotonic()
+        with self._condition:
+            session.last_seen = now
+            if rate_limited and not session.take_upload_token(now):
+                session.rejected_uploads += 1
+                return None
+            session.uploads += 1
+        session.frames.publish_frame(frame, timestamp)
+        with self._condition:
+            self._condition.notify_all()
+        return session
+
+    def next_job(self, timeout=None):
+        """
+        Wait for the next frame to analyze, visiting sessions round-robin within their rate limits.
+
+        Returns:
+            tuple or None: (Session, FrameSnapshot), or None on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if now >= self._next_expiry_check:
+                    self._expire_locked(now)
+                wake_at = deadline
+                for _ in range(len(self._order)):
+                    session = self._sessions[self._order[0]]
+                    self._order.rotate(-1)
+                    snapshot = session.frames.frame()
+                    if snapshot is None or snapshot.version <= session.analyzed_version:
+                        continue
+                    if now < session.next_inference_at:
+                        wake_at = session.next_inference_at if wake_at is None else min(wake_at, session.next_inference_at)
+                        continue
+                    session.analyzed_version = snapshot.version
+                    session.analyzed_frames += 1
+                    session.next_inference_at = now + session.inference_interval
+                    return session, snapshot
+                if deadline is not None and now >= deadline:
+                    return None
+                self._condition.wait(None if wake_at is None else max(0.0, wake_at - now))
+
+    def _expire_locked(self, now):
+        self._next_expiry_check = now + min(self.session_ttl, 10.0)
+        expired = [session_id for session_id, session in self._sessions.items()
+                   if session_id != LOCAL_SESSION and now - session.last_seen > self.session_ttl]
+        for session_id in expired:
+            self._order.remove(session_id)
+            self._sessions.pop(session_id).frames.close()
+
+    def stats(self) -> dict:
+        with self._condition:
+            sessions = list(self._sessions.values())
+        return {session.session_id: session.stats() for session in sessions}
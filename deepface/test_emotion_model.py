@@ -0,0 +1,89 @@
+"""
+Tests of EmotionModel against a stand-in for the pinned deepface package.
+
+The stand-in's build_model has deepface 0.0.93's signature and lookup, so a call
+that only works with other deepface versions fails here instead of at startup.
+
+    pytest test_emotion_model.py
+"""
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from emotion_buffer import EMOTION_LABELS
+from emotion_model import EmotionModel
+
+
+class FakeKerasModel:
+    def __init__(self):
+        self.batches = []
+
+    def predict_on_batch(self, batch):
+        self.batches.append(batch)
+        return np.full((len(batch), len(EMOTION_LABELS)), 1.0 / len(EMOTION_LABELS), dtype=np.float32)
+
+
+class FakeEmotionClient:
+    def __init__(self):
+        self.model = FakeKerasModel()
+
+
+# deepface 0.0.93 modules/modeling.py: models available per task
+AVAILABLE_MODELS = {
+    "facial_recognition": {"VGG-Face": object, "Facenet": object, "ArcFace": object},
+    "facial_attribute": {"Emotion": FakeEmotionClient, "Age": object, "Gender": object, "Race": object},
+    "face_detector": {"opencv": object},
+}
+
+
+def build_model(model_name, task="facial_recognition"):
+    """deepface 0.0.93 DeepFace.build_model."""
+    if task not in AVAILABLE_MODELS:
+        raise ValueError(f"unimplemented task - {task}")
+    model = AVAILABLE_MODELS[task].get(model_name)
+    if model is None:
+        raise ValueError(f"Invalid model_name passed - {task}/{model_name}")
+    return model()
+
+
+@pytest.fixture
+def fake_deepface(monkeypatch):
+    package = types.ModuleType("deepface")
+    module = types.ModuleType("deepface.DeepFace")
+    module.build_model = build_model
+    package.DeepFace = module
+    monkeypatch.setitem(sys.modules, "deepface", package)
+    monkeypatch.setitem(sys.modules, "deepface.DeepFace", module)
+    return module
+
+
+def test_load_builds_the_facial_attribute_emotion_model(fake_deepface):
+    model = EmotionModel()
+    assert model.load(warmup_batch_size=2), model.error
+    assert model.ready
+    assert model.status()["state"] == "ready"
+    assert isinstance(model.model, FakeKerasModel)
+    # Warm-up passes ran on batches of the requested size
+    assert [len(batch) for batch in model.model.batches] == [2, 2, 2]
+
+
+def test_load_reports_failure(fake_deepface, monkeypatch):
+    def broken(model_name, task="facial_recognition"):
+        raise ValueError("weights download failed")
+
+    monkeypatch.setattr(fake_deepface, "build_model", broken)
+    model = EmotionModel()
+    assert not model.load()
+    assert model.status() == {**model.status(), "state": "failed", "error": "weights download failed"}
+
+
+def test_predict_classifies_a_batch_of_crops(fake_deepface):
+    model = EmotionModel()
+    assert model.load()
+    faces = [np.zeros((120, 80, 3), dtype=np.uint8), np.zeros((48, 48), dtype=np.uint8)]
+    probabilities = model.predict(faces)
+    assert probabilities.shape == (2, len(EMOTION_LABELS))
+    assert model.model.batches[-1].shape == (2, 48, 48, 1)
+    assert model.predict([]).shape == (0, len(EMOTION_LABELS))